@@ -0,0 +1,103 @@
+import argparse
+import logging
+import threading
+import time
+from database.database import Session
+from database.aggregates import refresh_aggregates
+from database.task_queue import claim, complete, fail, worker_name, LeaseKeeper
+from crawler.engine import DetailStore
+from job_analytics import dimensions, crawl_group, TASK_CRAWL, TASK_VERIFY
+from verify_vacancies import drain_queue, verification_engine
+
+# Исполнитель задач очереди crawl_tasks. Задачи ставит планировщик:
+#     python job_analytics.py --schedule
+# Исполнители запускаются на любом числе узлов, задачи между ними распределяет база:
+#     python crawl_worker.py --threads 4 --exit-when-idle
+
+POLL_INTERVAL = 10  # Секунд между опросами пустой очереди
+
+
+class RunDetails:
+    """DetailStore на день сбора: задачи одного запуска планировщика делят учет деталей.
+
+    День берется из ключа задачи crawl:<дата>:<id запроса>. С задачей нового дня учет прошлого
+    запуска отбрасывается, поэтому долго работающий исполнитель не копит id за все дни.
+    """
+
+    def __init__(self):
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def get(self, task):
+        run_date = task['task_key'].split(':')[1]
+        with self._lock:
+            if run_date not in self._stores:
+                self.log_summary()
+                self._stores = {run_date: DetailStore()}
+            return self._stores[run_date]
+
+    def log_summary(self):
+        for run_date, details in self._stores.items():
+            logging.info(f"{run_date}: {details.summary()}")
+
+
+def run_task(task, details, engine):
+    if task['kind'] == TASK_CRAWL:
+        crawl_group(task['payload']['query_ids'], details.get(task))
+    elif task['kind'] == TASK_VERIFY:
+        with Session() as session:
+            report = drain_queue(session, engine, limit=task['payload']['limit'])
+            refresh_aggregates(session, report['search_query_ids'])
+    else:
+        raise ValueError(f"Unknown task kind '{task['kind']}'")
+
+
+def work(kinds, exit_when_idle, details, engine):
+    """Цикл исполнителя: аренда задачи, выполнение с продлением аренды, отметка результата."""
+    worker = worker_name()
+    while True:
+        with Session() as session:
+            tasks = claim(session, worker, kinds)
+        if not tasks:
+            if exit_when_idle:
+                return
+            time.sleep(POLL_INTERVAL)
+            continue
+        task = tasks[0]
+        logging.info(f"Task {task['id']} ({task['kind']}, attempt {task['attempts']}) claimed by {worker}")
+        try:
+            with LeaseKeeper(Session, task['id'], worker) as lease:
+                run_task(task, details, engine)
+        except Exception as e:
+            logging.error(f"Task {task['id']} failed: {str(e)}")
+            with Session() as session:
+                fail(session, task['id'], worker, e)
+            continue
+        with Session() as session:
+            if lease.lost or not complete(session, task['id'], worker):
+                logging.warning(f"Task {task['id']} finished after its lease was taken over by another worker")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Исполнитель задач сбора вакансий из очереди crawl_tasks')
+    parser.add_argument('--threads', type=int, default=1, help='число исполнителей в процессе')
+    parser.add_argument('--kinds', nargs='+', choices=[TASK_CRAWL, TASK_VERIFY], help='виды задач, по умолчанию все')
+    parser.add_argument('--exit-when-idle', action='store_true', help='завершиться, когда очередь опустеет')
+    args = parser.parse_args()
+
+    with Session() as session:
+        dimensions.load(session)
+    # Детали вакансий за день сбора и квота проверок общие для всех исполнителей процесса
+    details = RunDetails()
+    engine = verification_engine()
+    threads = [threading.Thread(target=work, args=(args.kinds, args.exit_when_idle, details, engine),
+                                name=f'worker-{index}') for index in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    details.log_summary()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import httpx
+from crawler.governor import RequestGovernor, parse_retry_after
+from crawler.partition import PartitionPlanner, HH_RESULT_CAP
+from crawler.rate_limiter import TokenBucket
+
+HH_API_URL = os.getenv('HH_API_URL', 'https://api.hh.ru')
+HH_USER_AGENT = os.getenv('HH_USER_AGENT', 'job_analytics/1.0')
+# HH не раскрывает точную квоту для анонимных запросов, но при частоте выше ~7 запросов в секунду
+# начинает отвечать 429 и капчей. Значения по умолчанию держатся ниже этого порога.
+HH_RATE_LIMIT = float(os.getenv('HH_RATE_LIMIT', '5'))  # Запросов в секунду
+HH_RATE_BURST = int(os.getenv('HH_RATE_BURST', '10'))  # Допустимый всплеск запросов
+HH_MAX_CONCURRENCY = int(os.getenv('HH_MAX_CONCURRENCY', '10'))  # Одновременных соединений
+
+
+def employer_ids_of(vacancies):
+    """Id работодателей вакансий из поиска строками, вакансии без работодателя пропускаются."""
+    return [str(v['employer']['id']) for v in vacancies if (v.get('employer') or {}).get('id')]
+
+
+class CrawlStats:
+    """Счетчики пропускной способности одного прогона."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.vacancies = 0
+
+    @property
+    def elapsed(self):
+        return max(time.monotonic() - self.started, 1e-6)
+
+    @property
+    def requests_per_sec(self):
+        return self.requests / self.elapsed
+
+    @property
+    def vacancies_per_sec(self):
+        return self.vacancies / self.elapsed
+
+    def summary(self):
+        return (f"Запросов к API: {self.requests} ({self.requests_per_sec:.2f} req/s), "
+                f"вакансий: {self.vacancies} ({self.vacancies_per_sec:.2f} vac/s), "
+                f"ошибок: {self.errors}, время: {self.elapsed:.1f} с")
+
+
+class CrawlEngine:
+    """Асинхронный сбор страниц поиска и детальной информации о вакансиях и работодателях.
+
+    Все запросы проходят через общий RequestGovernor, поэтому параллельность ограничена
+    не только семафором соединений, но и квотой HH, а ответы 429/503 замедляют весь сбор.
+    """
+
+    def __init__(self, base_url=HH_API_URL, governor=None, concurrency=HH_MAX_CONCURRENCY, timeout=30, cache=None):
+        self.base_url = base_url
+        self.cache = cache  # HttpCache для vacancies/{id} и employers/{id}
+        self.governor = governor or RequestGovernor(TokenBucket(HH_RATE_LIMIT, HH_RATE_BURST))
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.stats = CrawlStats()
+        self.pages = 0  # Число страниц в последней полученной выдаче по всем срезам
+        self.truncated = False  # Инкрементальная выдача уперлась в лимит HH
+
+    def _client(self):
+        return httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout,
+                                 headers={'User-Agent': HH_USER_AGENT, 'HH-User-Agent': HH_USER_AGENT})
+
+    async def _get(self, client, semaphore, path, params=None, max_age=None):
+        """GET-запрос через регулятор с повторами и дисковым кэшем деталей. Для 404 возвращает None.
+
+        max_age переопределяет TTL кэша: при max_age=0 запись кэша всегда ревалидируется.
+        """
+        entry = None
+        if self.cache is not None and params is None and self.cache.is_cacheable(path):
+            entry, fresh = self.cache.lookup(path, max_age)
+            if fresh:
+                self.cache.hits += 1
+                return entry['payload']
+
+        headers = self.cache.validators(entry) if entry else None
+
+        async def send():
+            async with semaphore:
+                response = await client.get(path, params=params, headers=headers)
+            self.stats.requests += 1
+            return response.status_code, parse_retry_after(response.headers.get('Retry-After')), response
+
+        response = await self.governor.call_async(send)
+        if response.status_code == 404:
+            return None
+        if response.status_code != 304:
+            response.raise_for_status()
+        if self.cache is not None and params is None and self.cache.is_cacheable(path):
+            payload = response.json() if response.status_code == 200 else None
+            return self.cache.resolve(path, entry, response.status_code, payload, response.headers)
+        return response.json()
+
+    async def _list_slice(self, client, semaphore, index, params, add_page, skip_pages, key):
+        first_page = params.get('page', 0)
+        first = await self._get(client, semaphore, 'vacancies', params={**params, 'page': first_page}) or {}
+        self.pages += first.get('pages', 0)
+        add_page(index, first_page, first.get('items', []))
+
+        async def fetch_page(page):
+            response = await self._get(client, semaphore, 'vacancies', params={**params, 'page': page}) or {}
+            add_page(index, page, response.get('items', []))
+
+        await asyncio.gather(*(fetch_page(page) for page in range(first_page + 1, first.get('pages', 0))
+                               if key(index, page) not in skip_pages))
+
+    async def _list_vacancies(self, partitions, on_page, keep_items, skip_pages, key):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pages = {}
+        self.pages = 0
+
+        def add_page(index, page, items):
+            if key(index, page) in skip_pages:
+                return
+            self.stats.vacancies += len(items)
+            if on_page:
+                on_page(key(index, page), items)
+            if keep_items:
+                pages[index, page] = items
+
+        async with self._client() as client:
+            await asyncio.gather(*(self._list_slice(client, semaphore, index, params, add_page, skip_pages, key)
+                                   for index, params in enumerate(partitions)))
+
+        # Срезы могут пересекаться на границах, вакансии объединяются по external id
+        items = {}
+        for index_page in sorted(pages):
+            for item in pages[index_page]:
+                items.setdefault(item['id'], item)
+        return list(items.values())
+
+    async def _list_new_vacancies(self, params, known_ids, on_page):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        items = {}
+        page = params.get('page', 0)
+        self.truncated = False
+        async with self._client() as client:
+            while True:
+                response = await self._get(client, semaphore, 'vacancies', params={**params, 'page': page}) or {}
+                page_items = response.get('items', [])
+                self.pages = response.get('pages', 0)
+                self.stats.vacancies += len(page_items)
+                if on_page:
+                    on_page(page, page_items)
+                for item in page_items:
+                    items.setdefault(item['id'], item)
+                # Выдача отсортирована от новых к старым: страница из одних известных вакансий — граница новых
+                if not page_items or all(item['id'] in known_ids for item in page_items):
+                    break
+                if page + 1 >= self.pages:
+                    # Последняя доступная страница: новых вакансий больше, чем HH отдает на один запрос
+                    self.truncated = response.get('found', 0) > HH_RESULT_CAP
+                    break
+                page += 1
+        return list(items.values())
+
+    async def _plan_partitions(self, params):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._client() as client:
+            planner = PartitionPlanner(lambda path, slice_params: self._get(client, semaphore, path,
+                                                                            params=slice_params))
+            partitions = await planner.plan(params)
+        logging.info(f"Search query split into {len(partitions)} slices with {planner.probes} probe requests, "
+                     f"{len(planner.truncated)} slices exceed the {planner.cap} results cap")
+        return partitions
+
+    async def _fetch_many(self, client, semaphore, prefix, ids, max_age=None):
+        """Параллельные запросы {prefix}/{id}: (ответы по id, id с ответом 404, id с ошибкой запроса)."""
+        results = await asyncio.gather(*(self._get(client, semaphore, f'{prefix}/{item_id}', max_age=max_age)
+                                         for item_id in ids), return_exceptions=True)
+        payloads, not_found, failed = {}, [], []
+        for item_id, result in zip(ids, results):
+            if isinstance(result, Exception):
+                self.stats.errors += 1
+                failed.append(item_id)
+                logging.error(f"Error fetching {prefix}/{item_id}: {str(result)}")
+            elif result is None:
+                not_found.append(item_id)
+            else:
+                payloads[item_id] = result
+        return payloads, not_found, failed
+
+    async def _fetch_details(self, vacancy_ids, employer_ids):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._client() as client:
+            (vacancy_details, _, _), (employer_details, _, _) = await asyncio.gather(
+                self._fetch_many(client, semaphore, 'vacancies', vacancy_ids),
+                self._fetch_many(client, semaphore, 'employers', employer_ids),
+            )
+        return vacancy_details, employer_details
+
+    async def _revalidate(self, prefix, ids):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._client() as client:
+            return await self._fetch_many(client, semaphore, prefix, list(dict.fromkeys(ids)), max_age=0)
+
+    def list_vacancies(self, params, on_page=None, keep_items=True, skip_pages=()):
+        """Получение всех страниц поиска. Страницы после первой запрашиваются параллельно.
+
+        on_page(page, items) вызывается по мере получения страниц. При keep_items=False страницы
+        не накапливаются в памяти и возвращается пустой список: результат получает только on_page.
+        Страницы из skip_pages уже получены ранее и не запрашиваются; первая страница запрашивается
+        всегда, так как из нее берется число страниц (self.pages).
+        """
+        return asyncio.run(self._list_vacancies([params], on_page, keep_items, frozenset(skip_pages),
+                                                key=lambda index, page: page))
+
+    def list_new_vacancies(self, params, known_ids, on_page=None):
+        """Последовательное получение страниц выдачи до первой страницы, где все вакансии уже известны.
+
+        Для инкрементального сбора: params должны сортировать выдачу от новых к старым
+        (order_by=publication_time) и ограничивать ее датой публикации (date_from).
+        Если граница известных вакансий не найдена в пределах лимита выдачи HH, self.truncated = True.
+        """
+        known_ids = {str(external_id) for external_id in known_ids}
+        return asyncio.run(self._list_new_vacancies(params, known_ids, on_page))
+
+    def plan_partitions(self, params):
+        """Срезы поискового запроса по дате публикации и региону, каждый не больше лимита выдачи HH."""
+        return asyncio.run(self._plan_partitions(params))
+
+    def list_partitions(self, partitions, on_page=None, keep_items=True, skip_pages=()):
+        """Получение всех срезов запроса, срезы и их страницы запрашиваются параллельно.
+
+        Страница среза обозначается ключом «номер среза:страница», он передается в on_page
+        и ожидается в skip_pages. Вакансии из разных срезов объединяются по external id.
+        """
+        return asyncio.run(self._list_vacancies(partitions, on_page, keep_items, frozenset(skip_pages),
+                                                key=lambda index, page: f'{index}:{page}'))
+
+    def fetch_details(self, vacancies, known_employer_ids=()):
+        """Параллельное получение vacancies/{id} и employers/{id} для списка вакансий из поиска.
+
+        Возвращает два словаря: детали вакансий по id вакансии и детали работодателей по id работодателя.
+        Работодатели из known_employer_ids не запрашиваются.
+        """
+        known_employer_ids = {str(employer_id) for employer_id in known_employer_ids}
+        vacancy_ids = list(dict.fromkeys(v['id'] for v in vacancies))
+        employer_ids = [employer_id for employer_id in dict.fromkeys(employer_ids_of(vacancies))
+                        if employer_id not in known_employer_ids]
+        return self.fetch_by_ids(vacancy_ids, employer_ids)
+
+    def fetch_by_ids(self, vacancy_ids, employer_ids):
+        """Параллельное получение vacancies/{id} и employers/{id} по спискам id: (детали вакансий, работодателей)."""
+        if not vacancy_ids and not employer_ids:
+            return {}, {}
+        return asyncio.run(self._fetch_details(list(vacancy_ids), list(employer_ids)))
+
+    def get(self, path, max_age=None):
+        """Синхронный GET одного ресурса через регулятор и кэш: устаревшая запись ревалидируется
+        по ETag/Last-Modified. Для 404 возвращает None."""
+
+        async def run():
+            async with self._client() as client:
+                return await self._get(client, asyncio.Semaphore(1), path, max_age=max_age)
+
+        return asyncio.run(run())
+
+    def check_vacancies(self, external_ids):
+        """Параллельное получение актуального состояния вакансий, пропавших из выдачи или изменившихся в ней.
+
+        Запись дискового кэша не отдается без запроса, а ревалидируется: статус архивации мог
+        измениться после ее сохранения. Возвращает (детали по external_id, id с ответом 404,
+        id, которые не удалось запросить).
+        """
+        return asyncio.run(self._revalidate('vacancies', external_ids))
+
+    def fetch_employers(self, employer_ids):
+        """Параллельное получение актуальных данных работодателей для их обновления.
+
+        Как и check_vacancies, ревалидирует записи кэша. Возвращает (детали по id работодателя,
+        id с ответом 404, id, которые не удалось запросить).
+        """
+        return asyncio.run(self._revalidate('employers', [str(employer_id) for employer_id in employer_ids]))
+
+
+class DetailStore:
+    """Учет деталей вакансий и работодателей, полученных за запуск по всем поисковым запросам.
+
+    Хранит только id: сами ответы лежат в дисковом HttpCache движка. Вакансия или работодатель
+    из выдачи нескольких запросов запрашивается у HH один раз, повторные обращения отдаются
+    из кэша без запроса и учитываются в reused. Без кэша у движка повторные обращения
+    запрашиваются у HH снова. Один экземпляр разделяется между потоками сбора: id, которые
+    в этот момент запрашивает другой поток, не запрашиваются повторно, а ожидаются.
+    """
+
+    def __init__(self):
+        self.vacancy_ids = set()
+        self.employer_ids = set()
+        self.reused = 0
+        self._in_flight = {}  # (vacancies|employers, id) -> Event, выставляется после ответа
+        self._lock = threading.Lock()
+
+    def _fetched(self, key):
+        return key[1] in (self.vacancy_ids if key[0] == 'vacancies' else self.employer_ids)
+
+    @staticmethod
+    def _fetch(engine, keys):
+        return engine.fetch_by_ids([item_id for prefix, item_id in keys if prefix == 'vacancies'],
+                                   [item_id for prefix, item_id in keys if prefix == 'employers'])
+
+    def fetch(self, engine, vacancies, known_employer_ids=()):
+        """Детали для списка вакансий из поиска. Работодатели из known_employer_ids не запрашиваются."""
+        known_employer_ids = {str(employer_id) for employer_id in known_employer_ids}
+        keys = list(dict.fromkeys([('vacancies', v['id']) for v in vacancies] +
+                                  [('employers', employer_id) for employer_id in employer_ids_of(vacancies)
+                                   if employer_id not in known_employer_ids]))
+        with self._lock:
+            own = [key for key in keys if not self._fetched(key) and key not in self._in_flight]
+            waiting = {self._in_flight[key] for key in keys if key in self._in_flight}
+            for key in own:
+                self._in_flight[key] = threading.Event()
+            self.reused += sum(1 for key in keys if key[0] == 'vacancies') - \
+                sum(1 for key in own if key[0] == 'vacancies')
+        vacancy_details, employer_details = {}, {}
+        try:
+            vacancy_details, employer_details = self._fetch(engine, own)
+        finally:
+            with self._lock:
+                self.vacancy_ids.update(vacancy_details)
+                self.employer_ids.update(employer_details)
+                for key in own:
+                    self._in_flight.pop(key).set()
+        # Свои id освобождаются до ожидания чужих: потоки не ждут друг друга по кругу
+        for event in waiting:
+            event.wait()
+        own = set(own)
+        shared_details, shared_employers = self._fetch(engine, [key for key in keys if key not in own])
+        vacancy_details.update(shared_details)
+        employer_details.update(shared_employers)
+        return vacancy_details, employer_details
+
+    def summary(self):
+        return (f"Детали за запуск: вакансий {len(self.vacancy_ids)}, работодателей {len(self.employer_ids)}, "
+                f"повторно использовано {self.reused}")
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+HH_RATE_LIMIT_MIN = float(os.getenv('HH_RATE_LIMIT_MIN', '0.5'))  # Нижняя граница скорости, запросов в секунду
+HH_RATE_LIMIT_MAX = float(os.getenv('HH_RATE_LIMIT_MAX', '15'))  # Верхняя граница скорости, запросов в секунду
+
+THROTTLE_STATUSES = {429, 503}  # HH просит снизить частоту запросов
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Запросы к API HH временно приостановлены из-за серии ошибок подряд."""
+
+
+def parse_retry_after(value):
+    """Преобразование заголовка Retry-After (секунды или HTTP-дата) в количество секунд."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestGovernor:
+    """Адаптивный регулятор запросов к API HH.
+
+    Скорость token bucket растет на increase_step после каждого успешного ответа и умножается
+    на decrease_factor при 429/503. Retry-After приостанавливает все запросы регулятора,
+    повторы выполняются с экспоненциальной задержкой и jitter. После failure_threshold
+    ошибок подряд размыкается circuit breaker: запросы отклоняются в течение cooldown секунд,
+    затем пропускается один пробный запрос. Его ошибка снова размыкает цепь на cooldown.
+    """
+
+    def __init__(self, limiter, min_rate=HH_RATE_LIMIT_MIN, max_rate=HH_RATE_LIMIT_MAX, increase_step=0.05,
+                 decrease_factor=0.5, max_retries=5, base_backoff=1.0, max_backoff=60.0, failure_threshold=10,
+                 cooldown=120.0):
+        self.limiter = limiter
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.throttled = 0  # Количество ответов 429/503 за время жизни регулятора
+        self._pause_until = 0.0
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probing = False  # Пробный запрос полуоткрытой цепи еще не получил ответа
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.limiter.rate
+
+    def _wait_time(self):
+        """Время до разрешения следующего запроса. Бросает CircuitOpenError, если цепь разомкнута."""
+        now = time.monotonic()
+        with self._lock:
+            if self._opened_at is not None:
+                if now - self._opened_at < self.cooldown:
+                    raise CircuitOpenError(
+                        f"HH API circuit is open for another {self.cooldown - (now - self._opened_at):.0f}s")
+                # Полуоткрытая цепь: пропускается один пробный запрос, остальные ждут его результата
+                if self._probing:
+                    raise CircuitOpenError("HH API circuit is half-open, waiting for the probe request")
+                self._probing = True
+            return max(0.0, self._pause_until - now)
+
+    def before_request(self):
+        wait = self._wait_time()
+        if wait > 0:
+            time.sleep(wait)
+        self.limiter.acquire()
+
+    async def before_request_async(self):
+        wait = self._wait_time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await self.limiter.acquire_async()
+
+    def record(self, status_code, retry_after=None):
+        """Учет ответа. status_code=None означает сетевую ошибку. Возвращает True, если запрос стоит повторить."""
+        with self._lock:
+            if status_code is not None and status_code not in RETRYABLE_STATUSES:
+                self._consecutive_failures = 0
+                self._opened_at = None
+                self._probing = False
+                self.limiter.set_rate(min(self.max_rate, self.limiter.rate + self.increase_step))
+                return False
+
+            self._consecutive_failures += 1
+            if status_code in THROTTLE_STATUSES:
+                self.throttled += 1
+                new_rate = max(self.min_rate, self.limiter.rate * self.decrease_factor)
+                self.limiter.set_rate(new_rate)
+                logging.warning(f"HH API throttled with {status_code}, rate lowered to {new_rate:.2f} req/s")
+                if retry_after:
+                    self._pause_until = max(self._pause_until, time.monotonic() + retry_after)
+            now = time.monotonic()
+            if self._opened_at is None:
+                if self._consecutive_failures >= self.failure_threshold:
+                    self._opened_at = now
+                    logging.error(f"HH API circuit opened after {self._consecutive_failures} failures in a row")
+            elif self._probing or now - self._opened_at >= self.cooldown:
+                # Ошибка после cooldown (пробный запрос не прошел): цепь снова размыкается
+                self._opened_at = now
+                self._probing = False
+                logging.error(f"HH API circuit reopened after a failed probe, "
+                              f"{self._consecutive_failures} failures in a row")
+            return True
+
+    def backoff(self, attempt, retry_after=None):
+        """Задержка перед повтором: Retry-After, если он указан, иначе экспонента с jitter."""
+        if retry_after:
+            return retry_after
+        delay = min(self.max_backoff, self.base_backoff * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def call(self, send):
+        """Синхронный вызов send() с повторами. send возвращает (status_code, retry_after, result)."""
+        for attempt in range(self.max_retries + 1):
+            self.before_request()
+            try:
+                status_code, retry_after, result = send()
+            except Exception:
+                self.record(None)
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff(attempt))
+                continue
+            if not self.record(status_code, retry_after) or attempt == self.max_retries:
+                return result
+            time.sleep(self.backoff(attempt, retry_after))
+
+    async def call_async(self, send):
+        """Асинхронный аналог call(): send — корутинная функция."""
+        for attempt in range(self.max_retries + 1):
+            await self.before_request_async()
+            try:
+                status_code, retry_after, result = await send()
+            except Exception:
+                self.record(None)
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+            if not self.record(status_code, retry_after) or attempt == self.max_retries:
+                return result
+            await asyncio.sleep(self.backoff(attempt, retry_after))
@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+HH_CACHE_PATH = os.getenv('HH_CACHE_PATH', 'cache/hh_http_cache.sqlite3')
+HH_CACHE_MAX_MB = int(os.getenv('HH_CACHE_MAX_MB', '512'))  # Предельный размер кэша на диске
+
+# Время жизни записей по типу ресурса в секундах. Детали вакансий живут меньше суток,
+# чтобы ежедневная проверка статусов видела архивацию, работодатели меняются редко.
+CACHE_TTL = {
+    'vacancies': int(os.getenv('HH_CACHE_TTL_VACANCIES', str(6 * 3600))),
+    'employers': int(os.getenv('HH_CACHE_TTL_EMPLOYERS', str(7 * 24 * 3600))),
+}
+
+EVICTION_CHECK_INTERVAL = 100  # Проверка размера кэша раз в N записей
+
+
+class HttpCache:
+    """Персистентный кэш ответов API HH в SQLite с ключом «endpoint/id».
+
+    Свежие записи (моложе TTL ресурса) отдаются без запроса. Для устаревших записей
+    отправляются If-None-Match/If-Modified-Since, и ответ 304 продлевает запись.
+    При превышении max_bytes вытесняются давно не читавшиеся записи (LRU).
+    """
+
+    def __init__(self, path=HH_CACHE_PATH, ttl=None, max_bytes=HH_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl or CACHE_TTL
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._stores = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        # Файл и каталог кэша создаются при первом обращении, а не при импорте модуля
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # Один файл используется краулером и веб-приложением, поэтому WAL и ожидание блокировок
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS http_cache (
+                    key TEXT PRIMARY KEY,
+                    resource TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    size INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute('CREATE INDEX IF NOT EXISTS ix_http_cache_accessed_at ON http_cache (accessed_at)')
+        return self._conn
+
+    @staticmethod
+    def resource(path):
+        return path.strip('/').split('/')[0]
+
+    def is_cacheable(self, path):
+        """Кэшируются только детальные ресурсы вида 'vacancies/{id}' и 'employers/{id}'."""
+        parts = path.strip('/').split('/')
+        return len(parts) == 2 and parts[0] in self.ttl
+
+    def lookup(self, path, max_age=None):
+        """Возвращает (запись, свежая ли она) или (None, False)."""
+        key = path.strip('/')
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                'SELECT payload, etag, last_modified, fetched_at FROM http_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None, False
+            now = time.time()
+            conn.execute('UPDATE http_cache SET accessed_at = ? WHERE key = ?', (now, key))
+        entry = {'payload': json.loads(row[0]), 'etag': row[1], 'last_modified': row[2]}
+        ttl = self.ttl.get(self.resource(path), 0) if max_age is None else max_age
+        return entry, now - row[3] < ttl
+
+    @staticmethod
+    def validators(entry):
+        """Заголовки условного запроса для ревалидации записи."""
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def resolve(self, path, entry, status_code, payload, headers=None):
+        """Учет ответа сервера: 304 продлевает запись, 200 сохраняет новую, остальное не кэшируется."""
+        key = path.strip('/')
+        if status_code == 304 and entry is not None:
+            self.revalidated += 1
+            with self._lock:
+                self._connection().execute('UPDATE http_cache SET fetched_at = ? WHERE key = ?', (time.time(), key))
+            return entry['payload']
+        self.misses += 1
+        if status_code == 200 and payload is not None:
+            self.store(path, payload, (headers or {}).get('ETag'), (headers or {}).get('Last-Modified'))
+        return payload
+
+    def store(self, path, payload, etag=None, last_modified=None):
+        data = json.dumps(payload, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._connection().execute(
+                'INSERT OR REPLACE INTO http_cache (key, resource, payload, etag, last_modified, size, fetched_at, '
+                'accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (path.strip('/'), self.resource(path), data, etag, last_modified, len(data.encode()), now, now))
+            self._stores += 1
+            if self._stores % EVICTION_CHECK_INTERVAL == 0:
+                self._evict()
+
+    def _evict(self):
+        """Удаление наименее востребованных записей, пока кэш не уложится в max_bytes."""
+        conn = self._connection()
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM http_cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        evicted = 0
+        for key, size in conn.execute('SELECT key, size FROM http_cache ORDER BY accessed_at').fetchall():
+            conn.execute('DELETE FROM http_cache WHERE key = ?', (key,))
+            excess -= size
+            evicted += 1
+            if excess <= 0:
+                break
+        logging.info(f"HTTP cache evicted {evicted} entries")
+
+    def get(self, path, fetch, max_age=None):
+        """Чтение через кэш. fetch(validators) возвращает (status_code, payload, headers)."""
+        entry, fresh = self.lookup(path, max_age)
+        if fresh:
+            self.hits += 1
+            return entry['payload']
+        status_code, payload, headers = fetch(self.validators(entry))
+        return self.resolve(path, entry, status_code, payload, headers)
+
+    def summary(self):
+        return (f"Кэш HH: попаданий {self.hits}, промахов {self.misses}, "
+                f"ревалидаций {self.revalidated}")
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+import pytz
+
+HH_RESULT_CAP = int(os.getenv('HH_RESULT_CAP', '2000'))  # HH отдает не больше 2000 вакансий по одному запросу
+HH_MAX_PER_PAGE = 100
+PARTITION_WINDOW_DAYS = int(os.getenv('PARTITION_WINDOW_DAYS', '30'))  # Окно дат для первого разбиения
+MAX_LOOKBACK_DAYS = 365  # Глубже по дате не делим, дальше только по регионам
+MIN_PARTITION_WINDOW = timedelta(hours=1)
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+moscow_tz = pytz.timezone('Europe/Moscow')
+
+
+def parse_date(value):
+    return datetime.strptime(value, DATE_FORMAT) if value else None
+
+
+def format_date(value):
+    return value.strftime(DATE_FORMAT)
+
+
+class PartitionPlanner:
+    """Разбиение поискового запроса на срезы, каждый из которых помещается в лимит выдачи HH.
+
+    Запрос, по которому найдено больше cap вакансий, рекурсивно делится по дате публикации
+    (date_from/date_to) пополам, пока окно не станет меньше min_window, а затем по регионам
+    (area) по дереву регионов HH. Срез, который делить дальше нельзя, сохраняется как есть
+    и попадает в truncated.
+
+    get(path, params) — корутина, возвращающая JSON ответа API HH или None.
+    """
+
+    def __init__(self, get, cap=HH_RESULT_CAP, min_window=MIN_PARTITION_WINDOW):
+        self.get = get
+        self.cap = cap
+        self.min_window = min_window
+        self.probes = 0
+        self.truncated = []
+
+    async def found(self, params):
+        response = await self.get('vacancies', {**params, 'per_page': 1, 'page': 0}) or {}
+        self.probes += 1
+        return response.get('found', 0)
+
+    async def plan(self, params, now=None):
+        now = now or datetime.now(moscow_tz).replace(tzinfo=None, microsecond=0)
+        params = {key: value for key, value in params.items() if key not in ('page', 'per_page')}
+        partitions = await self._plan(params, now)
+        return [{**partition, 'per_page': HH_MAX_PER_PAGE} for partition in partitions]
+
+    async def _plan(self, params, now):
+        found = await self.found(params)
+        if found <= self.cap:
+            return [params] if found else []
+        halves = self.split_dates(params, now) or await self.split_areas(params)
+        if not halves:
+            logging.warning(f"Search slice {params} has {found} vacancies and cannot be split, "
+                            f"only the first {self.cap} will be fetched")
+            self.truncated.append(params)
+            return [params]
+        results = await asyncio.gather(*(self._plan(half, now) for half in halves))
+        return [partition for result in results for partition in result]
+
+    def split_dates(self, params, now):
+        date_from = parse_date(params.get('date_from'))
+        date_to = parse_date(params.get('date_to')) or now
+        if date_from is None:
+            # Открытое начало: последнее окно отдельно, более старые публикации отдельным срезом
+            if date_to < now - timedelta(days=MAX_LOOKBACK_DAYS):
+                return None
+            boundary = date_to - timedelta(days=PARTITION_WINDOW_DAYS)
+            return [
+                {**params, 'date_from': format_date(boundary), 'date_to': format_date(date_to)},
+                {**params, 'date_to': format_date(boundary - timedelta(seconds=1))},
+            ]
+        if date_to - date_from <= self.min_window:
+            return None
+        middle = date_from + (date_to - date_from) // 2
+        return [
+            {**params, 'date_from': format_date(date_from), 'date_to': format_date(middle)},
+            {**params, 'date_from': format_date(middle + timedelta(seconds=1)), 'date_to': format_date(date_to)},
+        ]
+
+    async def split_areas(self, params):
+        area = params.get('area')
+        response = await self.get(f'areas/{area}' if area else 'areas', None)
+        children = (response or {}).get('areas', []) if area else (response or [])
+        if not children:
+            return None
+        # Окно дат сохраняется: соседние по дате срезы уже покрывают остальные публикации
+        return [{**params, 'area': child['id']} for child in children]
@@ -0,0 +1,50 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket для ограничения частоты запросов к API HH.
+
+    Один экземпляр разделяется между синхронными вызовами и асинхронным движком,
+    поэтому состояние защищено threading.Lock, а ожидание вынесено за пределы блокировки.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)  # Токенов в секунду
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        """Изменение скорости пополнения (используется адаптивным регулятором)."""
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self):
+        """Резервирует токен и возвращает время ожидания до его появления в секундах."""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """Блокирующее получение токена."""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Получение токена без блокировки event loop."""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
@@ -0,0 +1,175 @@
+import gzip
+import json
+import logging
+import os
+import zlib
+
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'vacancies_data')
+INDEX_SUFFIX = '.idx'
+
+
+def snapshot_path(query_id, date_str, directory=SNAPSHOT_DIR, source=None):
+    """Путь к снимку выдачи запроса за дату.
+
+    source отделяет снимки, которые пишет не сбор (например, веб-приложение): файл сбора
+    продолжается с сохраненной точки и не должен перезаписываться другими процессами.
+    """
+    suffix = f'_{source}' if source else ''
+    return os.path.join(directory, f'vacancies_query_{query_id}_{date_str}{suffix}.ndjson.gz')
+
+
+def legacy_snapshot_path(query_id, date_str, directory=SNAPSHOT_DIR):
+    """Путь к снимку в прежнем формате: один JSON-массив с отступами."""
+    return os.path.join(directory, f'vacancies_query_{query_id}_{date_str}.json')
+
+
+class SnapshotWriter:
+    """Запись выдачи поиска в сжатый NDJSON по мере получения страниц.
+
+    Каждая страница дописывается отдельным gzip-членом и сразу сбрасывается на диск,
+    поэтому при падении процесса уже полученные страницы сохраняются. Рядом ведется
+    индекс «external_id, смещение члена, номер строки» для чтения записи без распаковки
+    всего файла.
+
+    resume=(размер снимка, размер индекса) продолжает существующий снимок: хвост,
+    записанный после этих размеров (недописанная страница), отбрасывается.
+    """
+
+    def __init__(self, path, compresslevel=6, resume=None):
+        self.path = path
+        self.compresslevel = compresslevel
+        self.count = 0
+        self.pages = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if resume and os.path.exists(path) and os.path.exists(path + INDEX_SUFFIX):
+            self._file = open(path, 'r+b')
+            self._index = open(path + INDEX_SUFFIX, 'r+b')
+            for f, size in zip((self._file, self._index), resume):
+                f.truncate(size)
+                f.seek(size)
+        else:
+            self._file = open(path, 'wb')
+            self._index = open(path + INDEX_SUFFIX, 'wb')
+
+    def write_page(self, items):
+        if not items:
+            return
+        offset = self._file.tell()
+        lines = ''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in items)
+        self._file.write(gzip.compress(lines.encode('utf-8'), self.compresslevel))
+        self._file.flush()
+        # Индекс пишется после данных: запись из индекса всегда есть в файле
+        self._index.write(''.join(f"{item['id']}\t{offset}\t{line}\n"
+                                  for line, item in enumerate(items)).encode('utf-8'))
+        self._index.flush()
+        self.count += len(items)
+        self.pages += 1
+
+    def sizes(self):
+        """Размеры снимка и индекса после последней записанной страницы."""
+        return self._file.tell(), self._index.tell()
+
+    def close(self):
+        self._file.close()
+        self._index.close()
+        logging.info(f"Snapshot {self.path} saved: {self.count} vacancies, {self.pages} pages, "
+                     f"{os.path.getsize(self.path)} bytes")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SnapshotReader:
+    """Ленивое чтение снимка: записи выдаются по одной, поиск по external_id идет через индекс.
+
+    Снимки прежнего формата (.json) читаются целиком, поиск по ним линейный.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._index = None
+
+    @classmethod
+    def open(cls, query_id, date_str, directory=SNAPSHOT_DIR):
+        """Снимок запроса за дату в новом формате, при его отсутствии — в прежнем. None, если файла нет."""
+        for path in (snapshot_path(query_id, date_str, directory), legacy_snapshot_path(query_id, date_str, directory)):
+            if os.path.exists(path):
+                return cls(path)
+        return None
+
+    @property
+    def legacy(self):
+        return self.path.endswith('.json')
+
+    def __iter__(self):
+        if self.legacy:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                yield from json.load(f)
+            return
+        with open(self.path, 'rb') as f:
+            yield from self._read_lines(f)
+
+    def _read_lines(self, f):
+        try:
+            with gzip.GzipFile(fileobj=f) as stream:
+                for line in stream:
+                    yield json.loads(line)
+        except (EOFError, zlib.error):
+            # Последняя страница не дописана из-за падения процесса, предыдущие страницы целы
+            logging.warning(f"Snapshot {self.path} is truncated, reading stopped at the damaged page")
+
+    def ids(self):
+        """external_id всех записей. Для нового формата читается только индекс."""
+        if self.legacy:
+            return [item['id'] for item in self]
+        return list(self.index())
+
+    def index(self):
+        if self._index is None:
+            self._index = {}
+            with open(self.path + INDEX_SUFFIX, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.rstrip('\n').split('\t')
+                    if len(parts) == 3:  # Недописанная строка после падения пропускается
+                        self._index[parts[0]] = (int(parts[1]), int(parts[2]))
+        return self._index
+
+    def get(self, external_id):
+        return self.get_many([external_id]).get(str(external_id))
+
+    def get_many(self, external_ids):
+        """Записи по external_id. Каждая страница с нужными записями распаковывается один раз."""
+        wanted = {str(external_id) for external_id in external_ids}
+        if self.legacy or not os.path.exists(self.path + INDEX_SUFFIX):
+            return {str(item['id']): item for item in self if str(item['id']) in wanted}
+        by_offset = {}
+        for external_id in wanted:
+            if external_id in self.index():
+                offset, line = self.index()[external_id]
+                by_offset.setdefault(offset, set()).add(line)
+        found = {}
+        with open(self.path, 'rb') as f:
+            for offset, lines in sorted(by_offset.items()):
+                f.seek(offset)
+                # Распаковываем только один gzip-член страницы
+                page = self._member(f).decode('utf-8').split('\n')  # splitlines делит и по U+2028
+                for line in lines:
+                    item = json.loads(page[line])
+                    found[str(item['id'])] = item
+        return found
+
+    @staticmethod
+    def _member(f):
+        """Распаковка одного gzip-члена с текущей позиции файла."""
+        decompressor = zlib.decompressobj(wbits=31)
+        chunks = []
+        while not decompressor.eof:
+            chunk = f.read(64 * 1024)
+            if not chunk:
+                break
+            chunks.append(decompressor.decompress(chunk))
+        return b''.join(chunks)
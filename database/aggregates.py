@@ -0,0 +1,232 @@
+from datetime import datetime
+import numpy as np
+from sqlalchemy import select, delete, func, distinct, case
+from .models import Vacancy, KeySkill, KeySkillHistory, WorkFormat, ExperienceLevel, ProfessionalRole, SalaryHistory, \
+    VacancyStatusHistory, Employer, Industry, SearchQuery, QueryAggregate, QueryAggregateState, QueryDataVersion, \
+    vacancy_work_formats, search_query_vacancies, employer_industries, moscow_tz
+
+ACTIVE_STATUS = 'Активный'
+ARCHIVED_STATUS = 'Архивный'
+TOP_LIMIT = 10  # Строк в топах навыков, ролей, отраслей и городов
+INDUSTRY_NAME_LIMIT = 80  # Длина названия отрасли в ответе
+
+
+def _now():
+    # MySQL хранит московское время без часового пояса
+    return datetime.now(moscow_tz).replace(tzinfo=None)
+
+
+def _of_query(statement, search_query_id, status=ACTIVE_STATUS):
+    """Ограничение выборки вакансиями запроса с заданным статусом."""
+    statement = statement.join(search_query_vacancies, search_query_vacancies.c.vacancy_id == Vacancy.id) \
+        .where(search_query_vacancies.c.search_query_id == search_query_id)
+    return statement.where(Vacancy.status == status) if status is not None else statement
+
+
+def _counts(session, statement):
+    return [{'label': label, 'count': count} for label, count in session.execute(statement).all()]
+
+
+def top_skills(session, search_query_id):
+    vacancy_count = func.count(distinct(KeySkillHistory.vacancy_id))
+    return _counts(session, _of_query(
+        select(KeySkill.name, vacancy_count).select_from(KeySkill)
+        .join(KeySkillHistory, KeySkillHistory.key_skill_id == KeySkill.id)
+        .join(Vacancy, Vacancy.id == KeySkillHistory.vacancy_id), search_query_id)
+        .where(KeySkillHistory.is_active.is_(True))
+        .group_by(KeySkill.id, KeySkill.name).order_by(vacancy_count.desc(), KeySkill.name).limit(TOP_LIMIT))
+
+
+def work_formats(session, search_query_id):
+    return _counts(session, _of_query(
+        select(WorkFormat.name, func.count(Vacancy.id)).select_from(WorkFormat)
+        .join(vacancy_work_formats, vacancy_work_formats.c.work_format_id == WorkFormat.id)
+        .join(Vacancy, Vacancy.id == vacancy_work_formats.c.vacancy_id), search_query_id)
+        .group_by(WorkFormat.id, WorkFormat.name).order_by(WorkFormat.id))
+
+
+def experience_levels(session, search_query_id):
+    return _counts(session, _of_query(
+        select(ExperienceLevel.name, func.count(Vacancy.id)).select_from(ExperienceLevel)
+        .join(Vacancy, Vacancy.experience_id == ExperienceLevel.id), search_query_id)
+        .group_by(ExperienceLevel.id, ExperienceLevel.name).order_by(ExperienceLevel.id))
+
+
+def professional_roles(session, search_query_id):
+    vacancy_count = func.count(Vacancy.id)
+    return _counts(session, _of_query(
+        select(ProfessionalRole.name, vacancy_count).select_from(ProfessionalRole)
+        .join(Vacancy, Vacancy.professional_role_id == ProfessionalRole.id), search_query_id)
+        .group_by(ProfessionalRole.id, ProfessionalRole.name)
+        .order_by(vacancy_count.desc(), ProfessionalRole.name).limit(TOP_LIMIT))
+
+
+def industries(session, search_query_id):
+    vacancy_count = func.count(Vacancy.id)
+    rows = _counts(session, _of_query(
+        select(Industry.name, vacancy_count).select_from(Vacancy)
+        .join(employer_industries, employer_industries.c.employer_id == Vacancy.employer_id)
+        .join(Industry, Industry.id == employer_industries.c.industry_id), search_query_id)
+        .group_by(Industry.id, Industry.name).order_by(vacancy_count.desc(), Industry.name).limit(TOP_LIMIT))
+    for row in rows:
+        if len(row['label']) > INDUSTRY_NAME_LIMIT:
+            row['label'] = row['label'][:INDUSTRY_NAME_LIMIT] + '...'
+    return rows
+
+
+def salaries(session, search_query_id):
+    statement = _of_query(
+        select(SalaryHistory.currency, ExperienceLevel.name, func.avg(SalaryHistory.salary_from),
+               func.count(Vacancy.id)).select_from(Vacancy)
+        .join(SalaryHistory, SalaryHistory.vacancy_id == Vacancy.id)
+        .join(ExperienceLevel, ExperienceLevel.id == Vacancy.experience_id), search_query_id) \
+        .where(SalaryHistory.is_active.is_(True), ExperienceLevel.name.isnot(None)) \
+        .group_by(SalaryHistory.currency, ExperienceLevel.name) \
+        .order_by(SalaryHistory.currency, ExperienceLevel.name)
+    return [{'label': currency, 'category': experience_level,
+             'value': round(float(average)) if average is not None else None, 'count': count}
+            for currency, experience_level, average, count in session.execute(statement).all()]
+
+
+def salary_experience_correlation(session, search_query_id):
+    """Корреляция зарплаты «от» с уровнем опыта по активным зарплатам всех вакансий запроса."""
+    rows = session.execute(_of_query(
+        select(SalaryHistory.salary_from, ExperienceLevel.name).select_from(SalaryHistory)
+        .join(Vacancy, Vacancy.id == SalaryHistory.vacancy_id)
+        .join(ExperienceLevel, ExperienceLevel.id == Vacancy.experience_id), search_query_id, status=None)
+        .where(SalaryHistory.is_active.is_(True), SalaryHistory.salary_from.isnot(None))).all()
+    if len(rows) < 2:
+        return [{'value': None}]
+    # Уровни опыта преобразуются в числа для корреляции
+    experience_mapping = {level: idx for idx, level in enumerate(sorted({level for _, level in rows}))}
+    salaries = np.array([float(salary) for salary, _ in rows])
+    experience = np.array([experience_mapping[level] for _, level in rows])
+    # Без разброса зарплат или опыта корреляция не определена
+    if salaries.std() == 0 or experience.std() == 0:
+        return [{'value': None}]
+    return [{'value': float(np.corrcoef(salaries, experience)[0, 1])}]
+
+
+def _status_trends(session, search_query_id, status):
+    day = func.date(VacancyStatusHistory.created_at_cur_status)
+    statement = _of_query(
+        select(VacancyStatusHistory.cur_status, func.count(VacancyStatusHistory.id), day)
+        .select_from(VacancyStatusHistory)
+        .join(Vacancy, Vacancy.id == VacancyStatusHistory.vacancy_id), search_query_id, status) \
+        .group_by(VacancyStatusHistory.cur_status, day).order_by(day, VacancyStatusHistory.cur_status)
+    # Дата хранится строкой ГГГГ-ММ-ДД: SQLite возвращает DATE() строкой, MySQL — датой
+    return [{'label': str(date), 'category': cur_status, 'count': count}
+            for cur_status, count, date in session.execute(statement).all()]
+
+
+def status_trends_active(session, search_query_id):
+    return _status_trends(session, search_query_id, ACTIVE_STATUS)
+
+
+def status_trends_archive(session, search_query_id):
+    return _status_trends(session, search_query_id, ARCHIVED_STATUS)
+
+
+def accreditation(session, search_query_id):
+    accredited, non_accredited = session.execute(_of_query(
+        select(func.count(distinct(case((Employer.accredited_it_employer.is_(True), Employer.id)))),
+               func.count(distinct(case((Employer.accredited_it_employer.is_(False), Employer.id)))))
+        .select_from(Employer).join(Vacancy, Vacancy.employer_id == Employer.id), search_query_id)).one()
+    return [{'label': 'Акредитованные', 'count': accredited},
+            {'label': 'Неакредитованные', 'count': non_accredited}]
+
+
+def top_cities(session, search_query_id):
+    vacancy_count = func.count(Vacancy.id)
+    return _counts(session, _of_query(
+        select(Employer.area, vacancy_count).select_from(Employer)
+        .join(Vacancy, Vacancy.employer_id == Employer.id), search_query_id)
+        .group_by(Employer.area).order_by(vacancy_count.desc(), Employer.area).limit(TOP_LIMIT))
+
+
+def employer_count(session, search_query_id):
+    return [{'count': session.execute(_of_query(
+        select(func.count(distinct(Employer.id))).select_from(Employer)
+        .join(Vacancy, Vacancy.employer_id == Employer.id), search_query_id)).scalar()}]
+
+
+def vacancy_count(session, search_query_id):
+    counts = dict(session.execute(_of_query(
+        select(Vacancy.status, func.count(Vacancy.id)).select_from(Vacancy), search_query_id, status=None)
+        .where(Vacancy.status.in_([ACTIVE_STATUS, ARCHIVED_STATUS])).group_by(Vacancy.status)).all())
+    return [{'label': status, 'count': counts.get(status, 0)} for status in (ACTIVE_STATUS, ARCHIVED_STATUS)]
+
+
+# Сводки дашборда: имя (metric в query_aggregates) -> функция расчета строк по одному запросу
+METRICS = {
+    'top_skills': top_skills,
+    'work_formats': work_formats,
+    'experience_levels': experience_levels,
+    'professional_roles': professional_roles,
+    'industries': industries,
+    'salaries': salaries,
+    'salary_experience_correlation': salary_experience_correlation,
+    'status_trends_active': status_trends_active,
+    'status_trends_archive': status_trends_archive,
+    'accreditation': accreditation,
+    'top_cities': top_cities,
+    'employer_count': employer_count,
+    'vacancy_count': vacancy_count,
+}
+
+
+def refresh_query_aggregates(session, search_query_id, now=None):
+    """Пересчет всех сводок запроса с commit.
+
+    Старые строки запроса заменяются новыми в одной транзакции: читатели видят либо прошлые,
+    либо новые сводки целиком. В query_aggregate_states записывается версия данных, прочитанная
+    до расчета: если сбор изменит данные во время расчета, запрос останется устаревшим.
+    """
+    version = session.execute(select(QueryDataVersion.version).where(
+        QueryDataVersion.search_query_id == search_query_id)).scalar() or 0
+    rows = []
+    for metric, compute in METRICS.items():
+        rows.extend({'search_query_id': search_query_id, 'metric': metric, 'position': position,
+                     'label': None, 'category': None, 'value': None, 'count': None, **row}
+                    for position, row in enumerate(compute(session, search_query_id)))
+    aggregates, states = QueryAggregate.__table__, QueryAggregateState.__table__
+    session.execute(delete(aggregates).where(aggregates.c.search_query_id == search_query_id))
+    if rows:
+        session.execute(aggregates.insert(), rows)
+    session.execute(delete(states).where(states.c.search_query_id == search_query_id))
+    session.execute(states.insert(), [{'search_query_id': search_query_id, 'data_version': version,
+                                       'computed_at': now or _now()}])
+    session.commit()
+
+
+def stale_queries(session, search_query_ids=None):
+    """Запросы, сводки которых посчитаны не по текущей версии данных или еще не считались."""
+    if search_query_ids is None:
+        search_query_ids = session.execute(select(SearchQuery.id)).scalars().all()
+    versions = dict(session.execute(select(QueryDataVersion.search_query_id, QueryDataVersion.version)).all())
+    computed = aggregate_versions(session)
+    return [search_query_id for search_query_id in sorted(set(search_query_ids))
+            if computed.get(search_query_id) != versions.get(search_query_id, 0)]
+
+
+def refresh_aggregates(session, search_query_ids=None):
+    """Пересчет сводок устаревших запросов (всех или из search_query_ids), по транзакции на запрос.
+
+    Возвращает id пересчитанных запросов.
+    """
+    refreshed = stale_queries(session, search_query_ids)
+    for search_query_id in refreshed:
+        refresh_query_aggregates(session, search_query_id)
+    return refreshed
+
+
+def aggregate_versions(session):
+    """Версии данных, по которым посчитаны сводки запросов: {search_query_id: версия}."""
+    return dict(session.execute(select(QueryAggregateState.search_query_id, QueryAggregateState.data_version)).all())
+
+
+def read_aggregate(session, search_query_id, metric):
+    """Строки сводки запроса в порядке расчета."""
+    return session.execute(select(QueryAggregate).where(
+        QueryAggregate.search_query_id == search_query_id, QueryAggregate.metric == metric)
+        .order_by(QueryAggregate.position)).scalars().all()
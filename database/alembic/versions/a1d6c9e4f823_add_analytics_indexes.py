@@ -0,0 +1,37 @@
+"""Add indexes for dashboard aggregates and ingestion lookups
+
+Revision ID: a1d6c9e4f823
+Revises: f7b3d8e2c604
+Create Date: 2026-10-17 19:48:31.502977
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1d6c9e4f823'
+down_revision: Union[str, Sequence[str], None] = 'f7b3d8e2c604'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_search_query_vacancies_vacancy', 'search_query_vacancies', ['vacancy_id', 'search_query_id'])
+    op.create_index('ix_vacancies_employer_status', 'vacancies', ['employer_id', 'status'])
+    op.create_index('ix_salary_history_vacancy_active', 'salary_history', ['vacancy_id', 'is_active'])
+    op.create_index('ix_vacancy_status_history_vacancy', 'vacancy_status_history', ['vacancy_id', 'id'])
+    op.create_index('ix_key_skill_history_vacancy_active', 'key_skill_history',
+                    ['vacancy_id', 'is_active', 'key_skill_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_key_skill_history_vacancy_active', table_name='key_skill_history')
+    op.drop_index('ix_vacancy_status_history_vacancy', table_name='vacancy_status_history')
+    op.drop_index('ix_salary_history_vacancy_active', table_name='salary_history')
+    op.drop_index('ix_vacancies_employer_status', table_name='vacancies')
+    op.drop_index('ix_search_query_vacancies_vacancy', table_name='search_query_vacancies')
@@ -0,0 +1,28 @@
+"""Add payload_hash to vacancies
+
+Revision ID: a4c9e2f1b736
+Revises: f2c6d8a4b915
+Create Date: 2026-10-17 16:05:12.418203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c9e2f1b736'
+down_revision: Union[str, Sequence[str], None] = 'f2c6d8a4b915'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('vacancies', sa.Column('payload_hash', sa.String(length=40), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('vacancies', 'payload_hash')
@@ -0,0 +1,46 @@
+"""Add crawl_runs
+
+Revision ID: b7e4c2d9a1f3
+Revises: 561ab398d1a8
+Create Date: 2026-10-17 10:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e4c2d9a1f3'
+down_revision: Union[str, Sequence[str], None] = '561ab398d1a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('crawl_runs',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('search_query_id', sa.Integer(), nullable=False),
+    sa.Column('run_date', sa.Date(), nullable=False),
+    sa.Column('phase', sa.String(length=50), nullable=False),
+    sa.Column('status', sa.String(length=50), nullable=False),
+    sa.Column('pages', sa.Integer(), nullable=True),
+    sa.Column('completed_pages', sa.Text(), nullable=True),
+    sa.Column('snapshot_size', sa.Integer(), nullable=True),
+    sa.Column('index_size', sa.Integer(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['search_query_id'], ['search_queries.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_crawl_runs_query_date', 'crawl_runs', ['search_query_id', 'run_date'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_crawl_runs_query_date', table_name='crawl_runs')
+    op.drop_table('crawl_runs')
@@ -0,0 +1,28 @@
+"""Add industries_hash to employers
+
+Revision ID: b8d1f5c3e927
+Revises: a4c9e2f1b736
+Create Date: 2026-10-17 16:41:27.905316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d1f5c3e927'
+down_revision: Union[str, Sequence[str], None] = 'a4c9e2f1b736'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('employers', sa.Column('industries_hash', sa.String(length=40), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('employers', 'industries_hash')
@@ -0,0 +1,28 @@
+"""Add partitions to crawl_runs
+
+Revision ID: c1f8a5e3d204
+Revises: b7e4c2d9a1f3
+Create Date: 2026-10-17 11:04:12.918350
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c1f8a5e3d204'
+down_revision: Union[str, Sequence[str], None] = 'b7e4c2d9a1f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('crawl_runs', sa.Column('partitions', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('crawl_runs', 'partitions')
@@ -0,0 +1,30 @@
+"""Add mode and watermark to crawl_runs
+
+Revision ID: d5a2e9c7b318
+Revises: c1f8a5e3d204
+Create Date: 2026-10-17 11:48:55.270641
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5a2e9c7b318'
+down_revision: Union[str, Sequence[str], None] = 'c1f8a5e3d204'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('crawl_runs', sa.Column('mode', sa.String(length=20), nullable=True))
+    op.add_column('crawl_runs', sa.Column('watermark', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('crawl_runs', 'watermark')
+    op.drop_column('crawl_runs', 'mode')
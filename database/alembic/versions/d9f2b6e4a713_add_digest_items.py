@@ -0,0 +1,38 @@
+"""Add digest_items
+
+Revision ID: d9f2b6e4a713
+Revises: c3e7a9d2f451
+Create Date: 2026-10-17 17:48:36.117092
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9f2b6e4a713'
+down_revision: Union[str, Sequence[str], None] = 'c3e7a9d2f451'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('digest_items',
+    sa.Column('search_query_id', sa.Integer(), nullable=False),
+    sa.Column('vacancy_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('digested_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['search_query_id'], ['search_queries.id'], ),
+    sa.ForeignKeyConstraint(['vacancy_id'], ['vacancies.id'], ),
+    sa.PrimaryKeyConstraint('search_query_id', 'vacancy_id')
+    )
+    op.create_index('ix_digest_items_pending', 'digest_items', ['digested_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_digest_items_pending', table_name='digest_items')
+    op.drop_table('digest_items')
@@ -0,0 +1,34 @@
+"""Add query_data_versions
+
+Revision ID: e4a8c1d7b592
+Revises: d9f2b6e4a713
+Create Date: 2026-10-17 18:20:44.690215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a8c1d7b592'
+down_revision: Union[str, Sequence[str], None] = 'd9f2b6e4a713'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('query_data_versions',
+    sa.Column('search_query_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['search_query_id'], ['search_queries.id'], ),
+    sa.PrimaryKeyConstraint('search_query_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('query_data_versions')
@@ -0,0 +1,41 @@
+"""Add vacancy_verifications queue
+
+Revision ID: e8b3f1a6c420
+Revises: d5a2e9c7b318
+Create Date: 2026-10-17 14:05:12.418307
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b3f1a6c420'
+down_revision: Union[str, Sequence[str], None] = 'd5a2e9c7b318'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('vacancy_verifications',
+    sa.Column('vacancy_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('misses', sa.Integer(), nullable=False),
+    sa.Column('last_missed_on', sa.Date(), nullable=False),
+    sa.Column('not_found', sa.Integer(), nullable=False),
+    sa.Column('next_check_at', sa.DateTime(), nullable=True),
+    sa.Column('last_checked_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['vacancy_id'], ['vacancies.id'], ),
+    sa.PrimaryKeyConstraint('vacancy_id')
+    )
+    op.create_index('ix_vacancy_verifications_due', 'vacancy_verifications', ['status', 'next_check_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_vacancy_verifications_due', table_name='vacancy_verifications')
+    op.drop_table('vacancy_verifications')
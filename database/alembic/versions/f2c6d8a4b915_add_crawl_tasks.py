@@ -0,0 +1,48 @@
+"""Add crawl_tasks queue
+
+Revision ID: f2c6d8a4b915
+Revises: e8b3f1a6c420
+Create Date: 2026-10-17 15:22:40.731945
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c6d8a4b915'
+down_revision: Union[str, Sequence[str], None] = 'e8b3f1a6c420'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('crawl_tasks',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('task_key', sa.String(length=255), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('available_at', sa.DateTime(), nullable=False),
+    sa.Column('lease_owner', sa.String(length=255), nullable=True),
+    sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('task_key')
+    )
+    op.create_index('ix_crawl_tasks_available', 'crawl_tasks', ['status', 'available_at'])
+    op.create_index('ix_crawl_tasks_lease', 'crawl_tasks', ['status', 'lease_expires_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_crawl_tasks_lease', table_name='crawl_tasks')
+    op.drop_index('ix_crawl_tasks_available', table_name='crawl_tasks')
+    op.drop_table('crawl_tasks')
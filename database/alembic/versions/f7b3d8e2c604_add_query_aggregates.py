@@ -0,0 +1,46 @@
+"""Add query_aggregates and query_aggregate_states
+
+Revision ID: f7b3d8e2c604
+Revises: e4a8c1d7b592
+Create Date: 2026-10-17 19:05:12.318406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7b3d8e2c604'
+down_revision: Union[str, Sequence[str], None] = 'e4a8c1d7b592'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('query_aggregates',
+    sa.Column('search_query_id', sa.Integer(), nullable=False),
+    sa.Column('metric', sa.String(length=50), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('label', sa.String(length=255), nullable=True),
+    sa.Column('category', sa.String(length=255), nullable=True),
+    sa.Column('value', sa.Float(), nullable=True),
+    sa.Column('count', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['search_query_id'], ['search_queries.id'], ),
+    sa.PrimaryKeyConstraint('search_query_id', 'metric', 'position')
+    )
+    op.create_table('query_aggregate_states',
+    sa.Column('search_query_id', sa.Integer(), nullable=False),
+    sa.Column('data_version', sa.Integer(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['search_query_id'], ['search_queries.id'], ),
+    sa.PrimaryKeyConstraint('search_query_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('query_aggregate_states')
+    op.drop_table('query_aggregates')
@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from .models import CrawlRun, moscow_tz
+
+PHASE_LISTING = 'listing'
+PHASE_DETAILS = 'details'
+PHASE_RECONCILIATION = 'reconciliation'
+
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+
+MODE_FULL = 'full'
+MODE_INCREMENTAL = 'incremental'
+
+# Полный прогон нужен, чтобы заметить архивацию вакансий: инкрементальный видит только новые
+FULL_CRAWL_INTERVAL_DAYS = int(os.getenv('FULL_CRAWL_INTERVAL_DAYS', '7'))
+# Запас к watermark на расхождение часов и задержку индексации поиска HH
+WATERMARK_OVERLAP = timedelta(hours=1)
+
+
+def last_completed_run(session, search_query_id, mode=None):
+    query = session.query(CrawlRun).filter(CrawlRun.search_query_id == search_query_id,
+                                           CrawlRun.status == STATUS_COMPLETED)
+    if mode:
+        query = query.filter(CrawlRun.mode == mode)
+    return query.order_by(CrawlRun.started_at.desc()).first()
+
+
+def plan_mode(session, search_query_id, now=None):
+    """Режим нового прогона и watermark для инкрементального режима.
+
+    Инкрементальный прогон запрашивает вакансии, опубликованные после начала прошлого успешного
+    прогона. Полный прогон выполняется, если успешных прогонов еще не было или последний полный
+    был больше FULL_CRAWL_INTERVAL_DAYS дней назад.
+    """
+    now = now or datetime.now(moscow_tz).replace(tzinfo=None)
+    last_full = last_completed_run(session, search_query_id, MODE_FULL)
+    last = last_completed_run(session, search_query_id)
+    if last_full is None or _naive(last_full.started_at) < now - timedelta(days=FULL_CRAWL_INTERVAL_DAYS):
+        return MODE_FULL, None
+    return MODE_INCREMENTAL, _naive(last.started_at) - WATERMARK_OVERLAP
+
+
+def _naive(value):
+    # MySQL хранит московское время без часового пояса, несохраненные объекты его еще содержат
+    return value.replace(tzinfo=None)
+
+
+class CrawlCheckpoint:
+    """Сохраненное в crawl_runs состояние прогона поискового запроса.
+
+    Хранит фазу прогона, срезы выдачи и полученные страницы с размером снимка после каждой
+    из них. Повторная попытка или перезапуск в тот же день продолжают незавершенный прогон
+    с сохраненной точки. Уже записанные вакансии при продолжении не обрабатываются повторно:
+    их отсеивает сравнение с базой.
+    """
+
+    def __init__(self, session, run, resumed=False):
+        self.session = session
+        self.run = run
+        self.resumed = resumed
+        self._completed_pages = set(json.loads(run.completed_pages or '[]'))
+
+    @classmethod
+    def start(cls, session, search_query_id, run_date=None, force_full=False):
+        """Незавершенный прогон запроса за дату или новый прогон.
+
+        force_full=True делает новый прогон полным независимо от истории прогонов.
+        """
+        run_date = run_date or datetime.now(moscow_tz).date()
+        run = session.query(CrawlRun).filter(
+            CrawlRun.search_query_id == search_query_id,
+            CrawlRun.run_date == run_date,
+            CrawlRun.status != STATUS_COMPLETED,
+        ).order_by(CrawlRun.id.desc()).first()
+        resumed = run is not None
+        if run is None:
+            mode, watermark = (MODE_FULL, None) if force_full else plan_mode(session, search_query_id)
+            run = CrawlRun(search_query_id=search_query_id, run_date=run_date, phase=PHASE_LISTING,
+                           status=STATUS_RUNNING, mode=mode, watermark=watermark, snapshot_size=0, index_size=0)
+            session.add(run)
+        else:
+            logging.info(f"Resuming crawl run {run.id} for search query {search_query_id}: phase {run.phase}, "
+                         f"{len(json.loads(run.completed_pages or '[]'))} pages done")
+            run.status = STATUS_RUNNING
+        session.commit()
+        return cls(session, run, resumed)
+
+    @property
+    def phase(self):
+        return self.run.phase
+
+    @property
+    def mode(self):
+        return self.run.mode or MODE_FULL
+
+    @property
+    def watermark(self):
+        return self.run.watermark
+
+    @property
+    def partitions(self):
+        """Срезы выдачи, сохраненные при первом получении. None, если выдача еще не разбита."""
+        return json.loads(self.run.partitions) if self.run.partitions else None
+
+    def set_partitions(self, partitions):
+        self.run.partitions = json.dumps(partitions, ensure_ascii=False)
+        self.session.commit()
+
+    @property
+    def completed_pages(self):
+        return frozenset(self._completed_pages)
+
+    @property
+    def snapshot_sizes(self):
+        """Размеры снимка и индекса, до которых они обрезаются при продолжении."""
+        return self.run.snapshot_size or 0, self.run.index_size or 0
+
+    def page_done(self, page, pages, snapshot_sizes):
+        self._completed_pages.add(page)
+        self.run.pages = pages
+        self.run.completed_pages = json.dumps(sorted(self._completed_pages))
+        self.run.snapshot_size, self.run.index_size = snapshot_sizes
+        self.session.commit()
+
+    def set_phase(self, phase):
+        if self.run.phase != phase:
+            self.run.phase = phase
+            self.session.commit()
+
+    def reset(self):
+        """Начать прогон заново с получения выдачи."""
+        self._completed_pages = set()
+        self.run.phase = PHASE_LISTING
+        self.run.partitions = None
+        self.run.pages = None
+        self.run.completed_pages = None
+        self.run.snapshot_size = self.run.index_size = 0
+        self.session.commit()
+
+    def reload(self):
+        """Состояние из базы после отката сессии: несохраненные изменения теряются."""
+        self.session.refresh(self.run)
+        self._completed_pages = set(json.loads(self.run.completed_pages or '[]'))
+
+    def finish(self, status=STATUS_COMPLETED, error=None):
+        self.run.status = status
+        self.run.error = error
+        self.run.finished_at = datetime.now(moscow_tz)
+        self.session.commit()
+
+    def summary(self):
+        return (f"Прогон {self.run.id}{' (продолжен)' if self.resumed else ''}, режим {self.mode}: "
+                f"фаза {self.run.phase}, "
+                f"страниц получено {len(self._completed_pages)} из {self.run.pages or 0}")
@@ -0,0 +1,36 @@
+from datetime import datetime
+from sqlalchemy import select, update
+from .models import QueryDataVersion, SearchQuery, search_query_vacancies, moscow_tz
+from .upsert import insert_ignore
+
+
+def bump_data_versions(session, search_query_ids=None):
+    """Увеличение версии данных запросов без commit: версия меняется вместе с данными.
+
+    search_query_ids=None — все запросы (например, после обновления работодателей).
+    """
+    if search_query_ids is None:
+        search_query_ids = session.execute(select(SearchQuery.__table__.c.id)).scalars().all()
+    search_query_ids = sorted(set(search_query_ids))
+    if not search_query_ids:
+        return
+    table = QueryDataVersion.__table__
+    now = datetime.now(moscow_tz)
+    insert_ignore(session, table, [{'search_query_id': search_query_id, 'version': 0, 'updated_at': now}
+                                   for search_query_id in search_query_ids])
+    session.execute(update(table).where(table.c.search_query_id.in_(search_query_ids))
+                    .values(version=table.c.version + 1, updated_at=now))
+
+
+def queries_of_vacancies(session, vacancy_ids):
+    """Id поисковых запросов, с которыми связаны вакансии."""
+    if not vacancy_ids:
+        return []
+    return session.execute(select(search_query_vacancies.c.search_query_id.distinct()).where(
+        search_query_vacancies.c.vacancy_id.in_(list(vacancy_ids)))).scalars().all()
+
+
+def data_versions(session):
+    """Текущие версии данных всех запросов одним запросом: {search_query_id: версия}."""
+    table = QueryDataVersion.__table__
+    return dict(session.execute(select(table.c.search_query_id, table.c.version)).all())
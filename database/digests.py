@@ -0,0 +1,52 @@
+from datetime import datetime
+from sqlalchemy import select, update, tuple_
+from .models import DigestItem, SearchQuery, moscow_tz
+from .upsert import insert_ignore
+
+LOOKUP_CHUNK = 1000  # Строк в одном условии IN
+
+
+def _now():
+    # MySQL хранит московское время без часового пояса
+    return datetime.now(moscow_tz).replace(tzinfo=None)
+
+
+def record_digest_items(session, links, now=None):
+    """Запись новых вакансий запросов для сводного письма без commit.
+
+    links — новые связи {'search_query_id': ..., 'vacancy_id': ...}. Повторная запись той же
+    пары (повтор прогона) пропускается. Возвращает число переданных пар.
+    """
+    now = now or _now()
+    insert_ignore(session, DigestItem.__table__, [{'search_query_id': link['search_query_id'],
+                                                   'vacancy_id': link['vacancy_id'], 'created_at': now}
+                                                  for link in links])
+    return len(links)
+
+
+def pending_digest_items(session):
+    """Вакансии, еще не попавшие в письма: строки (search_query_id, vacancy_id, query, email)."""
+    items = DigestItem.__table__
+    queries = SearchQuery.__table__
+    return session.execute(
+        select(items.c.search_query_id, items.c.vacancy_id, queries.c.query, queries.c.email)
+        .join(queries, queries.c.id == items.c.search_query_id)
+        .where(items.c.digested_at.is_(None))
+        .order_by(items.c.search_query_id, items.c.vacancy_id)
+    ).all()
+
+
+def mark_digested(session, keys, now=None):
+    """Отметка пар (search_query_id, vacancy_id) отправленными без commit.
+
+    Отмечаются только переданные пары: вакансии, записанные параллельным сбором после чтения
+    очереди, попадут в следующее письмо.
+    """
+    now = now or _now()
+    items = DigestItem.__table__
+    keys = sorted(keys)
+    for start in range(0, len(keys), LOOKUP_CHUNK):
+        session.execute(update(items).where(
+            tuple_(items.c.search_query_id, items.c.vacancy_id).in_(keys[start:start + LOOKUP_CHUNK]),
+            items.c.digested_at.is_(None),
+        ).values(digested_at=now))
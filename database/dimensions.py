@@ -0,0 +1,78 @@
+import threading
+from sqlalchemy import event
+from .models import ExperienceLevel, ProfessionalRole, EmploymentForm, WorkingHours, WorkSchedule, WorkFormat, \
+    Industry
+from .upsert import insert_ignore
+
+DIMENSION_MODELS = (ExperienceLevel, ProfessionalRole, EmploymentForm, WorkingHours, WorkSchedule, WorkFormat,
+                    Industry)
+
+PENDING_KEY = 'pending_dimension_ids'
+
+
+class DimensionRegistry:
+    """Справочники id_external -> id, загружаемые в память один раз за прогон.
+
+    Неизвестные значения добавляются через INSERT IGNORE в транзакции вызывающей сессии.
+    Их id попадают в общий словарь только после commit, а при откате сессии забываются,
+    чтобы в памяти не оставались ссылки на невставленные строки.
+    """
+
+    def __init__(self, models=DIMENSION_MODELS):
+        self.models = models
+        self._ids = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self, session):
+        """Загрузка всех справочников одним запросом на таблицу."""
+        ids = {model: {str(id_external): id_ for id_external, id_ in session.query(model.id_external, model.id)}
+               for model in self.models}
+        with self._lock:
+            self._ids = ids
+            self._loaded = True
+
+    def resolve(self, session, model, item):
+        """id записи справочника для элемента вида {'id': ..., 'name': ...} из ответа HH."""
+        return self.resolve_many(session, model, [item])[0]
+
+    def resolve_many(self, session, model, items):
+        """id записей справочника для списка элементов с сохранением порядка."""
+        if not self._loaded:
+            self.load(session)
+        known = self._ids[model]
+        pending = self._pending(session).setdefault(model, {})
+        missing = {str(item['id']): item for item in items
+                   if str(item['id']) not in known and str(item['id']) not in pending}
+        if missing:
+            self._insert(session, model, missing.values(), pending)
+        return [known.get(str(item['id'])) or pending[str(item['id'])] for item in items]
+
+    def _insert(self, session, model, items, pending):
+        items = list(items)
+        insert_ignore(session, model.__table__, [{'id_external': item['id'], 'name': item['name']} for item in items])
+        # Блокирующее чтение видит строки, которые параллельный процесс вставил после начала нашей транзакции
+        rows = session.query(model.id_external, model.id).filter(
+            model.id_external.in_([item['id'] for item in items])).with_for_update(read=True).all()
+        pending.update({str(id_external): id_ for id_external, id_ in rows})
+
+    def _pending(self, session):
+        pending = session.info.get(PENDING_KEY)
+        if pending is None:
+            pending = session.info[PENDING_KEY] = {}
+            event.listen(session, 'after_commit', self._promote)
+            event.listen(session, 'after_soft_rollback', self._discard)
+        return pending
+
+    def _promote(self, session):
+        if session.in_nested_transaction():
+            return  # Освобождение точки сохранения еще не фиксирует данные
+        pending = session.info.get(PENDING_KEY, {})
+        with self._lock:
+            for model, ids in pending.items():
+                self._ids[model].update(ids)
+        pending.clear()
+
+    @staticmethod
+    def _discard(session, previous_transaction):
+        session.info.get(PENDING_KEY, {}).clear()
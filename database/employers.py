@@ -0,0 +1,119 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, func, and_, or_, tuple_, bindparam
+from .models import Employer, Industry, Vacancy, employer_industries, moscow_tz
+from .upsert import insert_ignore
+
+# Данные работодателя (число открытых вакансий, рейтинг, отрасли) обновляются не реже раза в TTL
+EMPLOYER_REFRESH_TTL = timedelta(days=int(os.getenv('EMPLOYER_REFRESH_TTL_DAYS', '7')))
+EMPLOYER_REFRESH_BATCH = int(os.getenv('EMPLOYER_REFRESH_BATCH', '100'))  # Работодателей в одной транзакции
+ACTIVE_STATUS = 'Активный'
+
+
+def _now():
+    # MySQL хранит московское время без часового пояса
+    return datetime.now(moscow_tz).replace(tzinfo=None)
+
+
+def stale_employers(session, limit, now=None, ttl=EMPLOYER_REFRESH_TTL):
+    """Работодатели, не обновлявшиеся дольше ttl, по убыванию числа их активных вакансий.
+
+    Возвращает строки (id, id_external, total_rating, reviews_count, active_vacancies).
+    """
+    employers = Employer.__table__
+    vacancies = Vacancy.__table__
+    active_vacancies = func.count(vacancies.c.id)
+    return session.execute(
+        select(employers.c.id, employers.c.id_external, employers.c.total_rating, employers.c.reviews_count,
+               active_vacancies.label('active_vacancies'))
+        .outerjoin(vacancies, and_(vacancies.c.employer_id == employers.c.id, vacancies.c.status == ACTIVE_STATUS))
+        .where(or_(employers.c.updated_at.is_(None), employers.c.updated_at < (now or _now()) - ttl))
+        .group_by(employers.c.id, employers.c.id_external, employers.c.total_rating, employers.c.reviews_count,
+                  employers.c.updated_at)
+        .order_by(active_vacancies.desc(), employers.c.updated_at)
+        .limit(limit)
+    ).all()
+
+
+def employer_values(employer, employer_details):
+    """Значения колонок работодателя из ответа employers/{id}.
+
+    Рейтинг приходит не во всех ответах HH: если его нет, сохраняется прежнее значение.
+    """
+    rating = employer_details.get('employer_rating') or {}
+    return {
+        'name': employer_details['name'],
+        'area': (employer_details.get('area') or {}).get('name'),
+        'accredited_it_employer': employer_details.get('accredited_it_employer', False),
+        'open_vacancies': employer_details.get('open_vacancies', 0),
+        'total_rating': float(rating.get('total_rating', employer.total_rating or 0.0)),
+        'reviews_count': int(rating.get('reviews_count', employer.reviews_count or 0)),
+    }
+
+
+def industries_hash(industry_ids):
+    """Хэш набора отраслей работодателя: не зависит от порядка и повторов."""
+    return hashlib.sha1(','.join(map(str, sorted(set(industry_ids)))).encode('utf-8')).hexdigest()
+
+
+def sync_employer_industries(session, industry_ids_by_employer):
+    """Приведение связей employer_industries к заданным наборам отраслей без commit.
+
+    industry_ids_by_employer — {id работодателя: id отраслей}. Работодатели, набор отраслей
+    которых не изменился с прошлой синхронизации (совпадает industries_hash), пропускаются.
+    Для остальных текущие связи читаются одним запросом, разница вычисляется в памяти:
+    недостающие связи добавляются одной вставкой, лишние удаляются одним DELETE,
+    новые хэши записываются одним UPDATE. Возвращает (добавлено, удалено).
+    """
+    if not industry_ids_by_employer:
+        return 0, 0
+    table = Employer.__table__
+    hashes = {employer_id: industries_hash(industry_ids)
+              for employer_id, industry_ids in industry_ids_by_employer.items()}
+    stored = dict(session.execute(select(table.c.id, table.c.industries_hash).where(
+        table.c.id.in_(list(hashes)))).all())
+    changed = [employer_id for employer_id, value in hashes.items() if stored.get(employer_id) != value]
+    if not changed:
+        return 0, 0
+    wanted = {(employer_id, industry_id)
+              for employer_id in changed for industry_id in industry_ids_by_employer[employer_id]}
+    current = set(session.execute(select(employer_industries.c.employer_id, employer_industries.c.industry_id).where(
+        employer_industries.c.employer_id.in_(changed))).all())
+    added, removed = wanted - current, current - wanted
+    insert_ignore(session, employer_industries, [{'employer_id': employer_id, 'industry_id': industry_id}
+                                                 for employer_id, industry_id in sorted(added)])
+    if removed:
+        session.execute(delete(employer_industries).where(
+            tuple_(employer_industries.c.employer_id, employer_industries.c.industry_id).in_(sorted(removed))))
+    session.execute(update(table).where(table.c.id == bindparam('b_id')),
+                    [{'b_id': employer_id, 'industries_hash': hashes[employer_id]} for employer_id in changed])
+    return len(added), len(removed)
+
+
+def apply_employer_details(session, dimensions, employers, employer_details, not_found_ids=(), now=None):
+    """Запись обновленных данных работодателей без commit.
+
+    employers — строки stale_employers, employer_details — ответы HH по id_external. Колонки
+    обновляются одним UPDATE executemany, отрасли — sync_employer_industries. Работодателям
+    с ответом 404 только сдвигается updated_at, чтобы они не запрашивались в каждом запуске.
+    Работодатели, которых нет ни в одном из списков (ошибка запроса), не меняются.
+    Возвращает число обновленных работодателей.
+    """
+    now = now or _now()
+    table = Employer.__table__
+    not_found_ids = {str(employer_id) for employer_id in not_found_ids}
+    updates, touched, industries = [], [], {}
+    for employer in employers:
+        details = employer_details.get(str(employer.id_external))
+        if details is not None:
+            updates.append({'b_id': employer.id, **employer_values(employer, details), 'updated_at': now})
+            industries[employer.id] = dimensions.resolve_many(session, Industry, details.get('industries', []))
+        elif str(employer.id_external) in not_found_ids:
+            touched.append(employer.id)
+    if updates:
+        session.execute(update(table).where(table.c.id == bindparam('b_id')), updates)
+    if touched:
+        session.execute(update(table).where(table.c.id.in_(touched)).values(updated_at=now))
+    sync_employer_industries(session, industries)
+    return len(updates)
@@ -0,0 +1,227 @@
+import logging
+import os
+from datetime import datetime
+from sqlalchemy import select
+from .models import Vacancy, ExperienceLevel, ProfessionalRole, EmploymentForm, WorkingHours, WorkSchedule, \
+    WorkFormat, SalaryHistory, VacancyStatusHistory, search_query_vacancies, vacancy_work_formats, \
+    vacancy_work_schedules, moscow_tz
+from .refresh import payload_hash
+from .digests import record_digest_items
+from .skills import reconcile_key_skills
+from .upsert import insert_ignore
+
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '50'))  # Вакансий в одной транзакции
+
+
+def parse_datetime(date_str):
+    """Преобразуем строку даты в формат, который понимает MySQL."""
+    dt = datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S%z')
+    return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def parse_salary(vacancy_details):
+    """Данные о зарплате только из salary_range. None, если границы не указаны."""
+    salary_range_data = vacancy_details.get('salary_range')
+    if not salary_range_data or (salary_range_data.get('from') is None and salary_range_data.get('to') is None):
+        return None
+    mode = salary_range_data.get('mode') or {}
+    return {
+        'salary_from': salary_range_data.get('from'),
+        'salary_to': salary_range_data.get('to'),
+        'currency': salary_range_data.get('currency', 'RUB'),
+        'mode_id': mode.get('id'),
+        'mode_name': mode.get('name'),
+    }
+
+
+def build_vacancy_record(session, dimensions, vacancy_data, vacancy_details, employer_id, area_name,
+                         search_query_ids):
+    """Полностью разрешенная запись вакансии: все внешние ключи уже переведены во внутренние id."""
+    return {
+        'external_id': vacancy_data['id'],
+        'vacancy': {
+            'external_id': vacancy_data['id'],
+            'title': vacancy_data['name'],
+            'employer_id': employer_id,
+            'area': area_name,
+            'experience_id': dimensions.resolve(session, ExperienceLevel, vacancy_details['experience']),
+            'professional_role_id': dimensions.resolve(session, ProfessionalRole,
+                                                       vacancy_details['professional_roles'][0]),
+            'employment_form_id': dimensions.resolve(session, EmploymentForm, vacancy_details['employment_form']),
+            'working_hours_id': dimensions.resolve(session, WorkingHours, vacancy_details['working_hours'][0]),
+            'status': 'Активный' if not vacancy_data.get('archived', False) else 'Архивный',
+            'created_date': parse_datetime(
+                vacancy_details['initial_created_at']) if 'created_at' in vacancy_details else None,
+            'published_date': parse_datetime(
+                vacancy_details['published_at']) if 'published_at' in vacancy_details else None,
+            'payload_hash': payload_hash(vacancy_data),
+        },
+        'salary': parse_salary(vacancy_details),
+        'key_skills': [skill['name'] for skill in vacancy_details.get('key_skills', [])],
+        'work_schedule_ids': list(dict.fromkeys(dimensions.resolve_many(
+            session, WorkSchedule, vacancy_details.get('work_schedule_by_days', [])))),
+        'work_format_ids': list(dict.fromkeys(dimensions.resolve_many(
+            session, WorkFormat, vacancy_details.get('work_format', [])))),
+        'search_query_ids': list(search_query_ids),
+    }
+
+
+def initial_status_row(vacancy_id, created_at):
+    return {
+        'vacancy_id': vacancy_id,
+        'prev_status': 'Отсутствует',
+        'cur_status': 'Активный',
+        'created_at_prev_status': created_at,
+        'created_at_cur_status': created_at,
+        'duration': 0,
+        'type_changed': 'Первичная загрузка',
+    }
+
+
+def save_vacancy(session, record):
+    """Запись одной вакансии через ORM одной транзакцией."""
+    vacancy = Vacancy(**record['vacancy'])
+    session.add(vacancy)
+    session.flush()  # Получаем id вакансии
+
+    for search_query_id in record['search_query_ids']:
+        session.execute(search_query_vacancies.insert().values(search_query_id=search_query_id,
+                                                               vacancy_id=vacancy.id))
+    reconcile_key_skills(session, {vacancy.id: record['key_skills']})
+    if record['salary']:
+        session.add(SalaryHistory(vacancy_id=vacancy.id, **record['salary']))
+    session.add(VacancyStatusHistory(**initial_status_row(vacancy.id, vacancy.created_at)))
+    for work_format_id in record['work_format_ids']:
+        session.execute(vacancy_work_formats.insert().values(vacancy_id=vacancy.id, work_format_id=work_format_id))
+    for work_schedule_id in record['work_schedule_ids']:
+        session.execute(vacancy_work_schedules.insert().values(vacancy_id=vacancy.id,
+                                                               work_schedule_id=work_schedule_id))
+    session.commit()
+    return vacancy
+
+
+def insert_rows(session, table, rows):
+    """Многострочная вставка, пустой список пропускается."""
+    if rows:
+        session.execute(table.insert(), rows)
+
+
+def insert_vacancies(session, rows):
+    """Многострочная вставка вакансий без ORM-объектов, возвращает {external_id: id}.
+
+    Где драйвер поддерживает RETURNING для executemany, id приходят вместе со вставкой.
+    Для MySQL id читаются одним запросом по уникальному external_id, диапазоны lastrowid
+    не используются: при параллельной вставке они не гарантированно непрерывны.
+    """
+    table = Vacancy.__table__
+    if session.get_bind().dialect.insert_executemany_returning:
+        result = session.execute(table.insert().returning(table.c.external_id, table.c.id), rows)
+        return dict(result.all())
+    session.execute(table.insert(), rows)
+    return dict(session.execute(select(table.c.external_id, table.c.id).where(
+        table.c.external_id.in_([row['external_id'] for row in rows]))).all())
+
+
+def write_vacancies(session, records):
+    """Запись пакета вакансий и их дочерних строк многострочными вставками Core без commit."""
+    now = datetime.now(moscow_tz)
+    ids = insert_vacancies(session, [{**record['vacancy'], 'created_at': now, 'updated_at': now}
+                                     for record in records])
+
+    def rows(key, build):
+        return [build(ids[record['external_id']], value) for record in records for value in record[key]]
+
+    insert_rows(session, search_query_vacancies, rows(
+        'search_query_ids', lambda vacancy_id, value: {'search_query_id': value, 'vacancy_id': vacancy_id}))
+    insert_rows(session, SalaryHistory.__table__, [
+        {'vacancy_id': ids[record['external_id']], 'is_active': True, 'created_at': now, 'updated_at': now,
+         **record['salary']} for record in records if record['salary']])
+    insert_rows(session, VacancyStatusHistory.__table__,
+                [initial_status_row(vacancy_id, now) for vacancy_id in ids.values()])
+    insert_rows(session, vacancy_work_formats, rows(
+        'work_format_ids', lambda vacancy_id, value: {'vacancy_id': vacancy_id, 'work_format_id': value}))
+    insert_rows(session, vacancy_work_schedules, rows(
+        'work_schedule_ids', lambda vacancy_id, value: {'vacancy_id': vacancy_id, 'work_schedule_id': value}))
+    reconcile_key_skills(session, {ids[record['external_id']]: record['key_skills'] for record in records})
+    return ids
+
+
+class VacancyBatch:
+    """Накопление готовых записей вакансий и запись их одной транзакцией.
+
+    Пакет сначала записывается целиком в одной точке сохранения. Если это не удалось,
+    вакансии записываются по одной, каждая в своей точке сохранения, так что ошибочная
+    запись не отменяет остальные. Каждая новая связь вакансии с запросом попадает в digest_items
+    той же транзакцией: зафиксированная вакансия не может остаться без письма, даже если прогон
+    упадет позже и при повторе она уже не будет новой.
+    """
+
+    def __init__(self, session, batch_size=INGEST_BATCH_SIZE):
+        self.session = session
+        self.batch_size = batch_size
+        self.records = []
+        self.links = []
+        self.written_ids = []
+        self.failed_ids = []
+        self.batches = 0
+
+    def add(self, record):
+        self.records.append(record)
+        if len(self.records) >= self.batch_size:
+            self.flush()
+
+    def link(self, search_query_id, vacancy_id):
+        """Связь уже существующей вакансии с поисковым запросом, записывается вместе с пакетом."""
+        self.links.append({'search_query_id': search_query_id, 'vacancy_id': vacancy_id})
+
+    def flush(self):
+        if not self.records and not self.links:
+            return
+        records, self.records = self.records, []
+        written, ids = [], {}
+        if records:
+            try:
+                with self.session.begin_nested():
+                    ids = write_vacancies(self.session, records)
+                written = records
+            except Exception as e:
+                logging.warning(f"Batch of {len(records)} vacancies failed, retrying one by one: {str(e)}")
+                for record in records:
+                    try:
+                        with self.session.begin_nested():
+                            ids.update(write_vacancies(self.session, [record]))
+                        written.append(record)
+                    except Exception as e:
+                        vacancy_id = self._existing_id(record['external_id'])
+                        if vacancy_id is not None:
+                            # Вакансию уже записал параллельный процесс сбора: достаточно связать ее с запросами
+                            self.links.extend({'search_query_id': search_query_id, 'vacancy_id': vacancy_id}
+                                              for search_query_id in record['search_query_ids'])
+                            written.append(record)
+                            continue
+                        logging.error(f"Error loading vacancy {record['external_id']}: {str(e)}")
+                        self.failed_ids.append(record['external_id'])
+        insert_ignore(self.session, search_query_vacancies, self.links)
+        record_digest_items(self.session, self.links + [
+            {'search_query_id': search_query_id, 'vacancy_id': ids[record['external_id']]}
+            for record in written if record['external_id'] in ids for search_query_id in record['search_query_ids']])
+        self.links = []
+        self.session.commit()
+        self.batches += 1
+        self.written_ids.extend(record['external_id'] for record in written)
+        logging.info(f"Batch {self.batches} committed: {len(written)} vacancies written, "
+                     f"{len(records) - len(written)} failed")
+
+    def _existing_id(self, external_id):
+        # Блокирующее чтение видит вакансию, зафиксированную другой транзакцией после начала нашей
+        return self.session.execute(select(Vacancy.__table__.c.id).where(
+            Vacancy.__table__.c.external_id == external_id).with_for_update(read=True)).scalar()
+
+    def discard(self):
+        """Сброс незаписанных данных после отката транзакции вызывающим кодом."""
+        self.records = []
+        self.links = []
+
+    def summary(self):
+        return (f"Размер пакета: {self.batch_size}, пакетов: {self.batches}, записано вакансий: "
+                f"{len(self.written_ids)}, с ошибками: {len(self.failed_ids)}")
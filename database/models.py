@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, DECIMAL, DateTime, Table, Boolean, Float
+from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, DECIMAL, DateTime, Table, Boolean, Float, \
+    Date, Text, Index
+from sqlalchemy.dialects.mysql import MEDIUMTEXT
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -29,7 +31,9 @@ vacancy_work_schedules = Table(
 search_query_vacancies = Table(
     'search_query_vacancies', Base.metadata,
     Column('search_query_id', Integer, ForeignKey('search_queries.id'), primary_key=True),
-    Column('vacancy_id', Integer, ForeignKey('vacancies.id'), primary_key=True)
+    Column('vacancy_id', Integer, ForeignKey('vacancies.id'), primary_key=True),
+    # Обратный поиск запросов вакансии: первичный ключ начинается с search_query_id
+    Index('ix_search_query_vacancies_vacancy', 'vacancy_id', 'search_query_id')
 )
 
 
@@ -58,6 +62,7 @@ class Employer(Base):
     open_vacancies = Column(Integer)
     total_rating = Column(Float, nullable=True, default=0.0)
     reviews_count = Column(Integer, nullable=True, default=0)
+    industries_hash = Column(String(40))  # Хэш набора отраслей при последней синхронизации employer_industries
     created_at = Column(DateTime, default=lambda: datetime.now(moscow_tz))
     updated_at = Column(DateTime, default=lambda: datetime.now(moscow_tz), onupdate=lambda: datetime.now(moscow_tz))
 
@@ -129,6 +134,7 @@ class WorkSchedule(Base):
 
 class Vacancy(Base):
     __tablename__ = 'vacancies'
+    __table_args__ = (Index('ix_vacancies_employer_status', 'employer_id', 'status'),)
     # Определение колонок
     id = Column(Integer, primary_key=True, autoincrement=True)
     external_id = Column(String(255), unique=True, nullable=False)
@@ -144,6 +150,7 @@ class Vacancy(Base):
     updated_at = Column(DateTime, default=lambda: datetime.now(moscow_tz), onupdate=lambda: datetime.now(moscow_tz))
     created_date = Column(DateTime)
     published_date = Column(DateTime)
+    payload_hash = Column(String(40))  # Хэш полей вакансии из выдачи поиска, см. database/refresh.py
     # Определение отношений
     employer = relationship("Employer")
     experience = relationship("ExperienceLevel")
@@ -162,6 +169,7 @@ class Vacancy(Base):
 
 class SalaryHistory(Base):
     __tablename__ = 'salary_history'
+    __table_args__ = (Index('ix_salary_history_vacancy_active', 'vacancy_id', 'is_active'),)
 
     # Определение колонок
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -181,6 +189,7 @@ class SalaryHistory(Base):
 
 class VacancyStatusHistory(Base):
     __tablename__ = 'vacancy_status_history'
+    __table_args__ = (Index('ix_vacancy_status_history_vacancy', 'vacancy_id', 'id'),)
 
     # Определение колонок
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -212,6 +221,7 @@ class SearchQuery(Base):
 
 class KeySkillHistory(Base):
     __tablename__ = 'key_skill_history'
+    __table_args__ = (Index('ix_key_skill_history_vacancy_active', 'vacancy_id', 'is_active', 'key_skill_id'),)
 
     # Определение колонок
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -225,3 +235,126 @@ class KeySkillHistory(Base):
     # Определение отношений
     key_skill = relationship("KeySkill")
     vacancy = relationship("Vacancy", back_populates="key_skill_history")
+
+
+class CrawlRun(Base):
+    __tablename__ = 'crawl_runs'
+    __table_args__ = (Index('ix_crawl_runs_query_date', 'search_query_id', 'run_date'),)
+
+    # Определение колонок
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    search_query_id = Column(Integer, ForeignKey('search_queries.id'), nullable=False)
+    run_date = Column(Date, nullable=False)  # Дата прогона, совпадает с датой снимка выдачи
+    phase = Column(String(50), nullable=False)  # listing, details, reconciliation
+    mode = Column(String(20))  # full — вся выдача, incremental — только опубликованные после watermark
+    watermark = Column(DateTime)  # Нижняя граница даты публикации для инкрементального прогона
+    status = Column(String(50), nullable=False)  # running, completed, failed
+    partitions = Column(Text)  # JSON-список срезов запроса, на которые разбита выдача
+    pages = Column(Integer)  # Всего страниц в выдаче
+    completed_pages = Column(Text)  # JSON-список полученных страниц
+    snapshot_size = Column(Integer, default=0)  # Размер снимка и индекса после последней полученной страницы
+    index_size = Column(Integer, default=0)
+    error = Column(Text)
+    started_at = Column(DateTime, default=lambda: datetime.now(moscow_tz))
+    updated_at = Column(DateTime, default=lambda: datetime.now(moscow_tz), onupdate=lambda: datetime.now(moscow_tz))
+    finished_at = Column(DateTime)
+    # Определение отношений
+    search_query = relationship("SearchQuery")
+
+
+class VacancyVerification(Base):
+    __tablename__ = 'vacancy_verifications'
+    __table_args__ = (Index('ix_vacancy_verifications_due', 'status', 'next_check_at'),)
+
+    # Определение колонок
+    vacancy_id = Column(Integer, ForeignKey('vacancies.id'), primary_key=True)
+    status = Column(String(20), nullable=False)  # pending — ждет проверки, gone — удалена с HH (404)
+    misses = Column(Integer, nullable=False, default=1)  # Полных прогонов подряд, в выдаче которых вакансии нет
+    last_missed_on = Column(Date, nullable=False)  # Дата последнего пропуска, пропуск учитывается раз в день
+    not_found = Column(Integer, nullable=False, default=0)  # Ответов 404 подряд
+    next_check_at = Column(DateTime)  # Время следующей проверки, None — пропусков еще недостаточно
+    last_checked_at = Column(DateTime)
+    created_at = Column(DateTime, default=lambda: datetime.now(moscow_tz))
+    # Определение отношений
+    vacancy = relationship("Vacancy")
+
+
+class CrawlTask(Base):
+    __tablename__ = 'crawl_tasks'
+    __table_args__ = (Index('ix_crawl_tasks_available', 'status', 'available_at'),
+                      Index('ix_crawl_tasks_lease', 'status', 'lease_expires_at'))
+
+    # Определение колонок
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(50), nullable=False)  # crawl — группа запросов, verify — пакет проверки вакансий
+    task_key = Column(String(255), nullable=False, unique=True)  # Ключ, исключающий повторную постановку задачи
+    payload = Column(Text, nullable=False)  # JSON с параметрами задачи
+    status = Column(String(20), nullable=False)  # pending, leased, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, nullable=False)  # Не раньше этого времени задача может быть взята
+    lease_owner = Column(String(255))  # Исполнитель: узел, процесс и поток
+    lease_expires_at = Column(DateTime)  # После этого времени задачу может забрать другой исполнитель
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=lambda: datetime.now(moscow_tz))
+    updated_at = Column(DateTime, default=lambda: datetime.now(moscow_tz), onupdate=lambda: datetime.now(moscow_tz))
+    finished_at = Column(DateTime)
+
+
+class EmailOutbox(Base):
+    __tablename__ = 'email_outbox'
+    __table_args__ = (Index('ix_email_outbox_due', 'status', 'available_at'),)
+
+    # Определение колонок
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    recipient = Column(String(255), nullable=False)
+    subject = Column(String(255), nullable=False)
+    body = Column(Text().with_variant(MEDIUMTEXT(), 'mysql'), nullable=False)  # HTML письма
+    status = Column(String(20), nullable=False)  # pending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, nullable=False)  # Не раньше этого времени письмо может быть отправлено
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=lambda: datetime.now(moscow_tz))
+    sent_at = Column(DateTime)
+
+
+class DigestItem(Base):
+    __tablename__ = 'digest_items'
+    __table_args__ = (Index('ix_digest_items_pending', 'digested_at'),)
+
+    # Новая вакансия поискового запроса, ожидающая сводного письма получателю
+    search_query_id = Column(Integer, ForeignKey('search_queries.id'), primary_key=True)
+    vacancy_id = Column(Integer, ForeignKey('vacancies.id'), primary_key=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(moscow_tz))
+    digested_at = Column(DateTime)  # Когда вакансия попала в письмо
+
+
+class QueryDataVersion(Base):
+    __tablename__ = 'query_data_versions'
+
+    # Версия данных поискового запроса: увеличивается в транзакции, изменившей его вакансии,
+    # по ней сбрасывается кэш ответов API
+    search_query_id = Column(Integer, ForeignKey('search_queries.id'), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=lambda: datetime.now(moscow_tz), onupdate=lambda: datetime.now(moscow_tz))
+
+
+class QueryAggregate(Base):
+    __tablename__ = 'query_aggregates'
+
+    # Строка предрасчитанной сводки дашборда по поисковому запросу, см. database/aggregates.py
+    search_query_id = Column(Integer, ForeignKey('search_queries.id'), primary_key=True)
+    metric = Column(String(50), primary_key=True)  # Сводка: top_skills, work_formats, salaries, ...
+    position = Column(Integer, primary_key=True)  # Порядок строк в ответе API
+    label = Column(String(255))
+    category = Column(String(255))
+    value = Column(Float)
+    count = Column(Integer)
+
+
+class QueryAggregateState(Base):
+    __tablename__ = 'query_aggregate_states'
+
+    # Версия данных запроса (query_data_versions), по которой посчитаны его сводки
+    search_query_id = Column(Integer, ForeignKey('search_queries.id'), primary_key=True)
+    data_version = Column(Integer, nullable=False)
+    computed_at = Column(DateTime)
@@ -0,0 +1,80 @@
+import logging
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, bindparam
+from .models import EmailOutbox, moscow_tz
+
+EMAIL_PENDING = 'pending'
+EMAIL_SENT = 'sent'
+EMAIL_FAILED = 'failed'
+
+EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', '20'))  # Писем в одной транзакции отправителя
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '6'))
+EMAIL_RETRY_DELAY = timedelta(minutes=1)  # Отсрочка повтора, удваивается с каждой попыткой
+
+
+def _now():
+    # MySQL хранит московское время без часового пояса
+    return datetime.now(moscow_tz).replace(tzinfo=None)
+
+
+def enqueue_email(session, subject, body, recipient, now=None):
+    """Постановка письма в очередь email_outbox без commit: письмо уходит вместе с транзакцией вызывающего кода.
+
+    Письма без адреса (например, не задан ADMIN_EMAIL) не ставятся. Возвращает True, если письмо поставлено.
+    """
+    if not recipient:
+        logging.warning(f"Email '{subject}' has no recipient and was not queued")
+        return False
+    now = now or _now()
+    session.execute(EmailOutbox.__table__.insert(), [{
+        'recipient': recipient, 'subject': subject, 'body': body, 'status': EMAIL_PENDING, 'attempts': 0,
+        'available_at': now, 'created_at': now,
+    }])
+    return True
+
+
+def due_emails(session, limit=EMAIL_BATCH_SIZE, now=None):
+    """Письма, срок отправки которых наступил, в порядке очереди.
+
+    Строки блокируются до commit вызывающего кода через SKIP LOCKED, поэтому несколько
+    отправителей не отправляют одно письмо дважды.
+    """
+    outbox = EmailOutbox.__table__
+    return session.execute(
+        select(outbox.c.id, outbox.c.recipient, outbox.c.subject, outbox.c.body, outbox.c.attempts)
+        .where(outbox.c.status == EMAIL_PENDING, outbox.c.available_at <= (now or _now()))
+        .order_by(outbox.c.available_at, outbox.c.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+
+def deliver(session, transport, limit=EMAIL_BATCH_SIZE, now=None):
+    """Отправка пакета писем через transport и запись результатов одной транзакцией.
+
+    transport — объект с методом send(subject, body, recipient). Письмо с ошибкой отправки
+    повторяется с удваивающейся задержкой, после EMAIL_MAX_ATTEMPTS попыток отмечается failed.
+    Возвращает (id отправленных, id с ошибкой).
+    """
+    now = now or _now()
+    emails = due_emails(session, limit, now)
+    sent, updates = [], []
+    for email in emails:
+        try:
+            transport.send(email.subject, email.body, email.recipient)
+        except Exception as e:
+            attempts = email.attempts + 1
+            status = EMAIL_FAILED if attempts >= EMAIL_MAX_ATTEMPTS else EMAIL_PENDING
+            logging.error(f"Failed to send email {email.id} to {email.recipient} (attempt {attempts}): {str(e)}")
+            updates.append({'b_id': email.id, 'status': status, 'attempts': attempts, 'last_error': str(e),
+                            'available_at': now + EMAIL_RETRY_DELAY * 2 ** (attempts - 1)})
+            continue
+        sent.append(email.id)
+    outbox = EmailOutbox.__table__
+    if sent:
+        session.execute(update(outbox).where(outbox.c.id.in_(sent)).values(status=EMAIL_SENT, sent_at=now))
+    if updates:
+        session.execute(update(outbox).where(outbox.c.id == bindparam('b_id')), updates)
+    session.commit()
+    return sent, [update_row['b_id'] for update_row in updates]
@@ -0,0 +1,53 @@
+import hashlib
+import json
+from sqlalchemy import select, update, bindparam
+from .models import Vacancy
+from .verification import ARCHIVED_STATUS
+
+# Поля вакансии из выдачи поиска, изменение которых требует обновления истории вакансии
+PAYLOAD_FIELDS = ('name', 'salary', 'salary_range', 'archived', 'published_at')
+LOOKUP_CHUNK = 1000  # id в одном условии IN
+
+
+def payload_hash(vacancy_data):
+    """Хэш полей PAYLOAD_FIELDS вакансии из выдачи: ключи сортируются, отсутствующее поле равно null."""
+    payload = json.dumps({field: vacancy_data.get(field) for field in PAYLOAD_FIELDS},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def archived_hash(listing_hash):
+    """Хэш, который записывается архивной вакансии, если детали подтвердили архив при такой выдаче.
+
+    Отличается от хэша выдачи, поэтому вакансия снова выбирается для обновления, только когда
+    ее выдача изменится, а не в каждом прогоне.
+    """
+    return hashlib.sha1(f'archived:{listing_hash}'.encode('utf-8')).hexdigest()
+
+
+def changed_vacancies(session, hashes, archived_ids=()):
+    """External_id сохраненных вакансий, которые нужно обновить по выдаче, без commit.
+
+    hashes — {external_id: payload_hash} вакансий из выдачи, archived_ids — вакансии, которые
+    выдача отмечает архивными. Обновляются вакансии с изменившимся хэшем и архивные вакансии,
+    снова активные в выдаче, если архив не был подтвержден деталями при той же выдаче. Вакансиям без хэша (сохраненным до его
+    появления) хэш записывается без обновления, чтобы первый прогон не запрашивал детали всех вакансий.
+    """
+    table = Vacancy.__table__
+    external_ids = list(hashes)
+    changed, baseline = [], []
+    for start in range(0, len(external_ids), LOOKUP_CHUNK):
+        rows = session.execute(select(table.c.external_id, table.c.payload_hash, table.c.status).where(
+            table.c.external_id.in_(external_ids[start:start + LOOKUP_CHUNK]))).all()
+        for external_id, stored_hash, status in rows:
+            listing_hash = hashes[external_id]
+            if stored_hash == archived_hash(listing_hash):
+                continue
+            revived = status == ARCHIVED_STATUS and external_id not in archived_ids
+            if revived or (stored_hash is not None and stored_hash != listing_hash):
+                changed.append(external_id)
+            elif stored_hash is None:
+                baseline.append({'b_external_id': external_id, 'payload_hash': listing_hash})
+    if baseline:
+        session.execute(update(table).where(table.c.external_id == bindparam('b_external_id')), baseline)
+    return changed
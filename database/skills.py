@@ -0,0 +1,73 @@
+import logging
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import update
+from .models import KeySkill, KeySkillHistory, moscow_tz
+from .upsert import insert_ignore
+
+
+def _fold(name):
+    # MySQL сравнивает строки без учета регистра, поэтому сопоставляем названия так же
+    return name.strip().casefold()
+
+
+def resolve_key_skills(session, names):
+    """id ключевых навыков по названиям: один запрос IN, недостающие добавляются INSERT IGNORE."""
+    names = set(names)
+    if not names:
+        return {}
+    ids = {_fold(name): id_ for name, id_ in session.query(KeySkill.name, KeySkill.id).filter(
+        KeySkill.name.in_(names))}
+    missing = [name for name in names if _fold(name) not in ids]
+    if missing:
+        insert_ignore(session, KeySkill.__table__, [{'name': name} for name in missing])
+        # Блокирующее чтение видит навыки, добавленные параллельным процессом
+        ids.update({_fold(name): id_ for name, id_ in session.query(KeySkill.name, KeySkill.id).filter(
+            KeySkill.name.in_(missing)).with_for_update(read=True)})
+    return {name: ids[_fold(name)] for name in names}
+
+
+def reconcile_key_skills(session, skills_by_vacancy):
+    """Приведение key_skill_history к актуальным навыкам для одной или нескольких вакансий.
+
+    skills_by_vacancy: {vacancy_id: список названий навыков}. Разница с историей считается
+    в памяти и применяется несколькими пакетными UPDATE/INSERT. commit выполняет вызывающий код.
+    """
+    if not skills_by_vacancy:
+        return {'added': 0, 'deactivated': 0, 'reactivated': 0}
+    skill_ids = resolve_key_skills(session, {name for names in skills_by_vacancy.values() for name in names})
+
+    history = defaultdict(list)  # (vacancy_id, key_skill_id) -> [(id, is_active)]
+    for history_id, vacancy_id, key_skill_id, is_active in session.query(
+            KeySkillHistory.id, KeySkillHistory.vacancy_id, KeySkillHistory.key_skill_id,
+            KeySkillHistory.is_active).filter(KeySkillHistory.vacancy_id.in_(list(skills_by_vacancy))):
+        history[(vacancy_id, key_skill_id)].append((history_id, is_active))
+
+    targets = {vacancy_id: {skill_ids[name] for name in names} for vacancy_id, names in skills_by_vacancy.items()}
+    to_add, to_deactivate, to_reactivate = [], [], []
+    for vacancy_id, target in targets.items():
+        for key_skill_id in target:
+            rows = history.get((vacancy_id, key_skill_id))
+            if not rows:
+                to_add.append({'vacancy_id': vacancy_id, 'key_skill_id': key_skill_id})
+            elif not any(is_active for _, is_active in rows):
+                # Навык вернулся в вакансию: активируем последнюю запись вместо создания новой
+                to_reactivate.append(max(history_id for history_id, _ in rows))
+    for (vacancy_id, key_skill_id), rows in history.items():
+        if key_skill_id not in targets[vacancy_id]:
+            to_deactivate.extend(history_id for history_id, is_active in rows if is_active)
+
+    now = datetime.now(moscow_tz)
+    if to_deactivate:
+        session.execute(update(KeySkillHistory.__table__).where(KeySkillHistory.id.in_(to_deactivate)).values(
+            is_active=False, updated_at=now))
+    if to_reactivate:
+        session.execute(update(KeySkillHistory.__table__).where(KeySkillHistory.id.in_(to_reactivate)).values(
+            is_active=True, updated_at=now))
+    if to_add:
+        session.execute(KeySkillHistory.__table__.insert(),
+                        [{**row, 'is_active': True, 'created_at': now, 'updated_at': now} for row in to_add])
+
+    stats = {'added': len(to_add), 'deactivated': len(to_deactivate), 'reactivated': len(to_reactivate)}
+    logging.info(f"Key skills reconciled for {len(skills_by_vacancy)} vacancies: {stats}")
+    return stats
@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, and_, or_
+from .models import CrawlTask, moscow_tz
+from .upsert import insert_ignore
+
+TASK_PENDING = 'pending'
+TASK_LEASED = 'leased'
+TASK_DONE = 'done'
+TASK_FAILED = 'failed'
+
+TASK_LEASE_SECONDS = int(os.getenv('TASK_LEASE_SECONDS', '300'))  # Аренда задачи без продления
+TASK_MAX_ATTEMPTS = int(os.getenv('TASK_MAX_ATTEMPTS', '3'))
+TASK_RETRY_DELAY = timedelta(minutes=5)  # Отсрочка повтора, удваивается с каждой попыткой
+
+
+def _now():
+    # MySQL хранит московское время без часового пояса
+    return datetime.now(moscow_tz).replace(tzinfo=None)
+
+
+def worker_name():
+    """Имя исполнителя, уникальное между узлами, процессами и потоками."""
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'
+
+
+def enqueue(session, kind, payload, key, available_at=None):
+    """Добавление задачи без commit. Задача с тем же key уже в очереди — повторно не добавляется."""
+    now = _now()
+    insert_ignore(session, CrawlTask.__table__, [{
+        'kind': kind, 'task_key': key, 'payload': json.dumps(payload, ensure_ascii=False), 'status': TASK_PENDING,
+        'attempts': 0, 'available_at': available_at or now, 'created_at': now, 'updated_at': now,
+    }])
+
+
+def claim(session, worker, kinds=None, limit=1, lease_seconds=TASK_LEASE_SECONDS, now=None):
+    """Аренда до limit доступных задач исполнителем worker с commit.
+
+    Доступны ожидающие задачи, срок которых наступил, и задачи с истекшей арендой (исполнитель
+    упал или завис). Строки выбираются через SELECT ... FOR UPDATE SKIP LOCKED, поэтому
+    исполнители на разных узлах не ждут друг друга и не получают одну задачу дважды.
+    Возвращает задачи словарями с разобранным payload.
+    """
+    now = now or _now()
+    tasks = CrawlTask.__table__
+    query = select(tasks.c.id).where(or_(
+        and_(tasks.c.status == TASK_PENDING, tasks.c.available_at <= now),
+        and_(tasks.c.status == TASK_LEASED, tasks.c.lease_expires_at < now),
+    ))
+    if kinds:
+        query = query.where(tasks.c.kind.in_(kinds))
+    ids = session.execute(query.order_by(tasks.c.available_at, tasks.c.id).limit(limit)
+                          .with_for_update(skip_locked=True)).scalars().all()
+    if not ids:
+        session.commit()
+        return []
+    session.execute(update(tasks).where(tasks.c.id.in_(ids)).values(
+        status=TASK_LEASED, lease_owner=worker, lease_expires_at=now + timedelta(seconds=lease_seconds),
+        attempts=tasks.c.attempts + 1, updated_at=now))
+    rows = session.execute(select(tasks).where(tasks.c.id.in_(ids)).order_by(tasks.c.id)).all()
+    session.commit()
+    return [{**row._mapping, 'payload': json.loads(row.payload)} for row in rows]
+
+
+def _owned(task_id, worker):
+    tasks = CrawlTask.__table__
+    return and_(tasks.c.id == task_id, tasks.c.lease_owner == worker, tasks.c.status == TASK_LEASED)
+
+
+def heartbeat(session, task_id, worker, lease_seconds=TASK_LEASE_SECONDS, now=None):
+    """Продление аренды с commit. False, если аренда истекла и задачу забрал другой исполнитель."""
+    now = now or _now()
+    result = session.execute(update(CrawlTask.__table__).where(_owned(task_id, worker)).values(
+        lease_expires_at=now + timedelta(seconds=lease_seconds), updated_at=now))
+    session.commit()
+    return result.rowcount == 1
+
+
+def complete(session, task_id, worker, now=None):
+    """Отметка задачи выполненной с commit. False, если аренда уже потеряна."""
+    now = now or _now()
+    result = session.execute(update(CrawlTask.__table__).where(_owned(task_id, worker)).values(
+        status=TASK_DONE, lease_owner=None, lease_expires_at=None, finished_at=now, updated_at=now))
+    session.commit()
+    return result.rowcount == 1
+
+
+def fail(session, task_id, worker, error, now=None):
+    """Учет ошибки с commit: задача откладывается для повтора или, после TASK_MAX_ATTEMPTS попыток, отмечается failed."""
+    now = now or _now()
+    tasks = CrawlTask.__table__
+    attempts = session.execute(select(tasks.c.attempts).where(_owned(task_id, worker))).scalar()
+    if attempts is None:
+        session.commit()
+        return False
+    values = {'lease_owner': None, 'lease_expires_at': None, 'last_error': str(error)[:2000], 'updated_at': now}
+    if attempts >= TASK_MAX_ATTEMPTS:
+        values.update(status=TASK_FAILED, finished_at=now)
+    else:
+        values.update(status=TASK_PENDING, available_at=now + TASK_RETRY_DELAY * 2 ** (attempts - 1))
+    session.execute(update(tasks).where(_owned(task_id, worker)).values(**values))
+    session.commit()
+    return True
+
+
+class LeaseKeeper:
+    """Продление аренды задачи в фоновом потоке, пока исполнитель ее выполняет.
+
+    Аренда продлевается каждую треть срока в отдельной сессии. Если продлить не удалось
+    (задача уже передана другому исполнителю), lost становится True.
+    """
+
+    def __init__(self, session_factory, task_id, worker, lease_seconds=TASK_LEASE_SECONDS):
+        self.session_factory = session_factory
+        self.task_id = task_id
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'lease-{task_id}', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                with self.session_factory() as session:
+                    if not heartbeat(session, self.task_id, self.worker, self.lease_seconds):
+                        self.lost = True
+                        logging.warning(f"Lease of task {self.task_id} was lost by {self.worker}")
+                        return
+            except Exception as e:
+                # Следующее продление может успеть до истечения аренды
+                logging.error(f"Heartbeat of task {self.task_id} failed: {str(e)}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,21 @@
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+
+def insert_ignore(session, table, rows):
+    """Многострочная вставка, пропускающая строки с уже существующими уникальными ключами.
+
+    На MySQL это INSERT IGNORE, на SQLite и PostgreSQL — ON CONFLICT DO NOTHING. Позволяет
+    нескольким процессам сбора одновременно добавлять одни и те же справочные значения.
+    """
+    if not rows:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect == 'mysql':
+        statement = mysql.insert(table).prefix_with('IGNORE')
+    elif dialect == 'sqlite':
+        statement = sqlite.insert(table).on_conflict_do_nothing()
+    elif dialect == 'postgresql':
+        statement = postgresql.insert(table).on_conflict_do_nothing()
+    else:
+        raise NotImplementedError(f"insert_ignore is not supported for dialect '{dialect}'")
+    session.execute(statement, list(rows))
@@ -0,0 +1,217 @@
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, func, and_, bindparam
+from .models import Vacancy, VacancyStatusHistory, VacancyVerification, moscow_tz
+
+VERIFY_BATCH_SIZE = int(os.getenv('VERIFY_BATCH_SIZE', '200'))  # Вакансий в одной проверке и транзакции
+# Вакансия проверяется, только если ее нет в полной выдаче несколько прогонов подряд:
+# единичный пропуск обычно шум ранжирования поиска HH
+VERIFY_AFTER_MISSES = int(os.getenv('VERIFY_AFTER_MISSES', '2'))
+# Ответ 404 откладывает проверку на NOT_FOUND_BACKOFF, затем вдвое дольше и так далее
+NOT_FOUND_BACKOFF = timedelta(hours=int(os.getenv('VERIFY_NOT_FOUND_BACKOFF_HOURS', '12')))
+NOT_FOUND_LIMIT = int(os.getenv('VERIFY_NOT_FOUND_LIMIT', '5'))  # Ответов 404 подряд до отметки gone
+RETRY_DELAY = timedelta(hours=1)  # Отсрочка проверки после ошибки запроса
+# Выбранные для проверки вакансии откладываются на это время: если исполнитель упадет
+# до записи результата, их проверит следующий запуск
+VERIFY_CLAIM_TIMEOUT = timedelta(minutes=int(os.getenv('VERIFY_CLAIM_TIMEOUT_MINUTES', '30')))
+ARCHIVED_STATUS = 'Архивный'
+ARCHIVED_CHANGE = 'Отправлена в архив'
+
+QUEUE_PENDING = 'pending'
+QUEUE_GONE = 'gone'
+
+
+def _now():
+    # MySQL хранит московское время без часового пояса
+    return datetime.now(moscow_tz).replace(tzinfo=None)
+
+
+def load_missing_vacancies(session, external_ids):
+    """Вакансии по external_id с типом последнего изменения статуса, одним запросом.
+
+    Последняя запись истории статусов выбирается оконной функцией ROW_NUMBER по вакансии,
+    а не отдельным запросом на каждую вакансию. Возвращает строки
+    (id, external_id, updated_at, last_change).
+    """
+    external_ids = list(external_ids)
+    if not external_ids:
+        return []
+    history = VacancyStatusHistory.__table__
+    vacancies = Vacancy.__table__
+    latest = select(
+        history.c.vacancy_id,
+        history.c.type_changed,
+        func.row_number().over(partition_by=history.c.vacancy_id, order_by=history.c.id.desc()).label('position'),
+    ).where(history.c.vacancy_id.in_(
+        select(vacancies.c.id).where(vacancies.c.external_id.in_(external_ids))
+    )).subquery()
+    return session.execute(
+        select(vacancies.c.id, vacancies.c.external_id, vacancies.c.updated_at,
+               latest.c.type_changed.label('last_change'))
+        .outerjoin(latest, and_(latest.c.vacancy_id == vacancies.c.id, latest.c.position == 1))
+        .where(vacancies.c.external_id.in_(external_ids))
+    ).all()
+
+
+def archive_vacancies(session, vacancies, now=None):
+    """Перевод вакансий в архив без commit: записи истории одной вставкой, статус одним UPDATE.
+
+    vacancies — строки load_missing_vacancies. Вакансии, последнее изменение которых уже
+    «Отправлена в архив», пропускаются. Возвращает external_id переведенных в архив вакансий.
+    """
+    now = now or datetime.now(moscow_tz)
+    rows = [vacancy for vacancy in vacancies if vacancy.last_change != ARCHIVED_CHANGE]
+    if not rows:
+        return []
+    history_rows = []
+    for vacancy in rows:
+        # MySQL возвращает московское время без часового пояса
+        updated_at = vacancy.updated_at if vacancy.updated_at.tzinfo else moscow_tz.localize(vacancy.updated_at)
+        history_rows.append({
+            'vacancy_id': vacancy.id,
+            'prev_status': 'Активный',
+            'cur_status': ARCHIVED_STATUS,
+            'created_at_prev_status': updated_at,
+            'created_at_cur_status': now,
+            'duration': (now - updated_at).days,
+            'type_changed': ARCHIVED_CHANGE,
+        })
+    session.execute(VacancyStatusHistory.__table__.insert(), history_rows)
+    session.execute(update(Vacancy.__table__).where(Vacancy.__table__.c.id.in_([vacancy.id for vacancy in rows]))
+                    .values(status=ARCHIVED_STATUS, updated_at=now))
+    return [vacancy.external_id for vacancy in rows]
+
+
+def enqueue_missing(session, external_ids, now=None):
+    """Учет вакансий, которых нет в полной выдаче, в очереди проверки без commit.
+
+    Пропуск учитывается не чаще раза в день, поэтому вакансия из нескольких запросов
+    и повторные попытки прогона не ускоряют проверку. После VERIFY_AFTER_MISSES пропусков подряд
+    вакансии назначается время проверки. Архивные вакансии в очередь не ставятся.
+    Возвращает число вакансий, которым назначена проверка.
+    """
+    now = now or _now()
+    external_ids = list(external_ids)
+    if not external_ids:
+        return 0
+    vacancies = Vacancy.__table__
+    queue = VacancyVerification.__table__
+    rows = session.execute(
+        select(vacancies.c.id, queue.c.status, queue.c.misses, queue.c.last_missed_on, queue.c.next_check_at)
+        .outerjoin(queue, queue.c.vacancy_id == vacancies.c.id)
+        .where(vacancies.c.external_id.in_(external_ids), vacancies.c.status != ARCHIVED_STATUS)
+    ).all()
+    new_rows, updates = [], []
+    scheduled = 0
+    for row in rows:
+        if row.status is None:
+            misses, next_check_at = 1, None
+        elif row.status == QUEUE_PENDING and row.last_missed_on != now.date():
+            misses, next_check_at = row.misses + 1, row.next_check_at
+        else:
+            continue  # Пропуск уже учтен сегодня или вакансия отмечена gone
+        if next_check_at is None and misses >= VERIFY_AFTER_MISSES:
+            next_check_at = now
+            scheduled += 1
+        if row.status is None:
+            new_rows.append({'vacancy_id': row.id, 'status': QUEUE_PENDING, 'misses': misses, 'not_found': 0,
+                             'last_missed_on': now.date(), 'next_check_at': next_check_at, 'created_at': now})
+        else:
+            updates.append({'b_vacancy_id': row.id, 'misses': misses, 'last_missed_on': now.date(),
+                            'next_check_at': next_check_at})
+    if new_rows:
+        session.execute(queue.insert(), new_rows)
+    if updates:
+        session.execute(update(queue).where(queue.c.vacancy_id == bindparam('b_vacancy_id')), updates)
+    return scheduled
+
+
+def clear_seen(session, external_ids):
+    """Удаление из очереди вакансий, снова найденных в выдаче, без commit. Возвращает их число.
+
+    Очередь невелика, поэтому она читается целиком, а не фильтруется списком всей выдачи.
+    """
+    external_ids = {str(external_id) for external_id in external_ids}
+    queue = VacancyVerification.__table__
+    vacancies = Vacancy.__table__
+    queued = session.execute(select(queue.c.vacancy_id, vacancies.c.external_id)
+                             .join(vacancies, vacancies.c.id == queue.c.vacancy_id)
+                             .where(queue.c.status == QUEUE_PENDING)).all()
+    seen = [vacancy_id for vacancy_id, external_id in queued if external_id in external_ids]
+    if seen:
+        session.execute(delete(queue).where(queue.c.vacancy_id.in_(seen)))
+    return len(seen)
+
+
+def count_due_verifications(session, now=None):
+    queue = VacancyVerification.__table__
+    return session.execute(select(func.count()).select_from(queue).where(
+        queue.c.status == QUEUE_PENDING, queue.c.next_check_at <= (now or _now()))).scalar()
+
+
+def due_verifications(session, limit=VERIFY_BATCH_SIZE, now=None):
+    """Выбор вакансий, срок проверки которых наступил, в порядке очереди с commit: строки load_missing_vacancies.
+
+    Строки очереди блокируются только на время выбора (SELECT ... FOR UPDATE SKIP LOCKED),
+    next_check_at выбранных сдвигается на VERIFY_CLAIM_TIMEOUT, и это фиксируется до запросов
+    к HH. Исполнители на разных узлах получают непересекающиеся пакеты, а сбор и запись
+    результатов других исполнителей не ждут блокировок, пока идет проверка.
+    """
+    now = now or _now()
+    queue = VacancyVerification.__table__
+    vacancy_ids = session.execute(
+        select(queue.c.vacancy_id)
+        .where(queue.c.status == QUEUE_PENDING, queue.c.next_check_at <= now)
+        .order_by(queue.c.next_check_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not vacancy_ids:
+        session.commit()
+        return []
+    session.execute(update(queue).where(queue.c.vacancy_id.in_(vacancy_ids))
+                    .values(next_check_at=now + VERIFY_CLAIM_TIMEOUT))
+    external_ids = session.execute(select(Vacancy.__table__.c.external_id).where(
+        Vacancy.__table__.c.id.in_(vacancy_ids))).scalars().all()
+    vacancies = load_missing_vacancies(session, external_ids)
+    session.commit()
+    return vacancies
+
+
+def record_verification(session, vacancies, vacancy_details, not_found_ids, failed_ids=(), now=None):
+    """Применение результатов проверки вакансий из очереди без commit.
+
+    Вакансии в архиве переводятся в архив, все найденные на HH вакансии удаляются из очереди.
+    Ответ 404 экспоненциально откладывает следующую проверку, после NOT_FOUND_LIMIT ответов
+    подряд вакансия отмечается как gone и больше не проверяется. Проверка вакансий из failed_ids
+    (ошибка запроса) откладывается на RETRY_DELAY.
+    Возвращает external_id: переведенных в архив, активных и отмеченных gone.
+    """
+    now = now or _now()
+    queue = VacancyVerification.__table__
+    archived = archive_vacancies(session, [vacancy for vacancy in vacancies
+                                           if vacancy_details.get(vacancy.external_id, {}).get('archived')])
+    active = [vacancy.external_id for vacancy in vacancies
+              if vacancy.external_id in vacancy_details and not vacancy_details[vacancy.external_id].get('archived')]
+    checked = [vacancy.id for vacancy in vacancies if vacancy.external_id in vacancy_details]
+    if checked:
+        session.execute(delete(queue).where(queue.c.vacancy_id.in_(checked)))
+
+    not_found_ids, failed_ids = set(not_found_ids), set(failed_ids)
+    by_id = {vacancy.id: vacancy.external_id for vacancy in vacancies
+             if vacancy.external_id in not_found_ids or vacancy.external_id in failed_ids}
+    updates, gone = [], []
+    if by_id:
+        for vacancy_id, not_found in session.execute(
+                select(queue.c.vacancy_id, queue.c.not_found).where(queue.c.vacancy_id.in_(list(by_id)))).all():
+            status, next_check_at = QUEUE_PENDING, now + RETRY_DELAY
+            if by_id[vacancy_id] in not_found_ids:
+                not_found += 1
+                next_check_at = now + NOT_FOUND_BACKOFF * 2 ** (not_found - 1)
+                if not_found >= NOT_FOUND_LIMIT:
+                    status, next_check_at = QUEUE_GONE, None
+                    gone.append(by_id[vacancy_id])
+            updates.append({'b_vacancy_id': vacancy_id, 'status': status, 'not_found': not_found,
+                            'next_check_at': next_check_at, 'last_checked_at': now})
+        session.execute(update(queue).where(queue.c.vacancy_id == bindparam('b_vacancy_id')), updates)
+    return archived, active, gone
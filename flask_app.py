@@ -1,7 +1,6 @@
 import logging
 from flask import Flask, request, redirect, url_for, jsonify, render_template
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user
-import json
 from api_tool import RestApiTool  # Импортируйте вашу библиотеку api-tool
 import os
 from dotenv import load_dotenv
@@ -10,7 +9,10 @@ from database.models import SearchQuery  # Импортируем модель S
 from datetime import datetime
 import pytz
 from api import api_bp  # Импортируем Blueprint
-from utils.util import send_email
+from database.outbox import enqueue_email
+from crawler.engine import CrawlEngine
+from crawler.http_cache import HttpCache
+from crawler.snapshot import SnapshotWriter, snapshot_path
 
 # Загрузка переменных окружения из .env файла
 load_dotenv()
@@ -39,6 +41,17 @@ client_secret = os.getenv('CLIENT_SECRET')
 redirect_uri = os.getenv('REDIRECT_URI')  # Получаем Redirect URI из .env
 base_url = 'https://api.hh.ru'  # Базовый URL для API HH
 hh_api = RestApiTool(base_url)
+hh_cache = HttpCache()  # Дисковый кэш деталей вакансий и работодателей, общий с job_analytics
+
+
+# Детали запрашиваются движком сбора: в отличие от RestApiTool он передает кэшу заголовки ответа,
+# и устаревшая запись ревалидируется по ETag/Last-Modified
+hh_engine = CrawlEngine(base_url, cache=hh_cache)
+
+
+def cached_hh_get(path):
+    """Чтение детальной информации из API HH через дисковый кэш. None, если HH ответил 404."""
+    return hh_engine.get(path)
 
 
 # Модель пользователя для Flask-Login
@@ -105,20 +118,17 @@ def create_search_query():
     )
     session = Session()
     session.add(new_query)
-    session.commit()
-    logging.info("New search query created: %s", new_query.query)
-    # Отправка уведомления администратору
+    # Уведомление администратору ставится в очередь в той же транзакции, что и заявка,
+    # его отправляет send_emails.py: ответ не ждет Gmail API
     subject = "Новая заявка на поисковый запрос"
     body = f"""
         <p>Пользователь {new_query.initiator} создал новую заявку:</p>
         <p><strong>Запрос:</strong> {new_query.query}</p>
         <p><strong>Email инициатора:</strong> {new_query.email}</p>
         """
-    try:
-        send_email(subject, body, os.getenv('ADMIN_EMAIL'))  # Отправка email администратору
-        logging.info("Notification email sent to admin.")
-    except Exception as e:
-        logging.error(f"Failed to send email: {str(e)}")
+    enqueue_email(session, subject, body, os.getenv('ADMIN_EMAIL'))
+    session.commit()
+    logging.info("New search query created: %s", new_query.query)
     return jsonify({"message": "Search query created successfully"}), 201
 
 
@@ -229,26 +239,24 @@ def get_vacancies():
 
         logging.info("Fetching vacancies with parameters: %s", params)
         try:
-            while True:
-                # Получение вакансий из API HH с параметрами
-                response = hh_api.get('vacancies', params=params)
-                vacancies = response.get('items', [])
-                all_vacancies.extend(vacancies)  # Добавляем полученные вакансии в общий список
-                # Проверка на наличие следующей страницы
-                if response.get('pages', 0) <= params['page'] + 1:
-                    break  # Если больше нет страниц, выходим из цикла
-                params['page'] += 1  # Переход к следующей странице
+            # Страницы сохраняются в отдельный снимок веб-приложения по мере получения:
+            # снимок сбора за ту же дату используется для продолжения прерванного прогона
+            date_str = datetime.now().strftime('%Y-%m-%d')  # Формат даты
+            with SnapshotWriter(snapshot_path(query.id, date_str, source='web')) as snapshot:
+                while True:
+                    # Получение вакансий из API HH с параметрами
+                    response = hh_api.get('vacancies', params=params)
+                    vacancies = response.get('items', [])
+                    snapshot.write_page(vacancies)
+                    all_vacancies.extend(vacancies)  # Добавляем полученные вакансии в общий список
+                    # Проверка на наличие следующей страницы
+                    if response.get('pages', 0) <= params['page'] + 1:
+                        break  # Если больше нет страниц, выходим из цикла
+                    params['page'] += 1  # Переход к следующей странице
 
             # Логирование результата
             logging.info("Vacancies fetched successfully for query '%s'. Total vacancies: %d", query.query,
-                         len(vacancies))
-
-            # Сохранение данных в JSON файл для каждого поискового запроса
-            date_str = datetime.now().strftime('%Y-%m-%d')  # Формат даты
-            filename = f'vacancies_data/vacancies_query_{query.id}_{date_str}.json'
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(vacancies, f, ensure_ascii=False, indent=4)
-                logging.info("Vacancies data saved to %s", filename)
+                         snapshot.count)
 
         except Exception as e:
             logging.error("Error fetching vacancies for query '%s': %s", query.query, str(e))
@@ -261,7 +269,9 @@ def get_vacancies():
 def get_vacancy_by_id(vacancy_id):
     """Получение вакансии по ID"""
     try:
-        vacancy = hh_api.get(f'vacancies/{vacancy_id}')
+        vacancy = cached_hh_get(f'vacancies/{vacancy_id}')
+        if vacancy is None:
+            return jsonify({"error": "Vacancy not found"}), 404
         logging.info("Vacancy fetched successfully: %s", vacancy_id)
         return jsonify(vacancy), 200, {'Content-Type': 'application/json; charset=utf-8'}
     except Exception as e:
@@ -273,7 +283,9 @@ def get_vacancy_by_id(vacancy_id):
 def get_employer_by_id(employer_id):
     """Получение компании по ID"""
     try:
-        employer = hh_api.get(f'employers/{employer_id}')
+        employer = cached_hh_get(f'employers/{employer_id}')
+        if employer is None:
+            return jsonify({"error": "Employer not found"}), 404
         logging.info("Employer fetched successfully: %s", employer_id)
         return jsonify(employer), 200, {'Content-Type': 'application/json; charset=utf-8'}
     except Exception as e:
@@ -1,21 +1,40 @@
+import argparse
 import json
 import os
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from dotenv import load_dotenv
 import pytz
 from api_tool import RestApiTool  # Импортируйте вашу библиотеку api-tool
-from utils.util import send_email, create_email_body
-from database.models import Vacancy, ExperienceLevel, WorkFormat, KeySkill, ProfessionalRole, \
-    EmploymentForm, WorkingHours, WorkSchedule, vacancy_work_formats, vacancy_work_schedules, \
-    Employer, Industry, employer_industries, SearchQuery, VacancyStatusHistory, KeySkillHistory, SalaryHistory, \
-    search_query_vacancies
+from utils.digest import create_email_body, send_digests
+from database.models import Vacancy, Employer, Industry, SearchQuery, \
+    VacancyStatusHistory, SalaryHistory, search_query_vacancies
 from database.database import Session  # Импортируем Session из database.py
+from database.dimensions import DimensionRegistry
+from database.skills import reconcile_key_skills
+from database.employers import sync_employer_industries
+from database.upsert import insert_ignore
+from database.ingest import VacancyBatch, INGEST_BATCH_SIZE, build_vacancy_record, save_vacancy, parse_datetime
+from database.refresh import payload_hash, archived_hash, changed_vacancies
+from database.verification import VERIFY_BATCH_SIZE, enqueue_missing, clear_seen, count_due_verifications
+from database.task_queue import enqueue as enqueue_task
+from database.outbox import enqueue_email
+from database.data_versions import bump_data_versions, queries_of_vacancies
+from database.aggregates import refresh_aggregates
+from database.checkpoint import CrawlCheckpoint, PHASE_LISTING, PHASE_DETAILS, PHASE_RECONCILIATION, \
+    STATUS_FAILED, MODE_FULL, MODE_INCREMENTAL
+from crawler.engine import CrawlEngine, DetailStore, HH_RATE_LIMIT, HH_RATE_BURST
+from crawler.governor import RequestGovernor, CircuitOpenError
+from crawler.http_cache import HttpCache
+from crawler.snapshot import SnapshotReader, SnapshotWriter, snapshot_path
+from crawler.partition import format_date
+from crawler.rate_limiter import TokenBucket
 
 # Настройка логирования
 log_file_path = 'logs/job_analytics.log'
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s',
                     handlers=[logging.FileHandler(log_file_path), logging.StreamHandler()])
 
 # Получаем текущий рабочий каталог
@@ -29,27 +48,59 @@ load_dotenv()
 # Настройки API HH
 base_url = 'https://api.hh.ru'  # Базовый URL для API HH
 hh_api = RestApiTool(base_url)
+# Общий регулятор запросов к API HH для синхронных вызовов и асинхронного движка сбора
+hh_governor = RequestGovernor(TokenBucket(HH_RATE_LIMIT, HH_RATE_BURST))
+# Дисковый кэш деталей вакансий и работодателей, общий с веб-приложением
+hh_cache = HttpCache()
 
 moscow_tz = pytz.timezone('Europe/Moscow')
 
+# Справочники (опыт, роли, форматы и т.д.) загружаются в память один раз за прогон
+dimensions = DimensionRegistry()
 
-def parse_datetime(date_str):
-    """Преобразуем строку даты в формат, который понимает MySQL."""
-    dt = datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S%z')
-    return dt.strftime('%Y-%m-%d %H:%M:%S')
+# Число параллельно собираемых групп запросов, 1 — последовательный сбор в одной сессии
+CRAWL_WORKERS = int(os.getenv('CRAWL_WORKERS', '1'))
+
+# Виды задач очереди crawl_tasks
+TASK_CRAWL = 'crawl'
+TASK_VERIFY = 'verify'
+
+
+def response_status(response):
+    """Код ответа RestApiTool: при ошибке он возвращается в поле status_code."""
+    return response.get('status_code', 200) if isinstance(response, dict) else 200
+
+
+def hh_get(path, params=None):
+    """GET-запрос к API HH через общий регулятор: лимит частоты, повторы с jitter и circuit breaker.
+
+    Детали вакансий и работодателей читаются через дисковый кэш.
+    """
+
+    if params is None and hh_cache.is_cacheable(path):
+        # RestApiTool не передает заголовки ответа, поэтому детали запрашивает движок сбора:
+        # устаревшая запись кэша ревалидируется по ETag/Last-Modified. 404 возвращается в виде RestApiTool
+        details = CrawlEngine(base_url, governor=hh_governor, cache=hh_cache).get(path)
+        return details if details is not None else {'status_code': 404}
+
+    def send():
+        response = hh_api.get(path, params=params)
+        return response_status(response), None, response
+
+    return hh_governor.call(send)
 
 
 def fetch_vacancies_from_file(session, query):
     """Загрузка данных о вакансиях из файла и сохранение в базу данных с обработкой повторных попыток."""
-    filename = f'vacancies_data/vacancies_query_{query.id}_2025-07-28.json'
+    snapshot = SnapshotReader.open(query.id, '2025-07-28')
 
-    if not os.path.exists(filename):
-        logging.error(f"Файл {filename} не найден.")
+    if snapshot is None:
+        logging.error(f"Файл {snapshot_path(query.id, '2025-07-28')} не найден.")
         return
 
-    with open(filename, 'r', encoding='utf-8') as f:
-        all_vacancies = json.load(f)
-        logging.info(f"Vacancies loaded from {filename}. Total vacancies: {len(all_vacancies)}")
+    # Записи читаются из снимка лениво, в памяти держатся только id
+    fetched_vacancy_ids = set(snapshot.ids())
+    logging.info(f"Vacancies loaded from {snapshot.path}. Total vacancies: {len(fetched_vacancy_ids)}")
 
     error_ids = []
     missing_status_ids = []  # Список для вакансий с отсутствующим статусом
@@ -64,9 +115,6 @@ def fetch_vacancies_from_file(session, query):
             search_query_id=query.id).all()
         existing_vacancy_ids = {vacancy_id for (vacancy_id,) in existing_vacancy_ids}  # Извлекаем только ID
 
-        # Список внешних ID полученных вакансий
-        fetched_vacancy_ids = {vacancy['id'] for vacancy in all_vacancies}
-
         # Проверяем, какие вакансии отсутствуют среди полученных
         missing_vacancy_ids = existing_vacancy_ids - fetched_vacancy_ids
 
@@ -74,9 +122,9 @@ def fetch_vacancies_from_file(session, query):
         new_vacancy_ids = fetched_vacancy_ids - existing_vacancy_ids
 
         # Обработка новых вакансий
+        vacancies_by_id = snapshot.get_many(new_vacancy_ids)
         for new_id in new_vacancy_ids:
-            # Находим вакансию в all_vacancies по ID
-            vacancy = next((v for v in all_vacancies if v['id'] == new_id), None)
+            vacancy = vacancies_by_id.get(new_id)
             if vacancy:
                 try:
                     process_vacancy(vacancy, session, query)
@@ -87,7 +135,7 @@ def fetch_vacancies_from_file(session, query):
                     error_ids.append(vacancy['id'])
                     error_count += 1
             else:
-                logging.warning(f"Vacancy with ID {new_id} not found in all_vacancies.")
+                logging.warning(f"Vacancy with ID {new_id} not found in snapshot.")
 
         # Обработка отсутствующих вакансий
         for missing_id in missing_vacancy_ids:
@@ -95,8 +143,7 @@ def fetch_vacancies_from_file(session, query):
             missing_vacancy = session.query(Vacancy).filter_by(external_id=missing_id).first()
             if missing_vacancy:
                 # Запрашиваем актуальный статус вакансии
-                vacancy_details = hh_api.get(f'vacancies/{missing_id}')
-                time.sleep(2)
+                vacancy_details = hh_get(f'vacancies/{missing_id}')
 
                 # Обработка ответа с кодом 404
                 if vacancy_details.get('status_code') == 404:
@@ -116,7 +163,7 @@ def fetch_vacancies_from_file(session, query):
         session.rollback()  # Rollback in case of error
 
     # Отчет о результатах
-    total_vacancies = len(all_vacancies)
+    total_vacancies = len(fetched_vacancy_ids)
     logging.info("Отчет о результатах сбора вакансий:")
     logging.info(f"Всего было получено: {total_vacancies}")
     logging.info(f"Добавлено новых вакансий: {new_vacancies_count}")
@@ -135,173 +182,319 @@ def fetch_vacancies_from_file(session, query):
     # Отправка уведомления по электронной почте, если есть новые вакансии
     if new_vacancies:
         email_body = create_email_body(new_vacancies, session, query)  # Передаем сессию и запрос
-        send_email("Новые вакансии по запросу: " + query.query, email_body,
-                   query.email)  # Используем email из SearchQuery
+        enqueue_email(session, "Новые вакансии по запросу: " + query.query, email_body,
+                      query.email)  # Используем email из SearchQuery
+        session.commit()
+
+
+def canonical_query(text):
+    """Текст запроса без различий в регистре и пробелах: одинаковые запросы собираются один раз."""
+    return ' '.join(text.split()).casefold()
+
 
+def group_queries(queries):
+    """Запросы, сгруппированные по каноническому тексту. Первым в группе идет запрос с меньшим id."""
+    groups = {}
+    for query in sorted(queries, key=lambda q: q.id):
+        groups.setdefault(canonical_query(query.query), []).append(query)
+    return list(groups.values())
 
-def fetch_vacancies(session, query):
-    """Сбор данных о вакансиях и сохранение в базу данных с обработкой повторных попыток."""
+
+def linked_vacancy_ids(session, search_query_id):
+    """external_id вакансий, связанных с поисковым запросом."""
+    return {external_id for (external_id,) in session.query(Vacancy.external_id).join(
+        search_query_vacancies
+    ).filter(
+        search_query_vacancies.c.search_query_id == search_query_id
+    ).all()}
+
+
+def fetch_vacancies(session, query, members=None, details=None):
+    """Сбор данных о вакансиях и сохранение в базу данных с обработкой повторных попыток.
+
+    members — запросы с тем же текстом, что и query (включая его): выдача получается один раз,
+    а связи с вакансиями и письма о новых вакансиях создаются для каждого из них.
+    details — общий для запуска DetailStore, чтобы детали не запрашивались повторно для разных запросов.
+    """
+    members = members or [query]
+    details = details if details is not None else DetailStore()
     params = {
         'text': query.query,
-        'per_page': 20,
+        'per_page': 100,
         'page': 0,
     }
     logging.info(f"Fetching vacancies with parameters: {params}")
-    all_vacancies = []
+    total_vacancies = 0
     error_ids = []
-    missing_status_ids = []  # Список для вакансий с отсутствующим статусом
+    missing_vacancy_ids = set()  # Вакансии, которых нет в полной выдаче
+    scheduled_count = 0  # Вакансии, которым назначена проверка
+    cleared_count = 0  # Вакансии, снова найденные в выдаче и убранные из очереди проверки
     new_vacancies_count = 0
-    skipped_vacancies_count = 0
+    refreshed_count = 0  # Сохраненные вакансии, обновленные по изменившимся данным выдачи
     error_count = 0
-    new_vacancies = []  # Список для хранения новых вакансий
 
     max_retries = 5  # Максимальное количество попыток
+    engine = CrawlEngine(base_url, governor=hh_governor, cache=hh_cache)
+    batch = VacancyBatch(session)
+    run_date = datetime.now().date()
+    path = snapshot_path(query.id, run_date.strftime('%Y-%m-%d'))
+    # Незавершенный сегодняшний прогон продолжается с сохраненной точки. Если у кого-то из запросов
+    # группы еще нет вакансий, граница инкрементальной выдачи для него неизвестна — нужен полный прогон
+    checkpoint = CrawlCheckpoint.start(session, query.id, run_date,
+                                       force_full=any(not linked_vacancy_ids(session, m.id) for m in members))
+    if checkpoint.completed_pages and not os.path.exists(path):
+        checkpoint.reset()  # Снимок прошлого прогона удален, начинаем заново
+    last_error = None
     for attempt in range(max_retries):
         try:
-            while True:
-                response = hh_api.get('vacancies', params=params)
-                vacancies = response.get('items', [])
-                all_vacancies.extend(vacancies)
-                if response.get('pages', 0) <= params['page'] + 1:
-                    break
-                params['page'] += 1
-                time.sleep(10)
+            # Получаем вакансии из базы данных для каждого поискового запроса группы
+            existing_by_query = {member.id: linked_vacancy_ids(session, member.id) for member in members}
+            # Граница инкрементальной выдачи — вакансии, уже известные всем запросам группы
+            existing_vacancy_ids = set.intersection(*existing_by_query.values())
+
+            if checkpoint.phase == PHASE_LISTING and checkpoint.mode == MODE_INCREMENTAL \
+                    and checkpoint.partitions is None:
+                # Запрашиваются только вакансии, опубликованные после прошлого успешного прогона,
+                # от новых к старым. Листание останавливается на странице из одних известных вакансий
+                incremental_params = {**params, 'date_from': format_date(checkpoint.watermark),
+                                      'order_by': 'publication_time'}
+                with SnapshotWriter(path) as snapshot:
+                    def on_page(page, items):
+                        snapshot.write_page(items)
+                        checkpoint.page_done(page, engine.pages, snapshot.sizes())
+
+                    engine.list_new_vacancies(incremental_params, existing_vacancy_ids, on_page=on_page)
+                if engine.truncated:
+                    # Новых вакансий больше лимита HH: они собираются срезами начиная с watermark
+                    logging.warning(f"Incremental listing for query '{query.query}' hit the results cap, "
+                                    f"switching to partitioned listing")
+                    checkpoint.set_partitions(engine.plan_partitions(
+                        {key: value for key, value in incremental_params.items() if key != 'order_by'}))
+                else:
+                    checkpoint.set_phase(PHASE_DETAILS)
+
+            if checkpoint.phase == PHASE_LISTING:
+                # HH отдает не больше 2000 вакансий на запрос, поэтому широкий запрос делится
+                # на срезы по дате публикации и региону. Разбиение сохраняется для продолжения прогона
+                partitions = checkpoint.partitions
+                if partitions is None:
+                    partitions = engine.plan_partitions(params)
+                    checkpoint.set_partitions(partitions)
+
+                # Страницы срезов запрашиваются параллельно и сразу дописываются в снимок.
+                # Страницы, полученные в прошлых попытках, повторно не запрашиваются
+                resume = checkpoint.snapshot_sizes if checkpoint.completed_pages else None
+                with SnapshotWriter(path, resume=resume) as snapshot:
+                    def on_page(page, items):
+                        snapshot.write_page(items)
+                        checkpoint.page_done(page, engine.pages, snapshot.sizes())
+
+                    engine.list_partitions(partitions, on_page=on_page, keep_items=False,
+                                           skip_pages=checkpoint.completed_pages)
+                checkpoint.set_phase(PHASE_DETAILS)
+
+            # В памяти остаются только id вакансий, записи читаются из снимка по мере необходимости.
+            # Вакансии, попавшие в несколько срезов, объединяются индексом снимка по external id
+            snapshot = SnapshotReader(path)
+            fetched_vacancy_ids = set(snapshot.ids())
+            total_vacancies = len(fetched_vacancy_ids)
 
             logging.info(
-                f"Vacancies fetched successfully for query '{query.query}'. Total vacancies: {len(all_vacancies)}")
-
-            date_str = datetime.now().strftime('%Y-%m-%d')
-            filename = f'vacancies_data/vacancies_query_{query.id}_{date_str}.json'
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(all_vacancies, f, ensure_ascii=False, indent=4)
-                logging.info(f"Vacancies data saved to {filename}")
-            time.sleep(5)
-
-            # Получаем все вакансии из базы данных для текущего поискового запроса
-            existing_vacancy_ids = session.query(Vacancy.external_id).join(
-                search_query_vacancies
-            ).filter(
-                search_query_vacancies.c.search_query_id == query.id
-            ).all()
-
-            # Извлекаем только external_id
-            existing_vacancy_ids = {external_id for (external_id,) in existing_vacancy_ids}
-
-            # Список внешних ID полученных вакансий
-            fetched_vacancy_ids = {vacancy['id'] for vacancy in all_vacancies}
-
-            # Проверяем, какие вакансии отсутствуют среди полученных
-            missing_vacancy_ids = existing_vacancy_ids - fetched_vacancy_ids
-
-            # Находим новые вакансии
-            new_vacancy_ids = fetched_vacancy_ids - existing_vacancy_ids
-
-            # Обработка новых вакансий
+                f"Vacancies fetched successfully for query '{query.query}'. Total vacancies: {total_vacancies}")
+
+            # Проверяем, какие вакансии отсутствуют среди полученных. Инкрементальная выдача содержит
+            # только новые вакансии, поэтому архивацию проверяет только полный прогон.
+            # Вакансия, пропавшая из выдачи нескольких запросов группы, проверяется один раз
+            if checkpoint.mode == MODE_FULL:
+                missing_vacancy_ids = set().union(*(existing - fetched_vacancy_ids
+                                                    for existing in existing_by_query.values()))
+            else:
+                missing_vacancy_ids = set()
+
+            # Новые вакансии для каждого запроса группы и их объединение
+            new_by_query = {query_id: fetched_vacancy_ids - existing for query_id, existing in existing_by_query.items()}
+            new_vacancy_ids = set().union(*new_by_query.values())
+            # Из снимка читаются только новые вакансии
+            vacancies_by_id = snapshot.get_many(new_vacancy_ids)
+            # Вакансии, уже сохраненные по другим запросам, только связываются с запросами группы
+            stored_ids = dict(session.query(Vacancy.external_id, Vacancy.id).filter(
+                Vacancy.external_id.in_(new_vacancy_ids)).all()) if new_vacancy_ids else {}
+
+            new_vacancies_data = [vacancies_by_id[new_id] for new_id in new_vacancy_ids if new_id not in stored_ids]
+            # Работодателей, уже сохраненных в базе, повторно не запрашиваем
+            new_employer_ids = {str(v['employer']['id']) for v in new_vacancies_data if
+                                (v.get('employer') or {}).get('id')}
+            known_employer_ids = {str(id_external) for (id_external,) in session.query(Employer.id_external).filter(
+                Employer.id_external.in_(new_employer_ids)).all()} if new_employer_ids else set()
+
+            # Детали новых вакансий и их работодателей запрашиваем параллельно до записи в базу.
+            # Детали, полученные для других запросов этого запуска, берутся из памяти,
+            # при продолжении прогона — из дискового кэша
+            vacancy_details, employer_details = details.fetch(engine, new_vacancies_data, known_employer_ids)
+            checkpoint.set_phase(PHASE_RECONCILIATION)
+
+            # Обработка новых вакансий: записи накапливаются и сохраняются пакетами по одной транзакции
+            error_ids = []
             for new_id in new_vacancy_ids:
-                # Находим вакансию в all_vacancies по ID
-                vacancy = next((v for v in all_vacancies if v['id'] == new_id), None)
-                if vacancy:
-                    try:
-                        process_vacancy(vacancy, session, query)
-                        new_vacancies_count += 1
-                        new_vacancies.append(vacancy)  # Добавляем вакансию в список новых
-                    except Exception as e:
-                        logging.error(f"Error processing vacancy {vacancy['id']}: {str(e)}")
-                        error_ids.append(vacancy['id'])
-                        error_count += 1
-                else:
-                    logging.warning(f"Vacancy with ID {new_id} not found in all_vacancies.")
-                time.sleep(2)
-
-            # Обработка отсутствующих вакансий
-            for missing_id in missing_vacancy_ids:
-                logging.info(
-                    f"Vacancy with external ID {missing_id} is missing from the fetched data. Checking status.")
-                missing_vacancy = session.query(Vacancy).filter_by(external_id=missing_id).first()
-                if missing_vacancy:
-                    # Запрашиваем актуальный статус вакансии
-                    vacancy_details = hh_api.get(f'vacancies/{missing_id}')
-                    time.sleep(2)
-
-                    # Обработка ответа с кодом 404
-                    if vacancy_details.get('status_code') == 404:
-                        logging.error(f"Vacancy {missing_id} returned 404. Adding to missing status list.")
-                        missing_status_ids.append(missing_id)  # Добавляем в отдельный список
-                        continue  # Пропускаем дальнейшую обработку для этой вакансии
-
-                    if vacancy_details.get('archived', False):
-                        # Получаем последнюю запись в истории статусов для данной вакансии с наибольшим id
-                        last_status_history = session.query(VacancyStatusHistory).filter_by(
-                            vacancy_id=missing_vacancy.id).order_by(VacancyStatusHistory.id.desc()).first()
-                        if last_status_history is None or last_status_history.type_changed != "Отправлена в архив":
-                            # Если статус архивный, обновляем статус в базе
-                            update_vacancy_status_to_archived(missing_vacancy, session)
-                        else:
-                            logging.info(f"Vacancy {missing_id} is already archive.")
-                    else:
-                        logging.info(f"Vacancy {missing_id} is still active.")
-                        skipped_vacancies_count += 1
+                query_ids = [member.id for member in members if new_id in new_by_query[member.id]]
+                if new_id in stored_ids:
+                    for query_id in query_ids:
+                        batch.link(query_id, stored_ids[new_id])
+                    logging.info(f"Vacancy {new_id} already exists. Added relation to search queries {query_ids}.")
+                    continue
+                vacancy = vacancies_by_id[new_id]
+                employer_id = str((vacancy.get('employer') or {}).get('id'))
+                try:
+                    # Ошибки подготовки обрабатываются здесь, ошибки записи учитываются пакетом
+                    with session.begin_nested():
+                        record = prepare_vacancy(vacancy, session, query, vacancy_details.get(new_id),
+                                                 employer_details.get(employer_id), search_query_ids=query_ids)
+                    batch.add(record)
+                except Exception as e:
+                    logging.error(f"Error processing vacancy {vacancy['id']}: {str(e)}")
+                    error_ids.append(vacancy['id'])
+            batch.flush()
+            error_ids.extend(i for i in batch.failed_ids if i not in error_ids)
+            new_vacancies_count = len(new_vacancy_ids) - len(error_ids)
+            error_count = len(error_ids)
+
+            # Вакансии, сохраненные до этого прогона, обновляются, только если их данные в выдаче изменились
+            created_ids = new_vacancy_ids - set(stored_ids)
+            refreshed_count = refresh_vacancies(session, engine, snapshot, fetched_vacancy_ids - created_ids)
+
+            # Отсутствующие вакансии не проверяются в прогоне, а ставятся в очередь проверки:
+            # ее разбирает отдельный процесс verify_vacancies.py. Снова найденные вакансии из очереди убираются
+            cleared_count = clear_seen(session, fetched_vacancy_ids)
+            scheduled_count = enqueue_missing(session, missing_vacancy_ids)
+            # Кэш ответов API всех запросов группы пересчитается после commit
+            bump_data_versions(session, [member.id for member in members])
+            session.commit()
+            checkpoint.finish()
+            last_error = None
             break  # Выход из цикла, если все прошло успешно
 
+        except CircuitOpenError as e:
+            # HH стабильно отвечает ошибками: повторы только продлят блокировку
+            logging.error(f"Error fetching vacancies for query '{query.query}': {str(e)}")
+            session.rollback()
+            batch.discard()
+            checkpoint.reload()
+            last_error = e
+            break
+
         except Exception as e:
             logging.error(f"Error fetching vacancies for query '{query.query}': {str(e)}")
             session.rollback()  # Rollback in case of error
+            batch.discard()
+            checkpoint.reload()  # Следующая попытка продолжит с последней сохраненной точки
+            last_error = e
             if attempt < max_retries - 1:
                 logging.info("Retrying...")
-                time.sleep(5)  # Ожидание перед повторной попыткой
+                time.sleep(hh_governor.backoff(attempt))  # Экспоненциальная задержка с jitter
+
+    if last_error is not None:
+        # Прогон остается незавершенным, перезапуск в тот же день продолжит его
+        checkpoint.finish(STATUS_FAILED, str(last_error))
 
     # Отчет о результатах
-    total_vacancies = len(all_vacancies)
     logging.info("Отчет о результатах сбора вакансий:")
     logging.info(f"Всего было получено: {total_vacancies}")
     logging.info(f"Добавлено новых вакансий: {new_vacancies_count}")
-    logging.info(f"Пропущено по причине наличия: {skipped_vacancies_count}")
+    logging.info(f"Обновлено изменившихся вакансий: {refreshed_count}")
     logging.info(f"С ошибками: {error_count}")
+    logging.info(f"Отсутствуют в выдаче: {len(missing_vacancy_ids)}, назначено к проверке: {scheduled_count}, "
+                 f"снова найдены: {cleared_count}")
+    logging.info(checkpoint.summary())
+    logging.info(batch.summary())
+    logging.info(engine.stats.summary())
+    logging.info(details.summary())
+    logging.info(hh_cache.summary())
     if error_ids:
         logging.info(f"ID вакансий с ошибками: {error_ids}")
 
         # Повторная попытка сохранения вакансий с ошибками
         retry_vacancies(session, query.id, error_ids)
 
-    # Отчет о вакансиях с отсутствующим статусом
-    if missing_status_ids:
-        logging.info(f"ID вакансий по которым при проверке не получен актуальный статус: {missing_status_ids}")
-
-    # Отправка уведомления по электронной почте, если есть новые вакансии
-    if new_vacancies:
-        email_body = create_email_body(new_vacancies, session, query)  # Передаем сессию и запрос
-        send_email("Новые вакансии по запросу: " + query.query, email_body,
-                   query.email)  # Используем email из SearchQuery
-
+    # Письма ставятся в очередь email_outbox, их отправляет send_emails.py.
+    # Письма о новых вакансиях формирует send_digests после сбора всех запросов
     # Формирование отчета для админского ящика
     admin_email_body = (
         f"Отчет о собранных вакансиях по запросу: {query.query}\n"
+        f"Запросы: {', '.join(f'{member.id} ({member.initiator})' for member in members)}\n"
         f"Всего вакансий: {total_vacancies}\n"
         f"Новых вакансий: {new_vacancies_count}\n"
-        f"Пропущено по причине наличия: {skipped_vacancies_count}\n"
+        f"Обновлено изменившихся вакансий: {refreshed_count}\n"
         f"С ошибками: {error_count}\n"
+        f"Отсутствуют в выдаче: {len(missing_vacancy_ids)}, назначено к проверке: {scheduled_count}, "
+        f"снова найдены: {cleared_count}\n"
+        f"{checkpoint.summary()}\n"
+        f"{batch.summary()}\n"
+        f"{engine.stats.summary()}\n"
+        f"{details.summary()}\n"
+        f"{hh_cache.summary()}\n"
+        f"Ответов 429/503 от HH: {hh_governor.throttled}, итоговая скорость: {hh_governor.rate:.2f} req/s\n"
     )
     if error_ids:
         admin_email_body += f"ID вакансий с ошибками: {', '.join(map(str, error_ids))}\n"
-    if missing_status_ids:
-        admin_email_body += f"ID вакансий с отсутствующим статусом: {', '.join(map(str, missing_status_ids))}\n"
     # Отправка отчета на админский ящик
     admin_email = os.getenv('ADMIN_EMAIL')  # Замените на реальный адрес админа
-    send_email("Отчет о собранных вакансиях", admin_email_body, admin_email)
+    enqueue_email(session, "Отчет о собранных вакансиях", admin_email_body, admin_email)
+    session.commit()
+
+    # Сводки дашборда пересчитываются после commit сбора, по транзакции на запрос
+    refresh_aggregates(session, [member.id for member in members])
+
+
+def crawl_group(query_ids, details):
+    """Прогон группы запросов в отдельной сессии и соединении с базой: единица работы пула."""
+    with Session() as session:
+        members = session.query(SearchQuery).filter(SearchQuery.id.in_(query_ids)).order_by(SearchQuery.id).all()
+        fetch_vacancies(session, members[0], members=members, details=details)
+
+
+def crawl_active_queries(session, workers=CRAWL_WORKERS):
+    """Сбор по всем активным запросам за один запуск.
+
+    Запросы с одинаковым текстом собираются одним прогоном, детали вакансий и работодателей
+    запрашиваются не больше одного раза за запуск. При workers > 1 группы запросов собираются
+    параллельно в пуле потоков, каждая в своей сессии: медленный или сбойный запрос не задерживает
+    остальные. Потоки делят общий лимит запросов к HH, а одинаковые работодатели и навыки
+    добавляются через INSERT IGNORE без конфликтов.
+    """
+    active_queries = session.query(SearchQuery).filter_by(is_active=True).all()
+    groups = group_queries(active_queries)
+    logging.info(f"Fetching vacancies with {len(active_queries)} active search queries "
+                 f"grouped into {len(groups)} distinct crawls, {workers} workers.")
+    details = DetailStore()
+    if workers <= 1:
+        for members in groups:
+            fetch_vacancies(session, members[0], members=members, details=details)  # Сбор данных о вакансиях
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='crawl') as pool:
+            futures = {pool.submit(crawl_group, [member.id for member in members], details): members[0]
+                       for members in groups}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f"Crawl for query '{futures[future].query}' failed: {str(e)}")
+    logging.info(details.summary())
 
 
 def retry_vacancies(session, query_id, error_ids):
     """Повторная попытка сохранения вакансий по списку error_ids."""
     date_str = datetime.now().strftime('%Y-%m-%d')
-    filename = f'vacancies_data/vacancies_query_{query_id}_{date_str}.json'
+    snapshot = SnapshotReader.open(query_id, date_str)
+    if snapshot is None:
+        logging.error(f"File {snapshot_path(query_id, date_str)} not found. Cannot retry vacancies.")
+        return
 
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            all_vacancies = json.load(f)
+        # Через индекс снимка читаются только страницы с нужными вакансиями
+        vacancies_by_id = snapshot.get_many(error_ids)
 
         for vacancy_id in error_ids:
-            # Находим вакансию по ID
-            vacancy_data = next((vacancy for vacancy in all_vacancies if vacancy['id'] == vacancy_id), None)
+            vacancy_data = vacancies_by_id.get(str(vacancy_id))
             if vacancy_data:
                 try:
                     process_vacancy(vacancy_data, session, session.query(SearchQuery).filter_by(id=query_id).first())
@@ -309,9 +502,9 @@ def retry_vacancies(session, query_id, error_ids):
                 except Exception as e:
                     logging.error(f"Error processing vacancy {vacancy_id} on retry: {str(e)}")
     except FileNotFoundError:
-        logging.error(f"File {filename} not found. Cannot retry vacancies.")
+        logging.error(f"File {snapshot.path} not found. Cannot retry vacancies.")
     except json.JSONDecodeError:
-        logging.error(f"Error decoding JSON from file {filename}.")
+        logging.error(f"Error decoding JSON from file {snapshot.path}.")
 
 
 def update_vacancy_status_to_archived(vacancy, session):
@@ -339,8 +532,11 @@ def update_vacancy_status_to_archived(vacancy, session):
     logging.info(f"Vacancy {vacancy.external_id} status updated to 'Архивный'.")
 
 
-def process_vacancy(vacancy_data, session, query):
-    """Обработка и сохранение вакансии в базу данных."""
+def process_vacancy(vacancy_data, session, query, vacancy_details=None, employer_details=None):
+    """Обработка и сохранение вакансии в базу данных.
+
+    vacancy_details и employer_details передаются, если они уже получены движком сбора.
+    """
     external_id = vacancy_data['id']
 
     existing_vacancy = session.query(Vacancy).filter_by(external_id=external_id).first()
@@ -356,13 +552,16 @@ def process_vacancy(vacancy_data, session, query):
         return  # Вакансия уже существует, пропускаем
     try:
         # Создаем новую вакансию
-        create_vacancy(vacancy_data, session, query)
+        create_vacancy(vacancy_data, session, query, vacancy_details, employer_details)
     except Exception as e:
         logging.error(f"Error processing vacancy {external_id}: {str(e)}")
 
 
 def revive_vacancy(existing_vacancy, vacancy_data, session):
-    """Возобновление архивной вакансии."""
+    """Возобновление архивной вакансии без commit: статус и запись в истории статусов.
+
+    История зарплат и ключевые навыки обновляются вызывающим кодом (refresh_vacancies).
+    """
     # Обновляем статус вакансии
     existing_vacancy.status = "Активный"
     if existing_vacancy.updated_at.tzinfo is None:
@@ -379,23 +578,57 @@ def revive_vacancy(existing_vacancy, vacancy_data, session):
         type_changed="Возобновление"
     )
     session.add(vacancy_status_history)
-    time.sleep(1)
-    # Получаем детальную информацию о вакансии для получения ключевых навыков
-    vacancy_details = hh_api.get(f'vacancies/{vacancy_data["id"]}')
-
-    # Обновляем историю зарплаты
-    update_salary_history(existing_vacancy, vacancy_details, session)
-
-    # Обновляем ключевые навыки
-    update_key_skills(existing_vacancy, vacancy_details, session)
 
     existing_vacancy.updated_at = datetime.now(moscow_tz)
     existing_vacancy.published_date = parse_datetime(
         vacancy_data['published_at']) if 'published_at' in vacancy_data else existing_vacancy.published_date
+    logging.info(f"Vacancy {existing_vacancy.external_id} revived successfully.")
+
 
-    # Сохраняем изменения
+def refresh_vacancies(session, engine, snapshot, external_ids):
+    """Обновление сохраненных вакансий, данные которых в выдаче изменились.
+
+    Детали запрашиваются только у вакансий с изменившимся хэшем полей выдачи (database/refresh.py)
+    и у архивных вакансий, снова найденных в выдаче. Детали ревалидируются, а не берутся из кэша
+    или DetailStore: сохраненный до изменения ответ записал бы новый хэш со старыми данными.
+    По деталям обновляются история зарплат, ключевые навыки и статус. Изменения записываются
+    пакетами по одной транзакции.
+    Возвращает число обновленных вакансий.
+    """
+    hashes, archived_ids = {}, set()
+    for item in snapshot:
+        if item['id'] in external_ids:
+            hashes[item['id']] = payload_hash(item)
+            if item.get('archived'):
+                archived_ids.add(item['id'])
+    changed = changed_vacancies(session, hashes, archived_ids)
     session.commit()
-    logging.info(f"Vacancy {existing_vacancy.external_id} revived successfully.")
+    refreshed = 0
+    for start in range(0, len(changed), INGEST_BATCH_SIZE):
+        items = snapshot.get_many(changed[start:start + INGEST_BATCH_SIZE])
+        # Работодатели этих вакансий уже сохранены, запрашиваются только детали вакансий
+        vacancy_details, _, _ = engine.check_vacancies(list(items))
+        key_skills = {}
+        for vacancy in session.query(Vacancy).filter(Vacancy.external_id.in_(list(items))).all():
+            vacancy_data = vacancy_details.get(vacancy.external_id)
+            if vacancy_data is None:
+                continue  # Детали не получены: хэш не обновляется, вакансия обновится в следующем прогоне
+            if vacancy.status == "Архивный":
+                if vacancy_data.get('archived'):
+                    # Архив подтвержден: до изменения выдачи вакансия больше не запрашивается
+                    vacancy.payload_hash = archived_hash(hashes[vacancy.external_id])
+                    continue
+                revive_vacancy(vacancy, items[vacancy.external_id], session)
+            update_salary_history(vacancy, vacancy_data, session)
+            key_skills[vacancy.id] = [skill['name'] for skill in vacancy_data.get('key_skills', [])]
+            vacancy.title = items[vacancy.external_id]['name']
+            vacancy.payload_hash = hashes[vacancy.external_id]
+            refreshed += 1
+        reconcile_key_skills(session, key_skills)
+        # Вакансия может быть найдена и другими запросами: их кэш API тоже устаревает
+        bump_data_versions(session, queries_of_vacancies(session, list(key_skills)))
+        session.commit()
+    return refreshed
 
 
 def update_salary_history(existing_vacancy, vacancy_data, session):
@@ -404,7 +637,7 @@ def update_salary_history(existing_vacancy, vacancy_data, session):
     salary_from = salary_range_data.get('from') if salary_range_data else None
     salary_to = salary_range_data.get('to') if salary_range_data else None
     currency = salary_range_data.get('currency', 'RUB') if salary_range_data else 'RUB'
-    mode = salary_range_data.get('mode', {})
+    mode = (salary_range_data or {}).get('mode') or {}
     mode_id = mode.get('id')
     mode_name = mode.get('name')
 
@@ -449,342 +682,136 @@ def update_salary_history(existing_vacancy, vacancy_data, session):
 
 
 def update_key_skills(existing_vacancy, vacancy_details, session):
-    """Обновление ключевых навыков для вакансии."""
-
-    # Получаем текущие активные ключевые навыки
-    current_key_skills = {ks.key_skill_id for ks in existing_vacancy.key_skill_history if ks.is_active}
-    # Получаем новые ключевые навыки из деталей вакансии
-    new_key_skills = {skill['name']: skill for skill in vacancy_details.get('key_skills', [])}
-
-    # Проверяем новые навыки
-    for skill_name, skill_data in new_key_skills.items():
-        key_skill = session.query(KeySkill).filter_by(name=skill_name).first()
-        if key_skill:
-            if key_skill.id not in current_key_skills:
-                # Если навык новый, добавляем его в историю
-                key_skill_history = KeySkillHistory(
-                    vacancy_id=existing_vacancy.id,
-                    key_skill_id=key_skill.id
-                )
-                session.add(key_skill_history)
-                logging.info(f"New key skill '{skill_name}' added for vacancy {existing_vacancy.external_id}.")
-        else:
-            # Если навык не найден, создаем его
-            key_skill = KeySkill(name=skill_name)
-            session.add(key_skill)
-            session.commit()  # Сохраняем, чтобы получить id
-            key_skill_history = KeySkillHistory(
-                vacancy_id=existing_vacancy.id,
-                key_skill_id=key_skill.id
-            )
-            session.add(key_skill_history)
-            logging.info(f"Key skill '{skill_name}' created and added for vacancy {existing_vacancy.external_id}.")
-
-    # Проверяем ушедшие навыки
-    new_skill_ids = {session.query(KeySkill).filter_by(name=skill_name).first().id for skill_name in
-                     new_key_skills.keys() if session.query(KeySkill).filter_by(name=skill_name).first()}
-
-    for existing_skill_id in current_key_skills:
-        if existing_skill_id not in new_skill_ids:
-            # Деактивируем старую запись
-            skill_history = session.query(KeySkillHistory).filter_by(vacancy_id=existing_vacancy.id,
-                                                                     key_skill_id=existing_skill_id,
-                                                                     is_active=True).first()
-            if skill_history:
-                skill_history.is_active = False
-                skill_history.updated_at = datetime.now(moscow_tz)
-                logging.info(
-                    f"Key skill with ID {existing_skill_id} deactivated for vacancy {existing_vacancy.external_id}.")
-
-    # Проверяем, есть ли среди новых навыков те, которые были деактивированы
-    for skill_name in new_key_skills.keys():
-        key_skill = session.query(KeySkill).filter_by(name=skill_name).first()
-        if key_skill:
-            # Проверяем, есть ли история для этого навыка
-            skill_history = session.query(KeySkillHistory).filter_by(vacancy_id=existing_vacancy.id,
-                                                                     key_skill_id=key_skill.id,
-                                                                     is_active=False).first()
-            if skill_history:
-                # Если навык был деактивирован, активируем его
-                skill_history.is_active = True
-                skill_history.updated_at = datetime.now(moscow_tz)
-                logging.info(f"Key skill '{skill_name}' reactivated for vacancy {existing_vacancy.external_id}.")
-
+    """Обновление ключевых навыков для вакансии: новые добавляются, ушедшие деактивируются, вернувшиеся активируются."""
+    reconcile_key_skills(session, {existing_vacancy.id: [skill['name'] for skill in
+                                                         vacancy_details.get('key_skills', [])]})
     session.commit()
 
 
-def create_vacancy(vacancy_data, session, query):
-    """Создание объекта вакансии."""
-    try:
-        # Получаем детальную информацию о вакансии для получения ключевых навыков и дат
-        time.sleep(1)
-        vacancy_details = hh_api.get(f'vacancies/{vacancy_data["id"]}')
-
-        # Получаем информацию о работодателе из детальной информации о вакансии
-        employer_info = vacancy_data['employer']
-        employer_id = employer_info['id']
-        time.sleep(1)
-        employer_details = hh_api.get(f'employers/{employer_id}')
+def resolve_employer(session, employer_info, employer_details=None):
+    """Поиск или создание работодателя.
 
-        # Извлекаем информацию о работодателе
-        employer_name = employer_info['name']
-        open_vacancies = employer_details.get('open_vacancies', 0)  # Значение по умолчанию 0
-        accredited_it_employer = employer_details.get('accredited_it_employer', False)
+    Возвращает работодателя и название его региона. Новый работодатель и его связи с отраслями
+    записываются в транзакции прогона вне точки сохранения вакансии: если запись вакансии
+    не удастся, работодатель все равно останется с отраслями.
+    """
+    employer_id = employer_info['id']
 
-        try:
-            employer_rating = employer_info['employer_rating']
-            total_rating = float(employer_rating.get('total_rating', 0.0))  # Преобразуем в float
-            reviews_count = int(employer_rating.get('reviews_count', 0))  # Преобразуем в int
-        except:
-            total_rating = 0.0  # Значение по умолчанию
-            reviews_count = 0  # Значение по умолчанию
-
-        # Извлекаем area и industries из employer_details
-        area_name = employer_details.get('area', {}).get('name')  # Получаем area из деталей работодателя
-        industries = employer_details.get('industries', [])
-
-        # Проверяем, существует ли работодатель в базе данных
-        employer = session.query(Employer).filter_by(id_external=employer_id).first()
-        if not employer:
-            # Если работодатель не существует, создаем его
-            employer = Employer(
-                id_external=employer_id,
-                name=employer_name,
-                area=area_name,
-                accredited_it_employer=accredited_it_employer,
-                open_vacancies=open_vacancies,
-                total_rating=total_rating,
-                reviews_count=reviews_count
-            )
-            session.add(employer)
-            session.commit()  # Сохраняем изменения, чтобы получить id работодателя
-
-        # Получаем уровень опыта, профессиональную роль, форму занятости и рабочие часы из JSON
-        experience = get_or_create_experience(session, vacancy_details['experience'])
-        professional_role = get_or_create_professional_role(session, vacancy_details['professional_roles'][0])
-        employment_form = get_or_create_employment_form(session, vacancy_details['employment_form'])
-        working_hours = get_or_create_working_hours(session, vacancy_details['working_hours'][0])
-
-        # Получаем графики работы и форматы работы из JSON
-        work_schedule_ids = get_or_create_work_schedules(session, vacancy_details.get('work_schedule_by_days', []))
-        work_format_ids = get_or_create_work_formats(session, vacancy_details.get('work_format', []))
-
-        # Извлекаем даты создания и публикации
-        created_date = parse_datetime(
-            vacancy_details['initial_created_at']) if 'created_at' in vacancy_details else None
-        published_date = parse_datetime(vacancy_details['published_at']) if 'published_at' in vacancy_details else None
-
-        # Извлекаем данные о зарплате только из salary_range
-        salary_range_data = vacancy_details.get('salary_range')
-        salary_from = None
-        salary_to = None
-        currency = 'RUB'  # Значение по умолчанию для валюты
-        mode_id = None
-        mode_name = None
-        if salary_range_data:
-            salary_from = salary_range_data.get('from')
-            salary_to = salary_range_data.get('to')
-            currency = salary_range_data.get('currency', currency)  # Обновляем валюту, если указана
-            mode = salary_range_data.get('mode')
-            if mode:
-                mode_id = mode.get('id')
-                mode_name = mode.get('name')
-
-        # Создаем запись о вакансии
-        vacancy = Vacancy(
-            external_id=vacancy_data['id'],
-            title=vacancy_data['name'],
-            employer_id=employer.id,
-            area=area_name,
-            experience_id=experience.id,
-            professional_role_id=professional_role.id,
-            employment_form_id=employment_form.id,
-            working_hours_id=working_hours.id,
-            status='Активный' if not vacancy_data.get('archived', False) else 'Архивный',
-            created_date=created_date,
-            published_date=published_date
-        )
-        session.add(vacancy)
-        session.commit()  # Сохраняем изменения, чтобы получить id вакансии
+    # Проверяем, существует ли работодатель в базе данных
+    employer = session.query(Employer).filter_by(id_external=employer_id).first()
+    if employer:
+        # Работодатель и его отрасли уже сохранены, детали повторно не запрашиваем
+        return employer, employer.area
 
-        # Создаем запись в таблице search_query_vacancies
-        session.execute(search_query_vacancies.insert().values(search_query_id=query.id, vacancy_id=vacancy.id))
+    if employer_details is None:
+        employer_details = hh_get(f'employers/{employer_id}')
 
-        # Теперь, когда у нас есть vacancy.id, мы можем получить ключевые навыки
-        get_or_create_key_skills(session, vacancy_details['key_skills'], vacancy.id)
-
-        # Создаем запись о зарплате, если она указана
-        if salary_from is not None or salary_to is not None:
-            salary_history = SalaryHistory(
-                salary_from=salary_from,
-                salary_to=salary_to,
-                currency=currency,
-                mode_id=mode_id,
-                mode_name=mode_name,
-                vacancy_id=vacancy.id
-            )
-            session.add(salary_history)
-
-        # Создаем запись о статусе вакансии
-        vacancy_status_history = VacancyStatusHistory(
-            vacancy_id=vacancy.id,
-            prev_status="Отсутствует",
-            cur_status="Активный",
-            created_at_prev_status=vacancy.created_at,
-            created_at_cur_status=vacancy.created_at,
-            duration=0,
-            type_changed="Первичная загрузка"
-        )
-        session.add(vacancy_status_history)
-
-        # Получаем отрасли работодателя через отдельный запрос к API
-        get_or_create_industries(session, industries, employer)
-
-        # Сохраняем связи
-        save_relations(session, vacancy.id, work_format_ids, work_schedule_ids)
+    # Извлекаем информацию о работодателе
+    employer_name = employer_info['name']
+    open_vacancies = employer_details.get('open_vacancies', 0)  # Значение по умолчанию 0
+    accredited_it_employer = employer_details.get('accredited_it_employer', False)
 
+    try:
+        employer_rating = employer_info['employer_rating']
+        total_rating = float(employer_rating.get('total_rating', 0.0))  # Преобразуем в float
+        reviews_count = int(employer_rating.get('reviews_count', 0))  # Преобразуем в int
+    except:
+        total_rating = 0.0  # Значение по умолчанию
+        reviews_count = 0  # Значение по умолчанию
+
+    # Извлекаем area и industries из employer_details
+    area_name = employer_details.get('area', {}).get('name')  # Получаем area из деталей работодателя
+
+    # Если работодатель не существует, создаем его. INSERT IGNORE не конфликтует с параллельным
+    # процессом сбора, который добавляет того же работодателя
+    insert_ignore(session, Employer.__table__, [{
+        'id_external': employer_id,
+        'name': employer_name,
+        'area': area_name,
+        'accredited_it_employer': accredited_it_employer,
+        'open_vacancies': open_vacancies,
+        'total_rating': total_rating,
+        'reviews_count': reviews_count,
+    }])
+    # Блокирующее чтение видит работодателя, вставленного параллельным процессом после начала нашей транзакции
+    employer = session.query(Employer).filter_by(id_external=employer_id).with_for_update(read=True).one()
+
+    # Отрасли работодателя: связи пропускаются, если параллельный процесс уже записал тот же набор
+    industry_ids = dimensions.resolve_many(session, Industry, employer_details.get('industries', []))
+    sync_employer_industries(session, {employer.id: industry_ids})
+    return employer, area_name
+
+
+def prepare_vacancy(vacancy_data, session, query, vacancy_details=None, employer_details=None,
+                    search_query_ids=None):
+    """Получение недостающих деталей и подготовка записи вакансии с разрешенными ссылками.
+
+    search_query_ids — запросы, с которыми связывается вакансия, по умолчанию только query.
+    """
+    # Получаем детальную информацию о вакансии для получения ключевых навыков и дат
+    if vacancy_details is None:
+        vacancy_details = hh_get(f'vacancies/{vacancy_data["id"]}')
+
+    employer, area_name = resolve_employer(session, vacancy_data['employer'], employer_details)
+    return build_vacancy_record(session, dimensions, vacancy_data, vacancy_details, employer.id, area_name,
+                                search_query_ids or [query.id])
+
+
+def create_vacancy(vacancy_data, session, query, vacancy_details=None, employer_details=None):
+    """Создание объекта вакансии."""
+    try:
+        record = prepare_vacancy(vacancy_data, session, query, vacancy_details, employer_details)
+        save_vacancy(session, record)
         logging.info(f"Vacancy {vacancy_data['id']} loaded successfully.")
 
     except Exception as e:
+        session.rollback()
         logging.error(f"Error loading vacancy {vacancy_data['id']}: {str(e)}")
 
 
-def get_or_create_experience(session, experience_data):
-    """Проверка и добавление уровня опыта."""
-    experience = session.query(ExperienceLevel).filter_by(id_external=experience_data['id']).first()
-    if not experience:
-        experience = ExperienceLevel(id_external=experience_data['id'], name=experience_data['name'])
-        session.add(experience)
-        session.commit()  # Сохраняем изменения, чтобы получить id
-    return experience
-
-
-def get_or_create_professional_role(session, role_data):
-    """Проверка и добавление профессиональной роли."""
-    professional_role = session.query(ProfessionalRole).filter_by(id_external=role_data['id']).first()
-    if not professional_role:
-        professional_role = ProfessionalRole(id_external=role_data['id'], name=role_data['name'])
-        session.add(professional_role)
-        session.commit()  # Сохраняем изменения, чтобы получить id
-    return professional_role
-
-
-def get_or_create_employment_form(session, form_data):
-    """Проверка и добавление формата работы."""
-    employment_form = session.query(EmploymentForm).filter_by(id_external=form_data['id']).first()
-    if not employment_form:
-        employment_form = EmploymentForm(id_external=form_data['id'], name=form_data['name'])
-        session.add(employment_form)
-        session.commit()  # Сохраняем изменения, чтобы получить id
-    return employment_form
-
-
-def get_or_create_working_hours(session, hours_data):
-    """Проверка и добавление рабочих часов."""
-    working_hours = session.query(WorkingHours).filter_by(id_external=hours_data['id']).first()
-    if not working_hours:
-        working_hours = WorkingHours(id_external=hours_data['id'], name=hours_data['name'])
-        session.add(working_hours)
-        session.commit()  # Сохраняем изменения, чтобы получить id
-    return working_hours
-
-
-def get_or_create_work_schedules(session, work_schedule_data):
-    """Проверка и добавление графиков работы."""
-    work_schedule_ids = []
-    for ws in work_schedule_data:
-        work_schedule = session.query(WorkSchedule).filter_by(id_external=ws['id']).first()
-        if not work_schedule:
-            work_schedule = WorkSchedule(id_external=ws['id'], name=ws['name'])
-            session.add(work_schedule)
-            session.commit()  # Сохраняем изменения, чтобы получить id
-        work_schedule_ids.append(work_schedule.id)
-    return work_schedule_ids
-
-
-def get_or_create_work_formats(session, work_format_data):
-    """Проверка и добавление форматов работы."""
-    work_format_ids = []
-    for wf in work_format_data:
-        work_format = session.query(WorkFormat).filter_by(id_external=wf['id']).first()
-        if not work_format:
-            work_format = WorkFormat(id_external=wf['id'], name=wf['name'])
-            session.add(work_format)
-            session.commit()  # Сохраняем изменения, чтобы получить id
-        work_format_ids.append(work_format.id)
-    return work_format_ids
-
-
-def get_or_create_key_skills(session, key_skills_data, vacancy_id):
-    """Проверка и добавление ключевых навыков в таблицу key_skill_history."""
-    key_skills_ids = []
-    for skill_data in key_skills_data:
-        # Проверяем, существует ли ключевой навык
-        key_skill = session.query(KeySkill).filter_by(name=skill_data['name']).first()
-        if not key_skill:
-            # Если не существует, создаем новый ключевой навык
-            key_skill = KeySkill(name=skill_data['name'])
-            session.add(key_skill)
-            session.commit()  # Сохраняем изменения, чтобы получить id
-
-        # Создаем запись в key_skill_history
-        key_skill_history = KeySkillHistory(
-            vacancy_id=vacancy_id,
-            key_skill_id=key_skill.id,
-        )
-        session.add(key_skill_history)
-        key_skills_ids.append(key_skill.id)
-
-    session.commit()  # Сохраняем все изменения в конце
-    return key_skills_ids
-
-
-def get_or_create_industries(session, industries_data, employer):
-    """Проверка и добавление отраслей работодателя."""
-    industry_ids = []
-    for industry_data in industries_data:
-        industry = session.query(Industry).filter_by(id_external=industry_data['id']).first()
-        if not industry:
-            industry = Industry(id_external=industry_data['id'], name=industry_data['name'])
-            session.add(industry)
-            session.commit()  # Сохраняем изменения, чтобы получить id
-        industry_ids.append(industry.id)
-
-        # Сохранение отраслей работодателя в промежуточную таблицу
-        existing_entry = session.query(employer_industries).filter_by(employer_id=employer.id,
-                                                                      industry_id=industry.id).first()
-        if not existing_entry:
-            session.execute(employer_industries.insert().values(employer_id=employer.id, industry_id=industry.id))
-
-    return industry_ids
-
-
-def save_relations(session, vacancy_id, work_format_ids, work_schedule_ids):
-    """Сохранение форматов работы и графиков работы в промежуточные таблицы."""
-
-    # Сохранение форматов работы
-    for work_format_id in work_format_ids:
-        session.execute(
-            vacancy_work_formats.insert().values(vacancy_id=vacancy_id, work_format_id=work_format_id)
-        )
-
-    # Сохранение графиков работы
-    for work_schedule_id in work_schedule_ids:
-        session.execute(
-            vacancy_work_schedules.insert().values(vacancy_id=vacancy_id, work_schedule_id=work_schedule_id)
-        )
-
-    # Сохраняем все изменения в сессии
+def schedule_crawl_tasks(session, run_date=None):
+    """Постановка задач сегодняшнего запуска в очередь crawl_tasks для исполнителей crawl_worker.py.
+
+    Одна задача crawl на группу запросов с одинаковым текстом и задачи verify на каждые
+    VERIFY_BATCH_SIZE вакансий, срок проверки которых наступил. Ключ задачи содержит дату,
+    поэтому повторный запуск планировщика в тот же день задачи не дублирует.
+    """
+    run_date = run_date or datetime.now(moscow_tz).date()
+    groups = group_queries(session.query(SearchQuery).filter_by(is_active=True).all())
+    for members in groups:
+        enqueue_task(session, TASK_CRAWL, {'query_ids': [member.id for member in members]},
+                     key=f'{TASK_CRAWL}:{run_date}:{members[0].id}')
+    due_count = count_due_verifications(session)
+    verify_tasks = -(-due_count // VERIFY_BATCH_SIZE)
+    for index in range(verify_tasks):
+        enqueue_task(session, TASK_VERIFY, {'limit': VERIFY_BATCH_SIZE}, key=f'{TASK_VERIFY}:{run_date}:{index}')
     session.commit()
+    logging.info(f"Scheduled {len(groups)} crawl tasks and {verify_tasks} verification tasks for {run_date}")
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Сбор вакансий по активным поисковым запросам')
+    parser.add_argument('--schedule', action='store_true',
+                        help='только поставить задачи в очередь crawl_tasks для crawl_worker.py')
+    parser.add_argument('--digests', action='store_true',
+                        help='только сформировать сводные письма о новых вакансиях, например после crawl_worker.py')
+    parser.add_argument('--aggregates', action='store_true',
+                        help='только пересчитать устаревшие сводки дашборда, например после миграции')
+    args = parser.parse_args()
     with Session() as session:
-        active_queries = session.query(SearchQuery).filter_by(is_active=True).all()
-        logging.info("Fetching vacancies with active search queries.")
-        for query in active_queries:
-            # fetch_vacancies_from_file(session, query)  # Сбор данных о вакансиях
-            fetch_vacancies(session, query)  # Сбор данных о вакансиях
+        if args.schedule:
+            schedule_crawl_tasks(session)
+            return
+        if args.aggregates:
+            logging.info(f"Aggregates refreshed for queries: {refresh_aggregates(session)}")
+            return
+        if not args.digests:
+            dimensions.load(session)
+            # for query in session.query(SearchQuery).filter_by(is_active=True).all():
+            #     fetch_vacancies_from_file(session, query)  # Сбор данных о вакансиях
+            crawl_active_queries(session)
+        # Одно письмо на получателя по всем его запросам
+        logging.info(f"Digest emails queued: {send_digests(session)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+import os
+import logging
+from dotenv import load_dotenv
+from database.database import Session
+from database.dimensions import DimensionRegistry
+from database.data_versions import bump_data_versions
+from database.aggregates import refresh_aggregates
+from database.employers import EMPLOYER_REFRESH_BATCH, stale_employers, apply_employer_details
+from crawler.engine import CrawlEngine, HH_API_URL
+from crawler.governor import RequestGovernor, HH_RATE_LIMIT_MIN
+from crawler.http_cache import HttpCache
+from crawler.rate_limiter import TokenBucket
+
+# Обновление данных работодателей (число открытых вакансий, рейтинг, отрасли), устаревших дольше
+# EMPLOYER_REFRESH_TTL_DAYS. Запускается отдельно от job_analytics.py, например по cron раз в сутки:
+#     python refresh_employers.py
+
+log_file_path = 'logs/refresh_employers.log'
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                    handlers=[logging.FileHandler(log_file_path), logging.StreamHandler()])
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+os.chdir(current_dir)
+
+load_dotenv()
+
+# Фоновая задача: ее квота запросов меньше, чем у сбора новых вакансий
+EMPLOYER_RATE_LIMIT = float(os.getenv('EMPLOYER_RATE_LIMIT', '1'))  # Запросов в секунду
+EMPLOYER_RATE_BURST = int(os.getenv('EMPLOYER_RATE_BURST', '2'))
+EMPLOYER_MAX_PER_RUN = int(os.getenv('EMPLOYER_MAX_PER_RUN', '1000'))  # Работодателей за один запуск
+
+
+def refresh_employers(session, engine, dimensions, batch_size=EMPLOYER_REFRESH_BATCH, limit=EMPLOYER_MAX_PER_RUN):
+    """Обновление не больше limit устаревших работодателей пакетами по batch_size.
+
+    Список выбирается один раз в начале: работодатели с ошибкой запроса остаются устаревшими
+    и не должны выбираться повторно в том же запуске. Каждый пакет запрашивается параллельно
+    и записывается одной транзакцией.
+    """
+    report = {'selected': 0, 'updated': 0, 'not_found': [], 'failed': []}
+    employers = stale_employers(session, limit)
+    report['selected'] = len(employers)
+    for start in range(0, len(employers), batch_size):
+        batch = employers[start:start + batch_size]
+        employer_details, not_found, failed = engine.fetch_employers([employer.id_external for employer in batch])
+        updated = apply_employer_details(session, dimensions, batch, employer_details, not_found)
+        if updated:
+            # Рейтинги и отрасли работодателей есть в ответах API всех запросов
+            bump_data_versions(session)
+        session.commit()
+        report['updated'] += updated
+        report['not_found'].extend(not_found)
+        report['failed'].extend(failed)
+        logging.info(f"Refreshed {updated} of {len(batch)} employers: {len(not_found)} not found, "
+                     f"{len(failed)} failed")
+    return report
+
+
+def refresh_engine():
+    """Движок запросов к HH с квотой EMPLOYER_RATE_LIMIT."""
+    # Обновление работодателей не должно отнимать у сбора общую квоту HH: скорость ограничена сверху
+    governor = RequestGovernor(TokenBucket(EMPLOYER_RATE_LIMIT, EMPLOYER_RATE_BURST),
+                               min_rate=min(HH_RATE_LIMIT_MIN, EMPLOYER_RATE_LIMIT), max_rate=EMPLOYER_RATE_LIMIT)
+    return CrawlEngine(HH_API_URL, governor=governor, concurrency=EMPLOYER_RATE_BURST, cache=HttpCache())
+
+
+def main():
+    engine = refresh_engine()
+    dimensions = DimensionRegistry()
+    with Session() as session:
+        report = refresh_employers(session, engine, dimensions)
+        # Сводки содержат аккредитацию, города и отрасли работодателей
+        refresh_aggregates(session)
+
+    logging.info(
+        f"Устаревших работодателей: {report['selected']}, обновлено: {report['updated']}, "
+        f"удалены с HH (404): {len(report['not_found'])}, не удалось запросить: {len(report['failed'])}"
+    )
+    logging.info(engine.stats.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import os
+import logging
+import time
+from dotenv import load_dotenv
+from database.database import Session
+from database.outbox import EMAIL_BATCH_SIZE, deliver
+from utils.mailer import FileTransport, SmtpTransport
+from utils.util import gmail_transport
+
+# Отправка писем из очереди email_outbox. Сбор вакансий и веб-приложение только ставят письма в очередь,
+# поэтому недоступность Gmail не задерживает ни сбор, ни ответы пользователям:
+#     python send_emails.py --loop
+# EMAIL_TRANSPORT=file (каталог EMAIL_FILE_DIR) или EMAIL_TRANSPORT=smtp (EMAIL_SMTP_HOST, EMAIL_SMTP_PORT)
+# позволяют проверить письма без Gmail.
+
+log_file_path = 'logs/send_emails.log'
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                    handlers=[logging.FileHandler(log_file_path), logging.StreamHandler()])
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+os.chdir(current_dir)
+
+load_dotenv()
+
+EMAIL_POLL_INTERVAL = int(os.getenv('EMAIL_POLL_INTERVAL', '10'))  # Секунд между опросами пустой очереди
+
+
+def make_transport():
+    """Транспорт писем по EMAIL_TRANSPORT: gmail (по умолчанию), smtp или file."""
+    kind = os.getenv('EMAIL_TRANSPORT', 'gmail')
+    if kind == 'file':
+        return FileTransport(os.getenv('EMAIL_FILE_DIR', 'logs/outbox'))
+    if kind == 'smtp':
+        return SmtpTransport(os.getenv('EMAIL_SMTP_HOST', 'localhost'), int(os.getenv('EMAIL_SMTP_PORT', '25')),
+                             os.getenv('EMAIL_SMTP_USER'), os.getenv('EMAIL_SMTP_PASSWORD'),
+                             use_tls=os.getenv('EMAIL_SMTP_TLS') == '1')
+    if kind == 'gmail':
+        return gmail_transport
+    raise ValueError(f"Unknown EMAIL_TRANSPORT '{kind}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Отправка писем из очереди email_outbox')
+    parser.add_argument('--loop', action='store_true', help='не завершаться, опрашивать очередь')
+    args = parser.parse_args()
+
+    transport = make_transport()
+    total_sent = total_failed = 0
+    while True:
+        with Session() as session:
+            sent, failed = deliver(session, transport, EMAIL_BATCH_SIZE)
+        total_sent += len(sent)
+        total_failed += len(failed)
+        if sent or failed:
+            logging.info(f"Emails sent: {len(sent)}, failed: {len(failed)}")
+        if len(sent) + len(failed) < EMAIL_BATCH_SIZE:
+            # Очередь разобрана: письма с ошибкой ждут своей отсрочки
+            if not args.loop:
+                break
+            time.sleep(EMAIL_POLL_INTERVAL)
+    logging.info(f"Всего отправлено писем: {total_sent}, с ошибкой: {total_failed}")
+
+
+if __name__ == "__main__":
+    main()
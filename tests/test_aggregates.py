@@ -0,0 +1,97 @@
+import unittest
+import warnings
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database.models import Base, Employer, Industry, ExperienceLevel, WorkFormat, Vacancy, SalaryHistory, \
+    SearchQuery, VacancyStatusHistory, vacancy_work_formats, search_query_vacancies, employer_industries
+from database.skills import reconcile_key_skills
+from database.data_versions import bump_data_versions
+from database.aggregates import refresh_aggregates, read_aggregate, stale_queries, salary_experience_correlation
+
+
+class TestQueryAggregates(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.python = SearchQuery(query='python', initiator='admin', email='admin@example.com')
+        self.golang = SearchQuery(query='golang', initiator='admin', email='admin@example.com')
+        industry = Industry(id_external='7.540', name='Разработка программного обеспечения' * 3)
+        moscow = Employer(id_external=1, name='Moscow', area='Москва', accredited_it_employer=True)
+        kazan = Employer(id_external=2, name='Kazan', area='Казань', accredited_it_employer=False)
+        junior = ExperienceLevel(id_external='noExperience', name='Нет опыта')
+        middle = ExperienceLevel(id_external='between1And3', name='От 1 года до 3 лет')
+        remote = WorkFormat(id_external='REMOTE', name='Удалённо')
+        self.session.add_all([self.python, self.golang, industry, moscow, kazan, junior, middle, remote])
+        self.session.flush()
+        self.session.execute(employer_industries.insert(), [{'employer_id': moscow.id, 'industry_id': industry.id}])
+        skills = {}
+        for i in range(6):
+            vacancy = Vacancy(external_id=str(i), title=f'Vacancy {i}', status='Архивный' if i == 5 else 'Активный',
+                              employer_id=(moscow if i < 4 else kazan).id,
+                              experience_id=(junior if i < 2 else middle).id)
+            self.session.add(vacancy)
+            self.session.flush()
+            self.session.execute(search_query_vacancies.insert(), [{'search_query_id': self.python.id,
+                                                                    'vacancy_id': vacancy.id}])
+            if i % 2 == 0:
+                self.session.execute(vacancy_work_formats.insert(), [{'vacancy_id': vacancy.id,
+                                                                      'work_format_id': remote.id}])
+            self.session.add(SalaryHistory(vacancy_id=vacancy.id, salary_from=100000 * (1 + (i >= 2)),
+                                           currency='RUR', is_active=True))
+            self.session.add(VacancyStatusHistory(vacancy_id=vacancy.id, prev_status='Новый',
+                                                  cur_status=vacancy.status,
+                                                  created_at_cur_status=datetime(2026, 10, 1 + i % 2, 12)))
+            skills[vacancy.id] = ['Python', 'SQL'] if i < 2 else ['Python']
+        reconcile_key_skills(self.session, skills)
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def rows(self, metric):
+        return [(row.label, row.category, row.value, row.count)
+                for row in read_aggregate(self.session, self.python.id, metric)]
+
+    def test_aggregates_match_dashboard_queries(self):
+        self.assertEqual(refresh_aggregates(self.session), [self.python.id, self.golang.id])
+        self.assertEqual(self.rows('top_skills'), [('Python', None, None, 5), ('SQL', None, None, 2)])
+        self.assertEqual(self.rows('work_formats'), [('Удалённо', None, None, 3)])
+        self.assertEqual(self.rows('experience_levels'), [('Нет опыта', None, None, 2),
+                                                          ('От 1 года до 3 лет', None, None, 3)])
+        self.assertEqual(self.rows('industries'), [('Разработка программного обеспечения' * 2 + 'Разработка' + '...',
+                                                    None, None, 4)])
+        self.assertEqual(self.rows('salaries'), [('RUR', 'Нет опыта', 100000, 2), ('RUR', 'От 1 года до 3 лет', 200000, 3)])
+        self.assertAlmostEqual(self.rows('salary_experience_correlation')[0][2], 1.0)
+        self.assertEqual(self.rows('status_trends_active'), [('2026-10-01', 'Активный', None, 3),
+                                                             ('2026-10-02', 'Активный', None, 2)])
+        self.assertEqual(self.rows('status_trends_archive'), [('2026-10-02', 'Архивный', None, 1)])
+        self.assertEqual(self.rows('accreditation'), [('Акредитованные', None, None, 1),
+                                                      ('Неакредитованные', None, None, 1)])
+        self.assertEqual(self.rows('top_cities'), [('Москва', None, None, 4), ('Казань', None, None, 1)])
+        self.assertEqual(self.rows('employer_count'), [(None, None, None, 2)])
+        self.assertEqual(self.rows('vacancy_count'), [('Активный', None, None, 5), ('Архивный', None, None, 1)])
+        self.assertEqual(read_aggregate(self.session, self.golang.id, 'top_skills'), [])
+
+    def test_only_changed_queries_are_recomputed(self):
+        refresh_aggregates(self.session)
+        self.assertEqual(stale_queries(self.session), [])
+        self.assertEqual(refresh_aggregates(self.session), [])
+        self.session.query(Vacancy).filter_by(external_id='0').update({'status': 'Архивный'})
+        bump_data_versions(self.session, [self.python.id])
+        self.session.commit()
+        self.assertEqual(refresh_aggregates(self.session, [self.python.id, self.golang.id]), [self.python.id])
+        self.assertEqual(self.rows('vacancy_count'), [('Активный', None, None, 4), ('Архивный', None, None, 2)])
+
+    def test_correlation_without_salary_spread_is_empty(self):
+        self.session.query(SalaryHistory).update({'salary_from': 150000})
+        self.session.commit()
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')  # np.corrcoef не вызывается для постоянного ряда
+            self.assertEqual(salary_experience_correlation(self.session, self.python.id), [{'value': None}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,403 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from crawler.engine import CrawlEngine, DetailStore
+from crawler.governor import RequestGovernor, CircuitOpenError
+from crawler.http_cache import HttpCache
+from crawler.partition import PartitionPlanner, parse_date
+from crawler.rate_limiter import TokenBucket
+
+TOTAL_VACANCIES = 45
+PER_PAGE = 10
+
+
+class StubHHHandler(BaseHTTPRequestHandler):
+    """Минимальная заглушка API HH: поиск, детали вакансии и работодателя."""
+    requests_log = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.requests_log.append(url.path)
+        parts = url.path.strip('/').split('/')
+        if parts == ['vacancies', 'throttled'] and self.requests_log.count(url.path) == 1:
+            # Первый запрос отклоняется с просьбой повторить позже
+            self.send_response(429)
+            self.send_header('Retry-After', '0.1')
+            self.end_headers()
+            return
+        if parts == ['vacancies']:
+            page = int(parse_qs(url.query).get('page', ['0'])[0])
+            ids = range(page * PER_PAGE, min((page + 1) * PER_PAGE, TOTAL_VACANCIES))
+            body = {
+                'items': [{'id': str(i), 'name': f'Vacancy {i}', 'employer': {'id': str(i % 3)}} for i in ids],
+                'pages': -(-TOTAL_VACANCIES // PER_PAGE),
+            }
+        elif parts[0] == 'vacancies' and parts[1] != 'missing':
+            body = {'id': parts[1], 'key_skills': [{'name': 'Python'}]}
+        elif parts[0] == 'employers':
+            etag = f'"employer-{parts[1]}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = {'id': parts[1], 'open_vacancies': 1}
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        if parts[0] == 'employers':
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+server = None
+base_url = None
+
+
+def setUpModule():
+    global server, base_url
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHHHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def tearDownModule():
+    server.shutdown()
+    server.server_close()
+
+
+class TestCrawlEngine(unittest.TestCase):
+
+    def setUp(self):
+        StubHHHandler.requests_log.clear()
+        self.engine = CrawlEngine(base_url, governor=RequestGovernor(TokenBucket(1000, 1000)))
+
+    def test_list_vacancies_fetches_all_pages(self):
+        """Все страницы поиска собираются и возвращаются в порядке страниц."""
+        pages_seen = []
+        vacancies = self.engine.list_vacancies({'text': 'python', 'per_page': PER_PAGE},
+                                               on_page=lambda page, items: pages_seen.append(page))
+        self.assertEqual([v['id'] for v in vacancies], [str(i) for i in range(TOTAL_VACANCIES)])
+        self.assertEqual(sorted(pages_seen), [0, 1, 2, 3, 4])
+        self.assertEqual(self.engine.stats.requests, 5)
+        self.assertEqual(self.engine.stats.vacancies, TOTAL_VACANCIES)
+
+    def test_completed_pages_are_skipped(self):
+        """Страницы, полученные в прошлой попытке, не запрашиваются и не передаются в on_page."""
+        pages_seen = []
+        vacancies = self.engine.list_vacancies({'text': 'python', 'per_page': PER_PAGE},
+                                               on_page=lambda page, items: pages_seen.append(page),
+                                               keep_items=False, skip_pages={0, 1, 3})
+        self.assertEqual(vacancies, [])
+        self.assertEqual(sorted(pages_seen), [2, 4])
+        self.assertEqual(self.engine.pages, 5)
+        self.assertEqual(self.engine.stats.requests, 3)  # Первая страница нужна для числа страниц
+
+    def test_new_vacancies_listing_stops_at_known_page(self):
+        """Листание останавливается на первой странице, где все вакансии уже известны."""
+        pages_seen = []
+        known_ids = [str(i) for i in range(PER_PAGE, 2 * PER_PAGE)]
+        vacancies = self.engine.list_new_vacancies({'text': 'python', 'per_page': PER_PAGE}, known_ids,
+                                                   on_page=lambda page, items: pages_seen.append(page))
+        self.assertEqual(pages_seen, [0, 1])
+        self.assertEqual(len(vacancies), 2 * PER_PAGE)
+        self.assertFalse(self.engine.truncated)
+
+    def test_partitions_are_merged_by_external_id(self):
+        """Одинаковые вакансии из разных срезов возвращаются один раз."""
+        pages_seen = []
+        partitions = [{'text': 'python', 'per_page': PER_PAGE}, {'text': 'python', 'per_page': PER_PAGE}]
+        vacancies = self.engine.list_partitions(partitions, on_page=lambda page, items: pages_seen.append(page),
+                                                skip_pages={'1:0', '1:1'})
+        self.assertEqual([v['id'] for v in vacancies], [str(i) for i in range(TOTAL_VACANCIES)])
+        self.assertEqual(len(pages_seen), 8)
+        self.assertIn('1:4', pages_seen)
+        self.assertEqual(self.engine.pages, 10)
+
+    def test_fetch_details_deduplicates_employers(self):
+        """Каждый работодатель запрашивается один раз, известные работодатели пропускаются."""
+        vacancies = [{'id': str(i), 'employer': {'id': str(i % 3)}} for i in range(6)]
+        vacancy_details, employer_details = self.engine.fetch_details(vacancies, known_employer_ids=[0])
+        self.assertEqual(set(vacancy_details), {str(i) for i in range(6)})
+        self.assertEqual(set(employer_details), {'1', '2'})
+        self.assertEqual(StubHHHandler.requests_log.count('/employers/1'), 1)
+
+    def test_detail_store_fetches_each_vacancy_once_per_run(self):
+        """Вакансия из выдачи второго запроса берется из кэша, а не запрашивается повторно."""
+        details = DetailStore()
+        first = [{'id': str(i), 'employer': {'id': str(i % 3)}} for i in range(4)]
+        second = [{'id': str(i), 'employer': {'id': str(i % 3)}} for i in range(2, 6)]
+        with tempfile.TemporaryDirectory() as directory:
+            engine = CrawlEngine(base_url, governor=RequestGovernor(TokenBucket(1000, 1000)),
+                                 cache=HttpCache(os.path.join(directory, 'cache.sqlite3')))
+            details.fetch(engine, first)
+            vacancy_details, employer_details = details.fetch(engine, second)
+        self.assertEqual(set(vacancy_details), {'2', '3', '4', '5'})
+        self.assertEqual(set(employer_details), {'0', '1', '2'})
+        self.assertEqual(details.reused, 2)
+        for path in ('/vacancies/2', '/vacancies/5', '/employers/0', '/employers/2'):
+            self.assertEqual(StubHHHandler.requests_log.count(path), 1)
+
+    def test_detail_store_does_not_fetch_in_flight_ids_twice(self):
+        """Потоки с пересекающейся выдачей не запрашивают одну вакансию одновременно."""
+        class SlowCachedEngine:
+            def __init__(self):
+                self.cache, self.requested = set(), []
+
+            def fetch_by_ids(self, vacancy_ids, employer_ids):
+                keys = [('vacancies', i) for i in vacancy_ids] + [('employers', i) for i in employer_ids]
+                self.requested.extend(key for key in keys if key not in self.cache)
+                time.sleep(0.05)
+                self.cache.update(keys)
+                return {i: {'id': i} for i in vacancy_ids}, {i: {'id': i} for i in employer_ids}
+
+        engine, details, results = SlowCachedEngine(), DetailStore(), []
+        vacancies = [[{'id': str(i), 'employer': {'id': '1'}} for i in range(start, start + 4)] for start in (0, 2)]
+        threads = [threading.Thread(target=lambda batch=batch: results.append(details.fetch(engine, batch)))
+                   for batch in vacancies]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(engine.requested), sorted(set(engine.requested)))
+        self.assertEqual(len(engine.requested), 7)
+        self.assertEqual({frozenset(vacancy_details) for vacancy_details, _ in results},
+                         {frozenset('0123'), frozenset('2345')})
+        self.assertEqual(details.reused, 2)
+        self.assertEqual(details._in_flight, {})
+
+    def test_check_vacancies_revalidates_cache_and_reports_not_found(self):
+        """Проверка статуса не берет ответ из кэша без запроса и отделяет 404 от ошибок."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = HttpCache(os.path.join(tmp_dir, 'cache.sqlite3'))
+            cache.store('vacancies/1', {'id': '1', 'archived': False})
+            engine = CrawlEngine(base_url, governor=RequestGovernor(TokenBucket(1000, 1000)), cache=cache)
+            details, not_found, failed = engine.check_vacancies(['1', '2', 'missing'])
+        self.assertEqual(set(details), {'1', '2'})
+        self.assertEqual(not_found, ['missing'])
+        self.assertEqual(failed, [])
+        self.assertIn('/vacancies/1', StubHHHandler.requests_log)
+
+    def test_single_get_revalidates_stale_entry(self):
+        """Синхронное чтение одного ресурса ревалидирует устаревшую запись по ETag и отдает None для 404."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = HttpCache(os.path.join(tmp_dir, 'cache.sqlite3'), ttl={'vacancies': 0, 'employers': 0})
+            engine = CrawlEngine(base_url, governor=RequestGovernor(TokenBucket(1000, 1000)), cache=cache)
+            self.assertEqual(engine.get('employers/1'), {'id': '1', 'open_vacancies': 1})
+            self.assertEqual(engine.get('employers/1'), {'id': '1', 'open_vacancies': 1})
+            self.assertIsNone(engine.get('vacancies/missing'))
+        self.assertEqual((cache.misses, cache.revalidated), (1, 1))
+
+    def test_missing_vacancy_is_skipped(self):
+        """404 по вакансии не прерывает сбор остальных деталей."""
+        vacancy_details, _ = self.engine.fetch_details([{'id': 'missing'}, {'id': '1'}])
+        self.assertEqual(set(vacancy_details), {'1'})
+
+    def test_rate_limit_is_respected(self):
+        """Общий лимитер ограничивает частоту запросов."""
+        engine = CrawlEngine(base_url, governor=RequestGovernor(TokenBucket(20, 1), max_rate=20))
+        engine.list_vacancies({'text': 'python', 'per_page': PER_PAGE})
+        # 5 запросов при 20 req/s и пустом запасе занимают не меньше 0.2 секунды
+        self.assertGreaterEqual(engine.stats.elapsed, 0.19)
+
+    def test_throttled_request_is_retried_after_retry_after(self):
+        """Ответ 429 снижает скорость и повторяется после Retry-After."""
+        vacancy_details, _ = self.engine.fetch_details([{'id': 'throttled'}])
+        self.assertEqual(set(vacancy_details), {'throttled'})
+        self.assertEqual(StubHHHandler.requests_log.count('/vacancies/throttled'), 2)
+        self.assertEqual(self.engine.governor.throttled, 1)
+        self.assertLess(self.engine.governor.rate, 1000)
+
+
+class FakeSearch:
+    """Выдача HH в памяти: фильтры date_from, date_to и area и дерево из двух уровней регионов."""
+
+    def __init__(self, vacancies, areas):
+        self.vacancies = vacancies  # Пары (дата публикации, регион)
+        self.areas = areas  # Регион верхнего уровня -> дочерние регионы
+        self.requests = 0
+
+    def count(self, params):
+        date_from, date_to = parse_date(params.get('date_from')), parse_date(params.get('date_to'))
+        area = params.get('area')
+        return sum(1 for published, vacancy_area in self.vacancies
+                   if (not area or vacancy_area == area or vacancy_area.startswith(area + '.'))
+                   and (date_from is None or published >= date_from) and (date_to is None or published <= date_to))
+
+    async def get(self, path, params):
+        self.requests += 1
+        if path == 'areas':
+            return [{'id': area} for area in self.areas]
+        if path.startswith('areas/'):
+            return {'areas': [{'id': child} for child in self.areas.get(path.split('/')[1], [])]}
+        return {'found': self.count(params)}
+
+
+class TestPartitionPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.now = datetime(2026, 3, 1, 12, 0, 0)
+        areas = {'1': ['1.1', '1.2'], '2': []}
+        vacancies = [(self.now - timedelta(hours=i), ('1.1', '1.2', '2')[i % 3]) for i in range(5000)]
+        # Массовая публикация в одну секунду: делится только по регионам
+        vacancies += [(self.now - timedelta(days=2), ('1.1', '1.2')[i % 2]) for i in range(1800)]
+        self.search = FakeSearch(vacancies, areas)
+
+    def plan(self, cap=1000):
+        planner = PartitionPlanner(self.search.get, cap=cap)
+        return planner, asyncio.run(planner.plan({'text': 'python', 'per_page': 20, 'page': 0}, now=self.now))
+
+    def test_slices_fit_cap_and_cover_results(self):
+        planner, partitions = self.plan()
+        counts = [self.search.count(p) for p in partitions]
+        self.assertTrue(all(count <= 1000 for count in counts))
+        self.assertEqual(sum(counts), len(self.search.vacancies))  # Срезы не пересекаются и покрывают выдачу
+        self.assertTrue(all(p['per_page'] == 100 and 'page' not in p for p in partitions))
+        self.assertTrue(any('area' in p for p in partitions))
+        self.assertEqual(planner.truncated, [])
+
+    def test_small_query_is_not_split(self):
+        planner, partitions = self.plan(cap=10000)
+        self.assertEqual(partitions, [{'text': 'python', 'per_page': 100}])
+        self.assertEqual(planner.probes, 1)
+
+    def test_unsplittable_slice_is_reported(self):
+        self.search.areas = {}
+        planner, partitions = self.plan()
+        self.assertEqual(len(planner.truncated), 1)
+        self.assertIn({**planner.truncated[0], 'per_page': 100}, partitions)
+
+
+class TestHttpCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'cache.sqlite3')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_cache_file_is_created_on_first_use(self):
+        path = os.path.join(self.tmp_dir.name, 'cache', 'hh.sqlite3')
+        cache = HttpCache(path)
+        self.assertFalse(os.path.exists(os.path.dirname(path)))
+        self.assertEqual(cache.lookup('vacancies/1'), (None, False))
+        self.assertTrue(os.path.exists(path))
+
+    def test_fresh_entry_is_served_without_request(self):
+        cache = HttpCache(self.path)
+        calls = []
+
+        def fetch(validators):
+            calls.append(validators)
+            return 200, {'id': '1'}, {}
+
+        self.assertEqual(cache.get('vacancies/1', fetch), {'id': '1'})
+        self.assertEqual(cache.get('vacancies/1', fetch), {'id': '1'})
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_stale_entry_is_revalidated_with_etag(self):
+        """Устаревшая запись ревалидируется через If-None-Match, 304 отдает сохраненный ответ."""
+        cache = HttpCache(self.path, ttl={'vacancies': 0, 'employers': 0})
+        engine = CrawlEngine(base_url, governor=RequestGovernor(TokenBucket(1000, 1000)), cache=cache)
+        _, first = engine.fetch_details([{'id': '1', 'employer': {'id': '7'}}])
+        _, second = engine.fetch_details([{'id': '1', 'employer': {'id': '7'}}])
+        self.assertEqual(first, second)
+        self.assertEqual(cache.revalidated, 1)
+
+    def test_not_found_is_not_cached(self):
+        cache = HttpCache(self.path)
+        cache.get('vacancies/404', lambda validators: (404, {'status_code': 404}, {}))
+        entry, _ = cache.lookup('vacancies/404')
+        self.assertIsNone(entry)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = HttpCache(self.path, max_bytes=5000)
+        for i in range(200):
+            cache.store(f'vacancies/{i}', {'id': str(i), 'description': 'x' * 100})
+        self.assertIsNone(cache.lookup('vacancies/0')[0])
+        self.assertIsNotNone(cache.lookup('vacancies/199')[0])
+
+
+class TestRequestGovernor(unittest.TestCase):
+
+    def test_rate_grows_on_success_and_drops_on_throttle(self):
+        governor = RequestGovernor(TokenBucket(2, 2), min_rate=1, max_rate=3, increase_step=0.5)
+        governor.record(200)
+        self.assertEqual(governor.rate, 2.5)
+        governor.record(200)
+        governor.record(200)
+        self.assertEqual(governor.rate, 3)
+        self.assertTrue(governor.record(429))
+        self.assertEqual(governor.rate, 1.5)
+
+    def test_backoff_has_jitter_and_cap(self):
+        governor = RequestGovernor(TokenBucket(1), base_backoff=1, max_backoff=8)
+        delays = {governor.backoff(5) for _ in range(20)}
+        self.assertTrue(all(4 <= delay <= 8 for delay in delays))
+        self.assertGreater(len(delays), 1)
+        self.assertEqual(governor.backoff(0, retry_after=30), 30)
+
+    def test_circuit_opens_after_persistent_errors(self):
+        governor = RequestGovernor(TokenBucket(1000, 1000), max_retries=1, base_backoff=0, failure_threshold=3,
+                                   cooldown=60)
+        calls = []
+
+        def send():
+            calls.append(1)
+            return 500, None, {'status_code': 500}
+
+        governor.call(send)  # Две неудачные попытки
+        with self.assertRaises(CircuitOpenError):
+            governor.call(send)  # Третья ошибка размыкает цепь, повтор отклоняется
+        self.assertEqual(len(calls), 3)
+
+    def test_failed_probe_reopens_circuit(self):
+        governor = RequestGovernor(TokenBucket(1000, 1000), failure_threshold=2, cooldown=60)
+        governor.record(500)
+        governor.record(500)
+        with self.assertRaises(CircuitOpenError):
+            governor.before_request()
+        governor._opened_at -= 60  # Cooldown истек
+        governor.before_request()  # Пробный запрос
+        with self.assertRaises(CircuitOpenError):
+            governor.before_request()  # Остальные ждут результата пробы
+        governor.record(500)
+        with self.assertRaises(CircuitOpenError):
+            governor.before_request()  # Проба не прошла: цепь снова разомкнута на cooldown
+        governor._opened_at -= 60
+        governor.before_request()
+        governor.record(200)
+        governor.before_request()
+        governor.before_request()  # Успешная проба замыкает цепь
+
+    def test_not_found_is_not_retried(self):
+        governor = RequestGovernor(TokenBucket(1000, 1000))
+        calls = []
+
+        def send():
+            calls.append(1)
+            return 404, None, {'status_code': 404}
+
+        self.assertEqual(governor.call(send), {'status_code': 404})
+        self.assertEqual(len(calls), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,259 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+import unittest
+from unittest.mock import patch
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from crawler.engine import CrawlStats
+from crawler.governor import CircuitOpenError
+from crawler.snapshot import snapshot_path
+from database.checkpoint import STATUS_COMPLETED, STATUS_FAILED, PHASE_DETAILS
+from database.dimensions import DimensionRegistry
+from database.models import Base, SearchQuery, Vacancy, Employer, CrawlRun, DigestItem, search_query_vacancies
+
+# Внутренняя библиотека api_tool и драйвер MySQL есть только на сервере сбора. Для импорта
+# job_analytics они подменяются пустыми модулями: запросы к HH в тестах идут через FakeHH,
+# база — через SQLite
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for name, attributes in (('api_tool', {'RestApiTool': lambda base_url: None}), ('pymysql', {'paramstyle': 'pyformat'})):
+    try:
+        __import__(name)
+    except ImportError:
+        sys.modules[name] = types.SimpleNamespace(**attributes)
+os.makedirs(os.path.join(ROOT, 'logs'), exist_ok=True)
+
+import job_analytics  # noqa: E402
+
+
+def listing_item(i):
+    return {'id': str(i), 'name': f'Vacancy {i}', 'archived': False,
+            'employer': {'id': str(i % 2), 'name': f'Employer {i % 2}'}}
+
+
+def vacancy_details(vacancy_id):
+    return {'id': vacancy_id, 'experience': {'id': 'noExperience', 'name': 'Нет опыта'},
+            'professional_roles': [{'id': '96', 'name': 'Программист'}],
+            'employment_form': {'id': 'FULL', 'name': 'Полная'},
+            'working_hours': [{'id': 'HOURS_8', 'name': '8 часов'}], 'key_skills': [{'name': 'Python'}]}
+
+
+def employer_details(employer_id):
+    return {'id': employer_id, 'name': f'Employer {employer_id}', 'area': {'name': 'Москва'},
+            'industries': [{'id': '7.540', 'name': 'Разработка программного обеспечения'}]}
+
+
+class FakeHH:
+    """Движок сбора с выдачей из VACANCIES вакансий и учетом запросов вместо обращений к HH.
+
+    Один экземпляр подставляется вместо CrawlEngine во всех прогонах теста. Детали, полученные
+    однажды, отдаются как из дискового кэша и в requested не попадают. failures — {метод: исключение},
+    исключение выбрасывается при первом вызове метода.
+    """
+    VACANCIES = 3
+
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.requested = []  # (vacancies|employers|listing, id) в порядке запросов
+        self.cache = set()
+        self.pages = 1
+        self.truncated = False
+        self.stats = CrawlStats()
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def _fail(self, method):
+        with self._lock:
+            error = self.failures.pop(method, None)
+        if error is not None:
+            raise error
+
+    def plan_partitions(self, params):
+        return [dict(params)]
+
+    def list_partitions(self, partitions, on_page=None, keep_items=True, skip_pages=()):
+        if '0:0' not in skip_pages:
+            with self._lock:
+                self.requested.append(('listing', partitions[0]['text']))
+            on_page('0:0', [listing_item(i) for i in range(self.VACANCIES)])
+        self._fail('list_partitions')
+
+    def fetch_by_ids(self, vacancy_ids, employer_ids):
+        self._fail('fetch_by_ids')
+        time.sleep(0.05)  # Параллельные прогоны успевают пересечься
+        keys = [('vacancies', i) for i in vacancy_ids] + [('employers', i) for i in employer_ids]
+        with self._lock:
+            self.requested.extend(key for key in keys if key not in self.cache)
+            self.cache.update(keys)
+        return ({i: vacancy_details(i) for i in vacancy_ids}, {i: employer_details(i) for i in employer_ids})
+
+    def check_vacancies(self, external_ids):
+        return {i: vacancy_details(i) for i in external_ids}, [], []
+
+
+def sqlite_engine(path, immediate=False):
+    """SQLite в режиме WAL: читающая транзакция основной сессии не блокирует запись потоков пула.
+
+    SQLite блокирует запись во всю базу, а не в строки, как MySQL. Транзакция, начатая чтением,
+    не может перейти к записи, пока пишет другая, поэтому сессии потоков пула (immediate=True)
+    сразу начинают пишущую транзакцию и ждут своей очереди.
+    """
+    engine = create_engine(f'sqlite:///{path}', connect_args={'timeout': 30})
+
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None  # BEGIN отправляет SQLAlchemy, а не драйвер
+        dbapi_connection.execute('PRAGMA journal_mode=WAL')
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        connection.exec_driver_sql('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+
+    return engine
+
+
+class CrawlTestCase(unittest.TestCase):
+    """Прогоны job_analytics на SQLite в файле: потоки пула открывают собственные соединения."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, 'crawl.sqlite3')
+        self.engine = sqlite_engine(path)
+        self.worker_engine = sqlite_engine(path, immediate=True)
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.hh = FakeHH()
+        directory = self.directory.name
+        for target, value in (('Session', sessionmaker(bind=self.worker_engine)), ('CrawlEngine', self.hh),
+                              ('dimensions', DimensionRegistry()),
+                              ('snapshot_path', lambda query_id, date_str: snapshot_path(query_id, date_str,
+                                                                                         directory))):
+            patcher = patch.object(job_analytics, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(job_analytics.hh_governor, 'backoff', lambda attempt: 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+        self.worker_engine.dispose()
+        self.directory.cleanup()
+
+    def add_queries(self, *texts):
+        queries = [SearchQuery(query=text, initiator='admin', email='admin@example.com', is_active=True)
+                   for text in texts]
+        self.session.add_all(queries)
+        self.session.commit()
+        return queries
+
+    def links(self):
+        return sorted(self.session.execute(search_query_vacancies.select()).all())
+
+
+class TestCrawlActiveQueriesPool(CrawlTestCase):
+
+    def test_groups_are_crawled_in_parallel_with_shared_details(self):
+        """Каждая группа собирается один раз в своей сессии, сбой группы не прерывает остальные."""
+        self.add_queries('python', 'Python', 'golang', 'rust')
+        hh, crawled = FakeHH(), []
+
+        def fake_fetch_vacancies(session, query, members=None, details=None):
+            crawled.append((query.query, [member.id for member in members], threading.current_thread().name))
+            if query.query == 'rust':
+                raise RuntimeError('HH is down')
+            details.fetch(hh, [{'id': str(i), 'employer': {'id': '1'}} for i in range(4)])
+
+        with patch.object(job_analytics, 'fetch_vacancies', fake_fetch_vacancies):
+            job_analytics.crawl_active_queries(self.session, workers=3)
+        self.assertEqual(sorted((text, ids) for text, ids, _ in crawled),
+                         [('golang', [3]), ('python', [1, 2]), ('rust', [4])])
+        self.assertTrue(all(name.startswith('crawl') for _, _, name in crawled))
+        # Вакансии из выдачи нескольких групп запрашиваются у HH один раз
+        self.assertEqual(sorted(hh.requested), sorted(set(hh.requested)))
+        self.assertEqual(len(hh.requested), 5)
+
+    def detail_requests(self):
+        return [key for key in self.hh.requested if key[0] != 'listing']
+
+    def test_identical_queries_share_one_crawl(self):
+        """Запросы с одинаковым текстом собираются одним прогоном, детали запрашиваются один раз."""
+        python, python_upper = self.add_queries('python', ' Python')
+        job_analytics.crawl_active_queries(self.session, workers=1)
+        self.assertEqual(self.hh.requested.count(('listing', 'python')), 1)
+        self.assertEqual(sorted(self.detail_requests()), sorted(set(self.detail_requests())))
+        self.assertEqual(len(self.detail_requests()), FakeHH.VACANCIES + 2)
+        vacancy_ids = [vacancy_id for (vacancy_id,) in self.session.query(Vacancy.id).order_by(Vacancy.id)]
+        self.assertEqual(self.links(), sorted((query.id, vacancy_id) for query in (python, python_upper)
+                                              for vacancy_id in vacancy_ids))
+
+    def test_parallel_crawls_fetch_shared_details_once(self):
+        """Разные запросы с общей выдачей собираются параллельно: детали общих вакансий запрашиваются
+        один раз, а вакансия связывается с каждым запросом."""
+        python, django = self.add_queries('python', 'django')
+        job_analytics.crawl_active_queries(self.session, workers=2)
+        self.session.commit()  # Основная сессия видит данные, записанные потоками пула
+        self.assertEqual(sorted(self.detail_requests()), sorted(set(self.detail_requests())))
+        self.assertEqual(len(self.detail_requests()), FakeHH.VACANCIES + 2)
+        self.assertEqual(self.session.query(Vacancy).count(), FakeHH.VACANCIES)
+        self.assertEqual(len(self.links()), 2 * FakeHH.VACANCIES)
+        self.assertEqual({query_id for query_id, _ in self.links()}, {python.id, django.id})
+
+
+class TestFetchVacancies(CrawlTestCase):
+
+    def test_transient_error_is_retried_from_checkpoint(self):
+        """Повторная попытка после ошибки не запрашивает уже полученные страницы выдачи."""
+        query, = self.add_queries('python')
+        self.hh.failures['list_partitions'] = RuntimeError('HTTP 502')
+        job_analytics.fetch_vacancies(self.session, query)
+        self.assertEqual(self.hh.requested.count(('listing', 'python')), 1)
+        self.assertEqual(self.session.query(Vacancy).count(), FakeHH.VACANCIES)
+        self.assertEqual(self.session.query(CrawlRun).one().status, STATUS_COMPLETED)
+
+    def test_failed_run_is_resumed_by_next_start(self):
+        """Прогон, прерванный открытым circuit breaker, продолжается следующим запуском с фазы деталей."""
+        query, = self.add_queries('python')
+        self.hh.failures['fetch_by_ids'] = CircuitOpenError('HH API circuit is open')
+        job_analytics.fetch_vacancies(self.session, query)
+        run = self.session.query(CrawlRun).one()
+        self.assertEqual((run.status, run.phase), (STATUS_FAILED, PHASE_DETAILS))
+        self.assertEqual(self.session.query(Vacancy).count(), 0)
+
+        job_analytics.fetch_vacancies(self.session, query)
+        self.session.expire_all()
+        self.assertEqual(self.session.query(CrawlRun).one().status, STATUS_COMPLETED)
+        self.assertEqual(self.hh.requested.count(('listing', 'python')), 1)
+        self.assertEqual(self.session.query(Vacancy).count(), FakeHH.VACANCIES)
+        self.assertEqual(self.session.query(Employer).count(), 2)
+        self.assertEqual(len(self.links()), FakeHH.VACANCIES)
+
+    def test_retry_after_committed_batch_keeps_digest_items(self):
+        """Вакансии, зафиксированные пакетом до сбоя, попадают в сводное письмо, хотя при повторе
+        попытки они уже не новые."""
+        query, = self.add_queries('python')
+        refresh_vacancies, failures = job_analytics.refresh_vacancies, [RuntimeError('HTTP 502')]
+
+        def failing_refresh_vacancies(*args):
+            if failures:
+                raise failures.pop()
+            return refresh_vacancies(*args)
+
+        with patch.object(job_analytics, 'refresh_vacancies', failing_refresh_vacancies):
+            job_analytics.fetch_vacancies(self.session, query)
+        self.assertEqual(failures, [])
+        self.assertEqual(self.session.query(CrawlRun).one().status, STATUS_COMPLETED)
+        self.assertEqual(self.session.query(Vacancy).count(), FakeHH.VACANCIES)
+        self.assertEqual(len(self.links()), FakeHH.VACANCIES)
+        self.assertEqual(self.session.query(DigestItem).filter_by(search_query_id=query.id).count(),
+                         FakeHH.VACANCIES)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from database.models import Base, Employer, ExperienceLevel, WorkFormat, Vacancy, SalaryHistory, SearchQuery, \
+    DigestItem, EmailOutbox, vacancy_work_formats
+from database.skills import reconcile_key_skills
+from database.digests import record_digest_items
+from utils.digest import create_email_body, top_skills, send_digests
+
+
+class TestEmailDigest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.query = SearchQuery(query='python', initiator='admin', email='admin@example.com')
+        small = Employer(id_external=1, name='Small & Co', open_vacancies=2, accredited_it_employer=True)
+        large = Employer(id_external=2, name='Large', open_vacancies=50)
+        experience = ExperienceLevel(id_external='between1And3', name='От 1 года до 3 лет')
+        remote = WorkFormat(id_external='REMOTE', name='Удалённо')
+        self.session.add_all([self.query, small, large, experience, remote])
+        self.session.flush()
+        skills = {}
+        for i in range(20):
+            vacancy = Vacancy(external_id=str(i), title=f'Python developer {i}', status='Активный',
+                              employer_id=(large if i % 2 else small).id, experience_id=experience.id)
+            self.session.add(vacancy)
+            self.session.flush()
+            self.session.execute(vacancy_work_formats.insert(), [{'vacancy_id': vacancy.id,
+                                                                  'work_format_id': remote.id}])
+            self.session.add(SalaryHistory(vacancy_id=vacancy.id, salary_from=100000, salary_to=200000,
+                                           currency='RUR', is_active=True))
+            skills[vacancy.id] = ['Python', 'SQL'] if i < 5 else ['Python']
+        reconcile_key_skills(self.session, skills)
+        self.session.commit()
+        self.session.expire_all()
+        self.session.refresh(self.query)
+        self.new_vacancies = [{'id': str(i)} for i in range(20)] + [{'id': 'not-saved'}]
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_digest_is_built_with_constant_number_of_queries(self):
+        statements = []
+        event.listen(self.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        html = create_email_body(self.new_vacancies, self.session, self.query)
+        # Вакансии со справочниками, форматы работы, зарплаты и навыки
+        self.assertLessEqual(len(statements), 4)
+        self.assertEqual(html.count('<a href="https://hh.ru/vacancy/'), 20)
+        # Вакансии крупного работодателя идут первыми, порядок выдачи внутри работодателя сохраняется
+        self.assertLess(html.index('/vacancy/1"'), html.index('/vacancy/3"'))
+        self.assertLess(html.index('/vacancy/19"'), html.index('/vacancy/0"'))
+        self.assertIn('Small &amp; Co', html)
+        self.assertIn('100000.00 - 200000.00 RUR', html)
+
+    def test_top_skills_count_vacancies(self):
+        vacancy_ids = [vacancy_id for (vacancy_id,) in self.session.query(Vacancy.id)]
+        self.assertEqual(top_skills(self.session, vacancy_ids), [('Python', 20), ('SQL', 5)])
+
+
+class TestDigestAggregation(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.python = SearchQuery(query='python', initiator='user', email='user@example.com')
+        self.django = SearchQuery(query='django', initiator='user', email=' User@Example.com')
+        self.golang = SearchQuery(query='golang', initiator='other', email='other@example.com')
+        self.session.add_all([self.python, self.django, self.golang])
+        for i in range(4):
+            self.session.add(Vacancy(external_id=str(i), title=f'Vacancy {i}', status='Активный'))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_one_email_per_recipient_without_repeated_vacancies(self):
+        ids = dict(self.session.query(Vacancy.external_id, Vacancy.id))
+        record_digest_items(self.session, [{'search_query_id': query.id, 'vacancy_id': ids[external_id]}
+                                           for query, external_ids in ((self.python, '012'), (self.django, '12'),
+                                                                       (self.golang, '3'))
+                                           for external_id in external_ids])
+        # Повтор прогона не дублирует вакансии
+        record_digest_items(self.session, [{'search_query_id': self.python.id, 'vacancy_id': ids['0']}])
+        self.session.commit()
+        self.assertEqual(self.session.query(DigestItem).count(), 6)
+        self.assertEqual(send_digests(self.session), 2)
+        emails = {email.recipient: email for email in self.session.query(EmailOutbox)}
+        self.assertEqual(set(emails), {'user@example.com', 'other@example.com'})
+        user_email = emails['user@example.com']
+        self.assertEqual(user_email.subject, 'Новые вакансии по запросам: python, django')
+        for i in range(3):
+            self.assertEqual(user_email.body.count(f'/vacancy/{i}"'), 1)
+        self.assertIn('Еще вакансий по этому запросу: 2', user_email.body)
+        self.assertNotIn('/vacancy/3"', user_email.body)
+        self.assertEqual(send_digests(self.session), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
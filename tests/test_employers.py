@@ -0,0 +1,74 @@
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from database.models import Base, Employer, Industry, Vacancy, employer_industries
+from database.dimensions import DimensionRegistry
+from database.employers import EMPLOYER_REFRESH_TTL, stale_employers, apply_employer_details, \
+    sync_employer_industries
+
+
+class TestEmployerRefresh(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.now = datetime(2026, 3, 1, 12)
+        stale, fresh = self.now - EMPLOYER_REFRESH_TTL - timedelta(days=1), self.now - timedelta(days=1)
+        for external_id, updated_at, active in ((10, stale, 1), (20, stale, 3), (30, fresh, 5)):
+            employer = Employer(id_external=external_id, name=f'Employer {external_id}', open_vacancies=1,
+                                total_rating=4.5, reviews_count=10, updated_at=updated_at)
+            self.session.add(employer)
+            self.session.flush()
+            for i in range(active):
+                self.session.add(Vacancy(external_id=f'{external_id}-{i}', title='Vacancy', status='Активный',
+                                         employer_id=employer.id))
+        self.session.add(Vacancy(external_id='10-archived', title='Vacancy', status='Архивный', employer_id=1))
+        self.session.add(Industry(id_external='7.540', name='Разработка ПО'))
+        self.session.flush()
+        self.session.execute(employer_industries.insert(), [{'employer_id': 1, 'industry_id': 1}])
+        self.session.commit()
+        self.dimensions = DimensionRegistry()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_stale_employers_are_ordered_by_active_vacancies(self):
+        employers = stale_employers(self.session, 10, now=self.now)
+        self.assertEqual([(e.id_external, e.active_vacancies) for e in employers], [(20, 3), (10, 1)])
+
+    def test_details_are_applied_in_bulk(self):
+        employers = stale_employers(self.session, 10, now=self.now)
+        details = {'10': {'name': 'Renamed', 'open_vacancies': 7, 'area': {'name': 'Москва'},
+                          'industries': [{'id': '9.399', 'name': 'Интернет-компания'}]}}
+        statements = []
+        event.listen(self.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        updated = apply_employer_details(self.session, self.dimensions, employers, details, ['20'], now=self.now)
+        self.session.commit()
+        self.assertEqual(updated, 1)
+        # Данные работодателей, updated_at работодателей с 404 и хэши отраслей
+        self.assertLessEqual(sum(s.startswith('UPDATE employers') for s in statements), 3)
+        employer = self.session.query(Employer).filter_by(id_external=10).one()
+        self.assertEqual((employer.name, employer.open_vacancies, employer.area), ('Renamed', 7, 'Москва'))
+        self.assertEqual(employer.total_rating, 4.5)  # Рейтинга нет в ответе, прежнее значение сохраняется
+        self.assertEqual([industry.id_external for industry in employer.industries], ['9.399'])
+        # Работодатель с ответом 404 больше не считается устаревшим
+        self.assertEqual(stale_employers(self.session, 10, now=self.now), [])
+
+    def test_unchanged_industry_sets_are_skipped(self):
+        industry_id = self.session.query(Industry.id).scalar()
+        self.assertEqual(sync_employer_industries(self.session, {1: [industry_id], 2: [industry_id]}), (1, 0))
+        self.session.commit()
+        statements = []
+        event.listen(self.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        self.assertEqual(sync_employer_industries(self.session, {1: [industry_id], 2: [industry_id, industry_id]}),
+                         (0, 0))
+        self.assertEqual(len(statements), 1)  # Только чтение хэшей
+        self.assertEqual(sync_employer_industries(self.session, {2: []}), (0, 1))
+        self.session.commit()
+        self.assertEqual(self.session.query(employer_industries).count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
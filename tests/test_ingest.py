@@ -0,0 +1,404 @@
+import unittest
+from datetime import date, datetime, timedelta
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from database.models import (Base, ExperienceLevel, WorkFormat, Vacancy, KeySkill, KeySkillHistory, SearchQuery,
+                             VacancyStatusHistory, VacancyVerification, CrawlRun, DigestItem,
+                             search_query_vacancies)
+from database.dimensions import DimensionRegistry
+from database.skills import reconcile_key_skills
+from database.ingest import VacancyBatch, write_vacancies
+from database.refresh import payload_hash, archived_hash, changed_vacancies
+from database.verification import load_missing_vacancies, archive_vacancies, enqueue_missing, clear_seen, \
+    due_verifications, record_verification, ARCHIVED_CHANGE, QUEUE_GONE, NOT_FOUND_LIMIT, NOT_FOUND_BACKOFF, \
+    VERIFY_CLAIM_TIMEOUT
+from database.checkpoint import CrawlCheckpoint, PHASE_DETAILS, STATUS_FAILED, MODE_FULL, MODE_INCREMENTAL, \
+    WATERMARK_OVERLAP, plan_mode
+
+
+class TestDimensionRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.session.add(ExperienceLevel(id_external='noExperience', name='Нет опыта'))
+        self.session.commit()
+        self.registry = DimensionRegistry()
+        self.registry.load(self.session)
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_known_value_is_resolved_from_memory(self):
+        expected_id = self.session.query(ExperienceLevel.id).scalar()
+        statements = []
+        event.listen(self.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        experience_id = self.registry.resolve(self.session, ExperienceLevel, {'id': 'noExperience', 'name': ''})
+        self.assertEqual(experience_id, expected_id)
+        self.assertEqual(statements, [])
+
+    def test_unknown_values_are_inserted_once(self):
+        items = [{'id': 'REMOTE', 'name': 'Удалённо'}, {'id': 'ON_SITE', 'name': 'На месте'},
+                 {'id': 'REMOTE', 'name': 'Удалённо'}]
+        ids = self.registry.resolve_many(self.session, WorkFormat, items)
+        self.session.commit()
+        self.assertEqual(ids[0], ids[2])
+        self.assertEqual(self.session.query(WorkFormat).count(), 2)
+        # После commit значения попадают в общий словарь
+        self.assertEqual(self.registry.resolve(self.session, WorkFormat, items[1]), ids[1])
+
+    def test_rolled_back_values_are_forgotten(self):
+        self.registry.resolve(self.session, WorkFormat, {'id': 'HYBRID', 'name': 'Гибрид'})
+        self.session.rollback()
+        work_format_id = self.registry.resolve(self.session, WorkFormat, {'id': 'HYBRID', 'name': 'Гибрид'})
+        self.session.commit()
+        self.assertEqual(work_format_id, self.session.query(WorkFormat.id).filter_by(id_external='HYBRID').scalar())
+
+    def test_released_savepoint_does_not_promote_values(self):
+        with self.session.begin_nested():
+            self.registry.resolve(self.session, WorkFormat, {'id': 'HYBRID', 'name': 'Гибрид'})
+        self.session.rollback()
+        work_format_id = self.registry.resolve(self.session, WorkFormat, {'id': 'HYBRID', 'name': 'Гибрид'})
+        self.session.commit()
+        self.assertEqual(work_format_id, self.session.query(WorkFormat.id).filter_by(id_external='HYBRID').scalar())
+
+
+class TestReconcileKeySkills(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.vacancies = [Vacancy(external_id=str(i), title=f'Vacancy {i}', status='Активный') for i in range(2)]
+        self.session.add_all(self.vacancies)
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def active_skills(self, vacancy):
+        return {name for name, in self.session.query(KeySkill.name).join(
+            KeySkillHistory, KeySkillHistory.key_skill_id == KeySkill.id).filter(
+            KeySkillHistory.vacancy_id == vacancy.id, KeySkillHistory.is_active.is_(True))}
+
+    def test_batch_add_deactivate_and_reactivate(self):
+        first, second = self.vacancies
+        reconcile_key_skills(self.session, {first.id: ['Python', 'SQL'], second.id: ['Python']})
+        self.session.commit()
+        self.assertEqual(self.session.query(KeySkill).count(), 2)
+
+        reconcile_key_skills(self.session, {first.id: ['Python', 'Airflow']})
+        self.session.commit()
+        self.assertEqual(self.active_skills(first), {'Python', 'Airflow'})
+
+        stats = reconcile_key_skills(self.session, {first.id: ['SQL']})
+        self.session.commit()
+        self.assertEqual(stats, {'added': 0, 'deactivated': 2, 'reactivated': 1})
+        self.assertEqual(self.active_skills(first), {'SQL'})
+        self.assertEqual(self.active_skills(second), {'Python'})
+        # Возврат навыка не создает дубликатов в истории
+        self.assertEqual(self.session.query(KeySkillHistory).filter_by(vacancy_id=first.id).count(), 3)
+
+    def test_statement_count_does_not_depend_on_skill_count(self):
+        skills_by_vacancy = {vacancy.id: [f'Skill {i}' for i in range(30)] for vacancy in self.vacancies}
+        statements = []
+        event.listen(self.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        reconcile_key_skills(self.session, skills_by_vacancy)
+        # SELECT навыков, INSERT IGNORE, повторный SELECT, SELECT истории, INSERT истории
+        self.assertLessEqual(len(statements), 5)
+
+
+def make_record(external_id, search_query_id, key_skills=()):
+    return {
+        'external_id': external_id,
+        'vacancy': {'external_id': external_id, 'title': f'Vacancy {external_id}', 'status': 'Активный'},
+        'salary': None,
+        'key_skills': list(key_skills),
+        'work_schedule_ids': [],
+        'work_format_ids': [],
+        'search_query_ids': [search_query_id],
+    }
+
+
+class TestVacancyBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.query = SearchQuery(query='python', initiator='admin', email='admin@example.com')
+        self.session.add(self.query)
+        self.session.add(Vacancy(external_id='1', title='Vacancy 1', status='Активный'))
+        self.session.commit()
+        self.commits = []
+        event.listen(self.session, 'after_commit', self.on_commit)
+
+    def tearDown(self):
+        self.session.close()
+
+    def on_commit(self, session):
+        if not session.in_nested_transaction():  # Освобождение точек сохранения не считается
+            self.commits.append(session)
+
+    def test_batch_is_written_in_one_transaction(self):
+        batch = VacancyBatch(self.session, batch_size=10)
+        for external_id in ('2', '3', '4'):
+            batch.add(make_record(external_id, self.query.id, ['Python', 'SQL']))
+        self.assertEqual(self.commits, [])
+        batch.flush()
+        self.assertEqual(len(self.commits), 1)
+        self.assertEqual(batch.written_ids, ['2', '3', '4'])
+        self.assertEqual(self.session.query(Vacancy).count(), 4)
+        self.assertEqual(self.session.query(VacancyStatusHistory).count(), 3)
+        self.assertEqual(self.session.query(search_query_vacancies).count(), 3)
+        self.assertEqual(self.session.query(DigestItem).count(), 3)
+        self.assertEqual(self.session.query(KeySkill).count(), 2)
+
+    def test_failed_record_does_not_discard_batch(self):
+        batch = VacancyBatch(self.session, batch_size=4)
+        broken = make_record('4', self.query.id)
+        broken['vacancy']['title'] = None  # Нарушает NOT NULL
+        batch.add(make_record('2', self.query.id))
+        batch.add(broken)
+        batch.add(make_record('1', self.query.id))  # Уже записана параллельным процессом
+        batch.add(make_record('3', self.query.id))
+        self.assertEqual(batch.failed_ids, ['4'])
+        self.assertEqual(batch.written_ids, ['2', '1', '3'])
+        self.assertEqual(len(self.commits), 1)
+        self.assertEqual(self.session.query(Vacancy).count(), 3)
+        # Существующая вакансия только связана с запросом, ее дочерние строки не дублируются
+        self.assertEqual(self.session.query(search_query_vacancies).count(), 3)
+        self.assertEqual(self.session.query(DigestItem).count(), 3)
+        self.assertEqual(self.session.query(VacancyStatusHistory).count(), 2)
+
+    def test_ids_are_mapped_without_returning(self):
+        # Так же, как MySQL: id читаются обратно по external_id
+        self.engine.dialect.insert_executemany_returning = False
+        ids = write_vacancies(self.session, [make_record(str(i), self.query.id) for i in range(2, 6)])
+        self.session.commit()
+        self.assertEqual(ids, dict(self.session.query(Vacancy.external_id, Vacancy.id).filter(
+            Vacancy.external_id != '1')))
+        status_ids = {vacancy_id for vacancy_id, in self.session.query(VacancyStatusHistory.vacancy_id)}
+        self.assertEqual(status_ids, set(ids.values()))
+
+    def test_links_to_existing_vacancies_are_idempotent(self):
+        existing_id = self.session.query(Vacancy.id).scalar()
+        batch = VacancyBatch(self.session)
+        batch.link(self.query.id, existing_id)
+        batch.flush()
+        batch.link(self.query.id, existing_id)
+        batch.flush()
+        self.assertEqual(self.session.query(search_query_vacancies).count(), 1)
+        self.assertEqual(self.session.query(DigestItem).count(), 1)
+
+
+class TestCrawlCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        self.query = SearchQuery(query='python', initiator='admin', email='admin@example.com')
+        self.session.add(self.query)
+        self.session.commit()
+        self.run_date = date(2026, 1, 1)
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_interrupted_run_is_resumed(self):
+        checkpoint = CrawlCheckpoint.start(self.session, self.query.id, self.run_date)
+        partitions = [{'text': 'python', 'per_page': 100, 'date_from': '2026-01-01T00:00:00'}]
+        checkpoint.set_partitions(partitions)
+        checkpoint.page_done('0:0', 3, (100, 10))
+        checkpoint.page_done('0:2', 3, (200, 20))
+        checkpoint.set_phase(PHASE_DETAILS)
+        checkpoint.finish(STATUS_FAILED, 'HTTP 502')
+
+        session = self.Session()  # Перезапуск процесса
+        resumed = CrawlCheckpoint.start(session, self.query.id, self.run_date)
+        self.assertTrue(resumed.resumed)
+        self.assertEqual(resumed.run.id, checkpoint.run.id)
+        self.assertEqual(resumed.phase, PHASE_DETAILS)
+        self.assertEqual(resumed.partitions, partitions)
+        self.assertEqual(resumed.completed_pages, {'0:0', '0:2'})
+        self.assertEqual(resumed.snapshot_sizes, (200, 20))
+        resumed.finish()
+        session.close()
+
+        self.assertFalse(CrawlCheckpoint.start(self.Session(), self.query.id, self.run_date).resumed)
+
+    def test_incremental_mode_follows_recent_full_run(self):
+        now = datetime(2026, 1, 10, 12, 0, 0)
+        self.assertEqual(plan_mode(self.session, self.query.id, now), (MODE_FULL, None))
+
+        self.session.add_all([
+            CrawlRun(search_query_id=self.query.id, run_date=date(2026, 1, 8), phase=PHASE_DETAILS,
+                     status='completed', mode=MODE_FULL, started_at=now - timedelta(days=2)),
+            CrawlRun(search_query_id=self.query.id, run_date=date(2026, 1, 9), phase=PHASE_DETAILS,
+                     status='completed', mode=MODE_INCREMENTAL, started_at=now - timedelta(days=1)),
+            CrawlRun(search_query_id=self.query.id, run_date=date(2026, 1, 10), phase=PHASE_DETAILS,
+                     status='failed', mode=MODE_INCREMENTAL, started_at=now - timedelta(hours=1)),
+        ])
+        self.session.commit()
+        self.assertEqual(plan_mode(self.session, self.query.id, now),
+                         (MODE_INCREMENTAL, now - timedelta(days=1) - WATERMARK_OVERLAP))
+        # Полный прогон давно не выполнялся: архивацию нужно проверить заново
+        self.assertEqual(plan_mode(self.session, self.query.id, now + timedelta(days=7))[0], MODE_FULL)
+
+
+class TestMissingVacancyVerification(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        updated_at = datetime(2026, 1, 1)
+        for i in range(4):
+            vacancy = Vacancy(external_id=str(i), title=f'Vacancy {i}', status='Активный', updated_at=updated_at)
+            self.session.add(vacancy)
+            self.session.flush()
+            self.session.add(VacancyStatusHistory(vacancy_id=vacancy.id, prev_status='Отсутствует',
+                                                  cur_status='Активный', type_changed='Первичная загрузка'))
+        # Вакансия 3 уже переведена в архив прошлой проверкой
+        self.session.add(VacancyStatusHistory(vacancy_id=4, prev_status='Активный', cur_status='Архивный',
+                                              type_changed=ARCHIVED_CHANGE))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_latest_status_is_loaded_in_one_query(self):
+        statements = []
+        event.listen(self.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        vacancies = {v.external_id: v for v in load_missing_vacancies(self.session, ['1', '3', 'unknown'])}
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(set(vacancies), {'1', '3'})
+        self.assertEqual(vacancies['1'].last_change, 'Первичная загрузка')
+        self.assertEqual(vacancies['3'].last_change, ARCHIVED_CHANGE)
+
+    def test_archive_is_applied_in_bulk(self):
+        vacancies = load_missing_vacancies(self.session, ['0', '1', '2', '3'])
+        statements = []
+        event.listen(self.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        archived = archive_vacancies(self.session, vacancies)
+        self.session.commit()
+        self.assertEqual(sorted(archived), ['0', '1', '2'])  # Вакансия 3 уже в архиве
+        self.assertLessEqual(len(statements), 2)  # INSERT истории и UPDATE статуса
+        self.assertEqual(self.session.query(Vacancy).filter_by(status='Архивный').count(), 3)
+        self.assertEqual(self.session.query(VacancyStatusHistory).filter_by(type_changed=ARCHIVED_CHANGE).count(), 4)
+
+
+class TestVerificationQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        for i in range(3):
+            self.session.add(Vacancy(external_id=str(i), title=f'Vacancy {i}', status='Активный',
+                                     updated_at=datetime(2026, 1, 1)))
+        self.session.add(Vacancy(external_id='archived', title='Archived', status='Архивный'))
+        self.session.commit()
+        self.now = datetime(2026, 3, 1, 12)
+
+    def tearDown(self):
+        self.session.close()
+
+    def due(self, now):
+        return sorted(v.external_id for v in due_verifications(self.session, now=now))
+
+    def test_vacancy_is_checked_after_consecutive_misses(self):
+        self.assertEqual(enqueue_missing(self.session, ['0', '1', 'archived'], now=self.now), 0)
+        # Повторный пропуск в тот же день (другой запрос или повторная попытка) не учитывается
+        self.assertEqual(enqueue_missing(self.session, ['0', '1'], now=self.now + timedelta(hours=1)), 0)
+        self.assertEqual(self.due(self.now + timedelta(days=2)), [])
+        self.assertEqual(clear_seen(self.session, {'1', '2'}), 1)  # Вакансия 1 снова в выдаче
+        next_day = self.now + timedelta(days=1)
+        self.assertEqual(enqueue_missing(self.session, ['0', '1'], now=next_day), 1)
+        self.session.commit()
+        self.assertEqual(self.due(next_day), ['0'])
+        self.assertEqual(self.session.query(VacancyVerification).count(), 2)  # Архивная вакансия не в очереди
+
+    def test_not_found_backs_off_until_gone(self):
+        enqueue_missing(self.session, ['0', '1', '2'], now=self.now)
+        now = self.now + timedelta(days=1)
+        enqueue_missing(self.session, ['0', '1', '2'], now=now)
+        vacancies = due_verifications(self.session, now=now)
+        archived, active, gone = record_verification(
+            self.session, vacancies, {'0': {'archived': True}, '1': {'archived': False}}, ['2'], now=now)
+        self.session.commit()
+        self.assertEqual((archived, active, gone), (['0'], ['1'], []))
+        self.assertEqual(self.session.query(VacancyVerification).count(), 1)
+        delay = NOT_FOUND_BACKOFF
+        for attempt in range(2, NOT_FOUND_LIMIT + 1):
+            self.assertEqual(self.due(now + delay - timedelta(seconds=1)), [])
+            now += delay
+            vacancies = due_verifications(self.session, now=now)
+            self.assertEqual([vacancy.external_id for vacancy in vacancies], ['2'])
+            archived, active, gone = record_verification(self.session, vacancies, {}, ['2'], now=now)
+            self.session.commit()
+            delay *= 2
+        self.assertEqual(gone, ['2'])
+        self.assertEqual(self.session.query(VacancyVerification).one().status, QUEUE_GONE)
+        self.assertEqual(self.due(now + timedelta(days=365)), [])
+
+    def test_claimed_vacancies_are_not_returned_until_claim_expires(self):
+        enqueue_missing(self.session, ['0', '1'], now=self.now)
+        now = self.now + timedelta(days=1)
+        enqueue_missing(self.session, ['0', '1'], now=now)
+        self.session.commit()
+        self.assertEqual(self.due(now), ['0', '1'])
+        # Выбор зафиксирован до проверки: откат сессии исполнителя его не отменяет
+        self.session.rollback()
+        self.assertEqual(self.due(now), [])
+        self.assertEqual(self.due(now + VERIFY_CLAIM_TIMEOUT), ['0', '1'])
+
+
+class TestPayloadHash(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.item = {'id': '1', 'name': 'Python developer', 'salary': {'from': 100000, 'to': None},
+                     'archived': False, 'published_at': '2026-03-01T10:00:00+0300', 'url': 'https://hh.ru/1'}
+        self.session.add(Vacancy(external_id='1', title='Python developer', status='Активный',
+                                 payload_hash=payload_hash(self.item)))
+        self.session.add(Vacancy(external_id='legacy', title='Legacy', status='Активный'))
+        self.session.add(Vacancy(external_id='archived', title='Archived', status='Архивный',
+                                 payload_hash=payload_hash({'id': 'archived', 'name': 'Archived'})))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_only_listing_fields_affect_hash(self):
+        self.assertEqual(payload_hash(self.item), payload_hash({**self.item, 'url': 'https://hh.ru/other'}))
+        self.assertNotEqual(payload_hash(self.item),
+                            payload_hash({**self.item, 'salary': {'from': 120000, 'to': None}}))
+
+    def test_changed_and_revived_vacancies_are_selected(self):
+        stored_hash = payload_hash({'id': 'archived', 'name': 'Archived'})
+        changed = changed_vacancies(self.session, {'1': payload_hash(self.item), 'legacy': 'new',
+                                                   'archived': stored_hash})
+        self.session.commit()
+        # Вакансия без хэша получает его без обновления, архивная снова активна в выдаче
+        self.assertEqual(changed, ['archived'])
+        self.assertEqual(self.session.query(Vacancy.payload_hash).filter_by(external_id='legacy').scalar(), 'new')
+        self.assertEqual(changed_vacancies(self.session, {'1': 'other', 'archived': stored_hash},
+                                           {'archived'}), ['1'])
+
+    def test_confirmed_archive_is_not_selected_until_listing_changes(self):
+        listing_hash = payload_hash({'id': 'archived', 'name': 'Archived'})
+        self.session.query(Vacancy).filter_by(external_id='archived').update(
+            {'payload_hash': archived_hash(listing_hash)})
+        self.assertEqual(changed_vacancies(self.session, {'archived': listing_hash}), [])
+        self.assertEqual(changed_vacancies(self.session, {'archived': payload_hash({'name': 'Renamed'})}),
+                         ['archived'])
+
+
+if __name__ == '__main__':
+    unittest.main()
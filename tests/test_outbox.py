@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from email import message_from_bytes
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database.models import Base, EmailOutbox
+from database.outbox import enqueue_email, deliver, EMAIL_SENT, EMAIL_FAILED, EMAIL_MAX_ATTEMPTS, EMAIL_RETRY_DELAY
+from utils.mailer import FileTransport
+
+
+class FailingTransport:
+
+    def __init__(self):
+        self.calls = 0
+
+    def send(self, subject, body, recipient_email):
+        self.calls += 1
+        raise ConnectionError('Gmail API is unavailable')
+
+
+class TestEmailOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.now = datetime(2026, 3, 1, 12)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.session.close()
+        self.tmp_dir.cleanup()
+
+    def test_queued_emails_are_written_by_file_transport(self):
+        self.assertTrue(enqueue_email(self.session, 'Новые вакансии', '<p>Python</p>', 'user@example.com',
+                                      now=self.now))
+        self.assertFalse(enqueue_email(self.session, 'Отчет', '<p>—</p>', None, now=self.now))
+        self.session.commit()
+        sent, failed = deliver(self.session, FileTransport(self.tmp_dir.name), now=self.now)
+        self.assertEqual((len(sent), failed), (1, []))
+        self.assertEqual(self.session.query(EmailOutbox).one().status, EMAIL_SENT)
+        [name] = os.listdir(self.tmp_dir.name)
+        with open(os.path.join(self.tmp_dir.name, name), 'rb') as message_file:
+            message = message_from_bytes(message_file.read())
+        self.assertEqual(message['to'], 'user@example.com')
+        self.assertEqual(deliver(self.session, FileTransport(self.tmp_dir.name), now=self.now), ([], []))
+
+    def test_failed_email_is_retried_with_backoff(self):
+        enqueue_email(self.session, 'Отчет', '<p>Отчет</p>', 'admin@example.com', now=self.now)
+        self.session.commit()
+        transport = FailingTransport()
+        now, delay = self.now, EMAIL_RETRY_DELAY
+        for attempt in range(EMAIL_MAX_ATTEMPTS):
+            self.assertEqual(deliver(self.session, transport, now=now)[1], [1])
+            # До истечения отсрочки письмо не отправляется повторно
+            self.assertEqual(deliver(self.session, transport, now=now + delay / 2), ([], []))
+            now += delay
+            delay *= 2
+        email = self.session.query(EmailOutbox).one()
+        self.assertEqual((email.status, email.attempts, transport.calls),
+                         (EMAIL_FAILED, EMAIL_MAX_ATTEMPTS, EMAIL_MAX_ATTEMPTS))
+        self.assertIn('unavailable', email.last_error)
+
+
+if __name__ == '__main__':
+    unittest.main()
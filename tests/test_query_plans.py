@@ -0,0 +1,130 @@
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.orm import sessionmaker
+from database.models import Base, Employer, Industry, ExperienceLevel, ProfessionalRole, WorkFormat, Vacancy, \
+    SalaryHistory, VacancyStatusHistory, SearchQuery, vacancy_work_formats, search_query_vacancies, employer_industries
+from database.skills import reconcile_key_skills
+from database.aggregates import refresh_query_aggregates, read_aggregate
+from database.data_versions import queries_of_vacancies
+from database.refresh import changed_vacancies
+from database.employers import stale_employers
+from database.verification import load_missing_vacancies
+
+# Таблицы, растущие с числом вакансий: их полный просмотр в плане считается регрессией, как и
+# AUTOMATIC INDEX — индекс, который SQLite строит на время запроса просмотром всей таблицы.
+# Справочники (опыт, форматы работы, ...) малы и могут просматриваться целиком
+LARGE_TABLES = {'vacancies', 'search_query_vacancies', 'key_skill_history', 'salary_history',
+                'vacancy_status_history', 'vacancy_work_formats', 'employer_industries', 'employers',
+                'query_aggregates'}
+QUERIES = 20
+EMPLOYERS = 1000
+VACANCIES = 5000
+
+
+class TestQueryPlans(unittest.TestCase):
+    """EXPLAIN QUERY PLAN запросов сводок дашборда и поиска при сборе на наборе данных, похожем на рабочий."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(cls.engine)
+        cls.session = sessionmaker(bind=cls.engine)()
+        session = cls.session
+        session.execute(SearchQuery.__table__.insert(), [
+            {'id': i + 1, 'query': f'query {i}', 'initiator': 'admin', 'email': 'admin@example.com'}
+            for i in range(QUERIES)])
+        session.execute(ExperienceLevel.__table__.insert(), [
+            {'id': i + 1, 'id_external': f'experience{i}', 'name': f'Опыт {i}'} for i in range(4)])
+        session.execute(ProfessionalRole.__table__.insert(), [
+            {'id': i + 1, 'id_external': i + 1, 'name': f'Роль {i}'} for i in range(30)])
+        session.execute(WorkFormat.__table__.insert(), [
+            {'id': i + 1, 'id_external': f'format{i}', 'name': f'Формат {i}'} for i in range(4)])
+        session.execute(Industry.__table__.insert(), [
+            {'id': i + 1, 'id_external': f'{i}.1', 'name': f'Отрасль {i}'} for i in range(50)])
+        session.execute(Employer.__table__.insert(), [
+            {'id': i + 1, 'id_external': i + 1, 'name': f'Работодатель {i}', 'area': f'Город {i % 40}',
+             'accredited_it_employer': i % 3 == 0} for i in range(EMPLOYERS)])
+        session.execute(employer_industries.insert(), [
+            {'employer_id': i + 1, 'industry_id': (i * 7 + k) % 50 + 1} for i in range(EMPLOYERS) for k in range(2)])
+        session.execute(Vacancy.__table__.insert(), [
+            {'id': i + 1, 'external_id': str(i), 'title': f'Вакансия {i}',
+             'status': 'Архивный' if i % 4 == 0 else 'Активный', 'employer_id': i * 37 % EMPLOYERS + 1,
+             'experience_id': i % 4 + 1, 'professional_role_id': i % 30 + 1, 'payload_hash': str(i)}
+            for i in range(VACANCIES)])
+        session.execute(search_query_vacancies.insert(), [
+            {'search_query_id': query_id + 1, 'vacancy_id': i + 1}
+            for i in range(VACANCIES) for query_id in {i % QUERIES, i * 3 % QUERIES}])
+        session.execute(vacancy_work_formats.insert(), [
+            {'vacancy_id': i + 1, 'work_format_id': i % 4 + 1} for i in range(VACANCIES)])
+        session.execute(SalaryHistory.__table__.insert(), [
+            {'vacancy_id': i + 1, 'salary_from': 1000 * (i % 50), 'currency': 'RUR', 'is_active': active}
+            for i in range(VACANCIES) for active in (False, True)])
+        session.execute(VacancyStatusHistory.__table__.insert(), [
+            {'vacancy_id': i + 1, 'prev_status': 'Новая', 'cur_status': 'Активный',
+             'created_at_cur_status': datetime(2026, 1, 1) + timedelta(days=i % 30)}
+            for i in range(VACANCIES) for _ in range(2)])
+        reconcile_key_skills(session, {i + 1: [f'Навык {(i + k) % 200}' for k in range(5)] for i in range(VACANCIES)})
+        session.commit()
+        # Статистика распределения значений для планировщика, как после ANALYZE TABLE в MySQL
+        session.execute(text('ANALYZE'))
+        session.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.session.close()
+
+    def capture(self, action):
+        """SELECT-запросы, выполненные action(), с параметрами."""
+        statements = []
+
+        def listener(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(('SELECT', 'WITH')) and not executemany:
+                statements.append((statement, parameters))
+
+        event.listen(self.engine, 'before_cursor_execute', listener)
+        try:
+            action()
+        finally:
+            event.remove(self.engine, 'before_cursor_execute', listener)
+        self.assertTrue(statements)
+        return statements
+
+    def assert_no_full_scans(self, action, scanned=()):
+        """scanned — таблицы, которые запрос просматривает целиком по смыслу."""
+        for statement, parameters in self.capture(action):
+            plan = [row[3] for row in self.session.connection().exec_driver_sql(
+                'EXPLAIN QUERY PLAN ' + statement, parameters)]
+            full_scans = [step for step in plan if (step.startswith('SCAN ') or 'AUTOMATIC' in step)
+                          and step.split()[1] in LARGE_TABLES - set(scanned)]
+            self.assertEqual(full_scans, [], f"{statement}\n" + '\n'.join(plan))
+
+    def test_dashboard_aggregates(self):
+        self.assert_no_full_scans(lambda: refresh_query_aggregates(self.session, 1))
+        self.assert_no_full_scans(lambda: read_aggregate(self.session, 1, 'top_skills'))
+
+    def test_vacancy_lookups(self):
+        external_ids = [str(i) for i in range(0, VACANCIES, 50)]
+        self.assert_no_full_scans(lambda: load_missing_vacancies(self.session, external_ids))
+        self.assert_no_full_scans(lambda: changed_vacancies(self.session, {external_id: external_id
+                                                                           for external_id in external_ids}))
+        self.assert_no_full_scans(lambda: queries_of_vacancies(self.session, range(1, VACANCIES, 50)))
+        # Вакансии запроса (linked_vacancy_ids) и активная зарплата вакансии (update_salary_history)
+        self.assert_no_full_scans(lambda: self.session.execute(
+            select(Vacancy.external_id).join(search_query_vacancies)
+            .where(search_query_vacancies.c.search_query_id == 1)).all())
+        self.assert_no_full_scans(lambda: self.session.query(SalaryHistory).filter_by(
+            vacancy_id=1, is_active=True).first())
+
+    def test_stale_employers(self):
+        # Устаревшим может быть любой работодатель, но активные вакансии считаются по индексу
+        self.assert_no_full_scans(lambda: stale_employers(self.session, 100), scanned=['employers'])
+
+    def test_key_skill_reconciliation(self):
+        self.assert_no_full_scans(lambda: reconcile_key_skills(
+            self.session, {i + 1: ['Навык 1', 'Навык 2'] for i in range(0, VACANCIES, 50)}))
+        self.session.rollback()
+
+
+if __name__ == '__main__':
+    unittest.main()
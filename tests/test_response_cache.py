@@ -0,0 +1,99 @@
+import os
+import tempfile
+import time
+import unittest
+from flask import Flask, jsonify
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database.models import Base, SearchQuery
+from database.data_versions import bump_data_versions, data_versions
+from utils.response_cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.versions = {1: 0}
+        self.calls = []
+        self.cache = ResponseCache(lambda: dict(self.versions), os.path.join(self.directory.name, 'api.sqlite3'),
+                                   ttl=3600, version_interval=0)
+        app = Flask(__name__)
+
+        @app.route('/stats/<int:search_query_id>')
+        @self.cache.cached
+        def stats(search_query_id):
+            self.calls.append(search_query_id)
+            return jsonify({'calls': len(self.calls)})
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_hit_and_invalidation_by_data_version(self):
+        self.assertEqual(self.client.get('/stats/1').json, {'calls': 1})
+        self.assertEqual(self.client.get('/stats/1').json, {'calls': 1})
+        # Параметры строки запроса не входят в ключ
+        self.assertEqual(self.client.get('/stats/1?limit=5').json, {'calls': 1})
+        self.versions[1] += 1
+        self.assertEqual(self.client.get('/stats/1').json, {'calls': 2})
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 2))
+
+    def test_query_without_version_is_not_cached(self):
+        self.versions.clear()  # Сводки запроса еще не посчитаны
+        self.assertEqual(self.client.get('/stats/1').json, {'calls': 1})
+        self.assertEqual(self.client.get('/stats/1').json, {'calls': 2})
+        self.versions[1] = 0
+        self.assertEqual(self.client.get('/stats/1').json, {'calls': 3})
+        self.assertEqual(self.client.get('/stats/1').json, {'calls': 3})
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.versions.update({2: 0, 3: 0})
+        for search_query_id in (1, 2):
+            self.client.get(f'/stats/{search_query_id}')
+        self.client.get('/stats/1')
+        self.client.get('/stats/3')
+        # Места хватает на две записи: вытесняется давно не читавшийся запрос 2
+        self.cache.max_bytes = 2 * len(self.client.get('/stats/3').get_data())
+        self.cache._evict(self.cache._connection())
+        self.assertIsNotNone(self.cache.lookup('stats:1'))
+        self.assertIsNotNone(self.cache.lookup('stats:3'))
+        self.assertIsNone(self.cache.lookup('stats:2'))
+
+    def test_expired_entry_is_served_and_refreshed_in_background(self):
+        self.cache.ttl = 0
+        self.assertEqual(self.client.get('/stats/1').json, {'calls': 1})
+        self.assertEqual(self.client.get('/stats/1').json, {'calls': 1})
+        for _ in range(100):
+            if not self.cache._refreshing and len(self.calls) == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.cache.stale, 1)
+        self.assertEqual(self.client.get('/stats/1').json, {'calls': 2})
+
+
+class TestDataVersions(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.session.add_all([SearchQuery(query='python', initiator='admin', email='admin@example.com'),
+                              SearchQuery(query='golang', initiator='admin', email='admin@example.com')])
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_bump_creates_and_increments_versions(self):
+        self.assertEqual(data_versions(self.session), {})
+        bump_data_versions(self.session, [1, 1])
+        bump_data_versions(self.session, [1])
+        bump_data_versions(self.session)
+        self.session.commit()
+        self.assertEqual(data_versions(self.session), {1: 3, 2: 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+import unittest
+from crawler.snapshot import SnapshotReader, SnapshotWriter, snapshot_path, legacy_snapshot_path
+
+
+def make_page(page, per_page=20):
+    return [{'id': str(page * per_page + i), 'name': f'Вакансия {page}-{i} ', 'employer': {'id': str(i)}}
+            for i in range(per_page)]
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = snapshot_path(1, '2026-01-01', self.tmp_dir.name)
+        self.pages = [make_page(page) for page in range(5)]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self):
+        with SnapshotWriter(self.path) as snapshot:
+            for items in self.pages:
+                snapshot.write_page(items)
+        return snapshot
+
+    def test_records_are_read_back_in_order(self):
+        snapshot = self.write()
+        self.assertEqual(snapshot.count, 100)
+        self.assertEqual(list(SnapshotReader(self.path)), [item for items in self.pages for item in items])
+        self.assertEqual(len(SnapshotReader(self.path).ids()), 100)
+
+    def test_lookup_by_external_id(self):
+        self.write()
+        reader = SnapshotReader(self.path)
+        found = reader.get_many(['5', '47', '99', 'unknown'])
+        self.assertEqual(found, {'5': self.pages[0][5], '47': self.pages[2][7], '99': self.pages[4][19]})
+        self.assertEqual(reader.get(61), self.pages[3][1])
+
+    def test_pages_survive_interrupted_write(self):
+        snapshot = SnapshotWriter(self.path)
+        for items in self.pages[:3]:
+            snapshot.write_page(items)
+        # Процесс упал посреди записи следующей страницы
+        snapshot._file.write(b'\x1f\x8b\x08\x00broken')
+        snapshot._file.flush()
+        records = list(SnapshotReader(self.path))
+        self.assertEqual(records, [item for items in self.pages[:3] for item in items])
+        self.assertEqual(SnapshotReader(self.path).get('45'), self.pages[2][5])
+
+    def test_web_snapshot_does_not_overwrite_crawl_snapshot(self):
+        self.write()
+        with SnapshotWriter(snapshot_path(1, '2026-01-01', self.tmp_dir.name, source='web')) as snapshot:
+            snapshot.write_page(self.pages[0][:3])
+        self.assertEqual(len(SnapshotReader.open(1, '2026-01-01', self.tmp_dir.name).ids()), 100)
+
+    def test_resume_drops_unfinished_page(self):
+        snapshot = SnapshotWriter(self.path)
+        for items in self.pages[:2]:
+            snapshot.write_page(items)
+        sizes = snapshot.sizes()
+        snapshot.write_page(self.pages[2])  # Страница записана, но не отмечена в контрольной точке
+        snapshot._file.close()
+        snapshot._index.close()
+        with SnapshotWriter(self.path, resume=sizes) as snapshot:
+            for items in self.pages[2:]:
+                snapshot.write_page(items)
+        reader = SnapshotReader(self.path)
+        self.assertEqual(list(reader), [item for items in self.pages for item in items])
+        self.assertEqual(reader.get('55'), self.pages[2][15])
+
+    def test_smaller_than_indented_json(self):
+        self.write()
+        legacy_path = legacy_snapshot_path(1, '2026-01-01', self.tmp_dir.name)
+        with open(legacy_path, 'w', encoding='utf-8') as f:
+            json.dump([item for items in self.pages for item in items], f, ensure_ascii=False, indent=4)
+        self.assertLess(os.path.getsize(self.path) * 3, os.path.getsize(legacy_path))
+
+    def test_legacy_json_snapshot_is_readable(self):
+        legacy_path = legacy_snapshot_path(2, '2026-01-01', self.tmp_dir.name)
+        with open(legacy_path, 'w', encoding='utf-8') as f:
+            json.dump(self.pages[0], f, ensure_ascii=False, indent=4)
+        reader = SnapshotReader.open(2, '2026-01-01', self.tmp_dir.name)
+        self.assertEqual(reader.path, legacy_path)
+        self.assertEqual(reader.get('3'), self.pages[0][3])
+        self.assertIsNone(SnapshotReader.open(3, '2026-01-01', self.tmp_dir.name))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database.models import Base, CrawlTask, moscow_tz
+from database.task_queue import enqueue, claim, heartbeat, complete, fail, LeaseKeeper, TASK_DONE, TASK_FAILED, \
+    TASK_PENDING, TASK_MAX_ATTEMPTS
+
+
+class TestTaskQueue(unittest.TestCase):
+
+    def setUp(self):
+        # Файловая база: исполнители работают в разных сессиях и соединениях
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmp_dir.name, 'tasks.sqlite3')}")
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        with self.Session() as session:
+            for i in range(3):
+                enqueue(session, 'crawl', {'query_ids': [i]}, key=f'crawl:{i}')
+            enqueue(session, 'crawl', {'query_ids': [0]}, key='crawl:0')  # Повторная постановка пропускается
+            session.commit()
+        self.now = datetime.now(moscow_tz).replace(tzinfo=None) + timedelta(minutes=1)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def test_workers_claim_distinct_tasks(self):
+        with self.Session() as first, self.Session() as second:
+            claimed_first = claim(first, 'node-1', limit=2, now=self.now)
+            claimed_second = claim(second, 'node-2', limit=2, now=self.now)
+        self.assertEqual([task['payload'] for task in claimed_first], [{'query_ids': [0]}, {'query_ids': [1]}])
+        self.assertEqual([task['payload'] for task in claimed_second], [{'query_ids': [2]}])
+        with self.Session() as session:
+            self.assertEqual(claim(session, 'node-3', now=self.now), [])
+            self.assertTrue(complete(session, claimed_second[0]['id'], 'node-2'))
+            self.assertEqual(session.get(CrawlTask, claimed_second[0]['id']).status, TASK_DONE)
+
+    def test_expired_lease_is_reclaimed(self):
+        with self.Session() as session:
+            task = claim(session, 'node-1', lease_seconds=60, now=self.now)[0]
+            self.assertTrue(heartbeat(session, task['id'], 'node-1', lease_seconds=60, now=self.now))
+            # node-1 перестал продлевать аренду, задачу забирает другой исполнитель
+            later = self.now + timedelta(seconds=61)
+            reclaimed = claim(session, 'node-2', now=later)[0]
+            self.assertEqual(reclaimed['id'], task['id'])
+            self.assertEqual(reclaimed['attempts'], 2)
+            self.assertFalse(heartbeat(session, task['id'], 'node-1'))
+            self.assertFalse(complete(session, task['id'], 'node-1'))
+            self.assertTrue(complete(session, task['id'], 'node-2'))
+
+    def test_failed_task_is_retried_until_attempts_run_out(self):
+        now = self.now
+        with self.Session() as session:
+            enqueue(session, 'verify', {'limit': 200}, key='verify:0')
+            session.commit()
+            for attempt in range(1, TASK_MAX_ATTEMPTS + 1):
+                task = claim(session, 'node-1', kinds=['verify'], now=now)[0]
+                self.assertEqual(task['attempts'], attempt)
+                self.assertTrue(fail(session, task['id'], 'node-1', 'HH is down', now=now))
+                stored = session.get(CrawlTask, task['id'])
+                session.refresh(stored)
+                if attempt < TASK_MAX_ATTEMPTS:
+                    # Повтор откладывается, до срока задачу никто не получит
+                    self.assertEqual(stored.status, TASK_PENDING)
+                    self.assertEqual(claim(session, 'node-2', kinds=['verify'], now=now), [])
+                    now = stored.available_at
+            self.assertEqual(stored.status, TASK_FAILED)
+            self.assertEqual(stored.last_error, 'HH is down')
+
+    def test_lease_keeper_renews_lease(self):
+        with self.Session() as session:
+            task = claim(session, 'node-1', lease_seconds=1)[0]
+        with LeaseKeeper(self.Session, task['id'], 'node-1', lease_seconds=3) as lease:
+            time.sleep(1.5)
+        self.assertFalse(lease.lost)
+        with self.Session() as session:
+            self.assertGreater(session.get(CrawlTask, task['id']).lease_expires_at, task['lease_expires_at'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from sqlalchemy import select, func
+from sqlalchemy.orm import joinedload, selectinload
+from database.models import Vacancy, KeySkill, KeySkillHistory
+from database.digests import pending_digest_items, mark_digested
+from database.outbox import enqueue_email
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+TOP_SKILLS_LIMIT = 10
+
+
+def format_salary(vacancy):
+    """Активная зарплата вакансии из уже загруженной истории зарплат."""
+    active_salary = next((salary for salary in vacancy.salary_history if salary.is_active), None)
+    if active_salary is None:
+        return 'Не указана'
+    return f"{active_salary.salary_from} - {active_salary.salary_to} {active_salary.currency}"
+
+
+# Окружение создается один раз: скомпилированные шаблоны кэшируются между письмами
+environment = Environment(loader=FileSystemLoader(TEMPLATES_DIR), autoescape=select_autoescape(['html']))
+environment.filters['salary'] = format_salary
+
+
+def load_digest_vacancies(session, condition):
+    """Вакансии письма со всеми отображаемыми связями: справочники — JOIN, коллекции — по запросу IN на связь."""
+    return session.execute(
+        select(Vacancy)
+        .where(condition)
+        .options(joinedload(Vacancy.employer), joinedload(Vacancy.experience),
+                 joinedload(Vacancy.professional_role),
+                 selectinload(Vacancy.work_formats), selectinload(Vacancy.salary_history))
+    ).scalars().all()
+
+
+def by_open_vacancies(vacancies, position):
+    """Вакансии по убыванию числа открытых вакансий работодателя, при равенстве — в порядке position."""
+    return sorted(vacancies, key=lambda vacancy: (
+        -((vacancy.employer.open_vacancies or 0) if vacancy.employer else 0), position(vacancy)))
+
+
+def top_skills(session, vacancy_ids, limit=TOP_SKILLS_LIMIT):
+    """Самые частые активные ключевые навыки вакансий одним запросом GROUP BY: [(навык, число вакансий)]."""
+    if not vacancy_ids:
+        return []
+    vacancy_count = func.count(KeySkillHistory.vacancy_id.distinct())
+    return [tuple(row) for row in session.execute(
+        select(KeySkill.name, vacancy_count)
+        .join(KeySkillHistory, KeySkillHistory.key_skill_id == KeySkill.id)
+        .where(KeySkillHistory.vacancy_id.in_(list(vacancy_ids)), KeySkillHistory.is_active.is_(True))
+        .group_by(KeySkill.id, KeySkill.name)
+        .order_by(vacancy_count.desc(), KeySkill.name)
+        .limit(limit)
+    ).all()]
+
+
+def create_email_body(new_vacancies, session, query):
+    """HTML письма о новых вакансиях запроса.
+
+    new_vacancies — вакансии из выдачи HH, в письмо попадают сохраненные в базе. Вакансии
+    сортируются по числу открытых вакансий работодателя.
+    """
+    order = {vacancy_data['id']: position for position, vacancy_data in enumerate(new_vacancies)}
+    if not order:
+        vacancies = []
+    else:
+        vacancies = by_open_vacancies(load_digest_vacancies(session, Vacancy.external_id.in_(list(order))),
+                                      lambda vacancy: order[vacancy.external_id])
+    return environment.get_template('email/new_vacancies.html').render(
+        query=query, vacancies=vacancies, top_skills=top_skills(session, [vacancy.id for vacancy in vacancies]))
+
+
+def create_digest_body(session, sections):
+    """HTML сводного письма получателю по нескольким запросам.
+
+    sections — [(текст запроса, вакансии)] в порядке запросов. Вакансия, найденная по нескольким
+    запросам, показывается один раз — в первом разделе, в остальных учитывается только ее число.
+    """
+    shown, rendered = set(), []
+    for query, vacancies in sections:
+        fresh = [vacancy for vacancy in vacancies if vacancy.id not in shown]
+        shown.update(vacancy.id for vacancy in fresh)
+        rendered.append({'query': query, 'vacancies': by_open_vacancies(fresh, lambda vacancy: vacancy.id),
+                         'repeated': len(vacancies) - len(fresh)})
+    return environment.get_template('email/digest.html').render(
+        sections=rendered, top_skills=top_skills(session, list(shown)))
+
+
+def send_digests(session, now=None):
+    """Сводные письма о новых вакансиях, накопленных сбором (database/digests.py), с commit.
+
+    Вакансии всех запросов с одним адресом попадают в одно письмо с разделом на каждый запрос.
+    Вакансии всех получателей загружаются одним набором запросов, письма ставятся в очередь
+    email_outbox. Возвращает число писем.
+    """
+    items = pending_digest_items(session)
+    if not items:
+        return 0
+    vacancy_ids = list({item.vacancy_id for item in items})
+    vacancies = {vacancy.id: vacancy for vacancy in load_digest_vacancies(session, Vacancy.id.in_(vacancy_ids))}
+    recipients = {}
+    for item in items:
+        recipient = recipients.setdefault(item.email.strip().casefold(), {'email': item.email.strip(), 'queries': {}})
+        query = recipient['queries'].setdefault(item.search_query_id, (item.query, []))
+        if item.vacancy_id in vacancies:
+            query[1].append(vacancies[item.vacancy_id])
+    for recipient in recipients.values():
+        sections = [recipient['queries'][query_id] for query_id in sorted(recipient['queries'])]
+        queries = ', '.join(dict.fromkeys(query for query, _ in sections))
+        subject = ("Новые вакансии по запросу: " if len(sections) == 1 else "Новые вакансии по запросам: ") + queries
+        enqueue_email(session, subject[:255], create_digest_body(session, sections), recipient['email'])
+    mark_digested(session, [(item.search_query_id, item.vacancy_id) for item in items], now)
+    session.commit()
+    return len(recipients)
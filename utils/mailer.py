@@ -0,0 +1,74 @@
+import logging
+import os
+import smtplib
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+
+def build_message(subject, body, recipient_email, sender=None):
+    """HTML-письмо для отправки любым транспортом."""
+    message = MIMEMultipart()
+    message['to'] = recipient_email
+    message['from'] = sender or os.getenv('EMAIL_HOST_USER') or ''
+    message['subject'] = subject
+    message.attach(MIMEText(body, 'html'))
+    return message
+
+
+class FileTransport:
+    """Запись писем файлами .eml в каталог вместо отправки: для тестов и локальной разработки."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._count = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, subject, body, recipient_email):
+        with self._lock:
+            self._count += 1
+            path = os.path.join(self.directory, f'{time.time_ns()}-{self._count}.eml')
+        with open(path, 'wb') as message_file:
+            message_file.write(build_message(subject, body, recipient_email).as_bytes())
+        logging.info(f"Email to {recipient_email} written to {path}")
+
+
+class SmtpTransport:
+    """Отправка через SMTP с одним соединением на все письма, разорванное соединение открывается заново."""
+
+    def __init__(self, host, port=25, user=None, password=None, use_tls=False):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_tls = use_tls
+        self._smtp = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.use_tls:
+            smtp.starttls()
+        if self.user:
+            smtp.login(self.user, self.password)
+        return smtp
+
+    def send(self, subject, body, recipient_email):
+        message = build_message(subject, body, recipient_email, sender=self.user)
+        with self._lock:
+            if self._smtp is None:
+                self._smtp = self._connect()
+            try:
+                self._smtp.send_message(message)
+            except smtplib.SMTPServerDisconnected:
+                self._smtp = self._connect()
+                self._smtp.send_message(message)
+        logging.info(f"Email sent successfully to {recipient_email}")
+
+    def close(self):
+        with self._lock:
+            if self._smtp is not None:
+                self._smtp.quit()
+                self._smtp = None
@@ -0,0 +1,172 @@
+import functools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from flask import current_app, make_response, request
+
+API_CACHE_PATH = os.getenv('API_CACHE_PATH', 'cache/api_response_cache.sqlite3')
+# Данные меняются сбором раз в сутки: после TTL ответ отдается из кэша и пересчитывается в фоне
+API_CACHE_TTL = int(os.getenv('API_CACHE_TTL', str(6 * 3600)))
+# Версии данных запросов перечитываются из базы не чаще раза в N секунд
+API_VERSION_CHECK_INTERVAL = int(os.getenv('API_VERSION_CHECK_INTERVAL', '30'))
+API_CACHE_MAX_MB = int(os.getenv('API_CACHE_MAX_MB', '64'))  # Предельный размер кэша на диске
+
+EVICTION_CHECK_INTERVAL = 100  # Проверка размера кэша раз в N записей
+
+
+class ResponseCache:
+    """Кэш ответов API в SQLite, общий для всех процессов веб-приложения.
+
+    Ключ — endpoint и search_query_id: эндпоинты не читают параметры строки запроса, поэтому
+    они не дробят кэш. Каждая запись хранит версию данных
+    запроса (query_data_versions), при которой она посчитана: сбор увеличивает версию
+    в транзакции с данными, и записи прошлой версии пересчитываются при следующем обращении.
+    Запись старше ttl при неизменной версии отдается сразу и пересчитывается в фоне
+    (stale-while-revalidate). При превышении max_bytes вытесняются давно не читавшиеся записи (LRU).
+
+    version_loader() возвращает {search_query_id: версия} для всех запросов. Ответы запросов,
+    которых нет в результате (данные еще не готовы), не кэшируются.
+    """
+
+    def __init__(self, version_loader, path=API_CACHE_PATH, ttl=API_CACHE_TTL,
+                 version_interval=API_VERSION_CHECK_INTERVAL, max_bytes=API_CACHE_MAX_MB * 1024 * 1024):
+        self.version_loader = version_loader
+        self.path = path
+        self.ttl = ttl
+        self.version_interval = version_interval
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+        self._versions = {}
+        self._versions_loaded_at = None
+        self._refreshing = set()
+        self._stores = 0
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        # Соединение открывается в каждом процессе заново: процессы веб-сервера создаются fork
+        if self._conn is None or self._pid != os.getpid():
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS api_responses (
+                    key TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    status INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    stored_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute('CREATE INDEX IF NOT EXISTS ix_api_responses_accessed_at ON api_responses (accessed_at)')
+            self._pid = os.getpid()
+        return self._conn
+
+    def version(self, search_query_id):
+        with self._lock:
+            now = time.monotonic()
+            if self._versions_loaded_at is None or now - self._versions_loaded_at >= self.version_interval:
+                self._versions = self.version_loader()
+                self._versions_loaded_at = now
+            return self._versions.get(search_query_id)
+
+    def lookup(self, key):
+        """(версия, статус, тело, время записи) или None."""
+        with self._lock:
+            conn = self._connection()
+            entry = conn.execute(
+                'SELECT version, status, payload, stored_at FROM api_responses WHERE key = ?', (key,)).fetchone()
+            if entry is not None:
+                conn.execute('UPDATE api_responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+            return entry
+
+    def store(self, key, version, status, payload):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO api_responses (key, version, status, payload, size, stored_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', (key, version, status, payload, len(payload.encode()), now, now))
+            self._stores += 1
+            if self._stores % EVICTION_CHECK_INTERVAL == 0:
+                self._evict(conn)
+
+    def _evict(self, conn):
+        """Удаление наименее востребованных записей, пока кэш не уложится в max_bytes."""
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM api_responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        evicted = 0
+        for key, size in conn.execute('SELECT key, size FROM api_responses ORDER BY accessed_at').fetchall():
+            conn.execute('DELETE FROM api_responses WHERE key = ?', (key,))
+            excess -= size
+            evicted += 1
+            if excess <= 0:
+                break
+        logging.info(f"API cache evicted {evicted} entries")
+
+    @staticmethod
+    def key(search_query_id):
+        return f'{request.endpoint}:{search_query_id}'
+
+    def cached(self, view):
+        """Декоратор маршрута с параметром search_query_id."""
+
+        @functools.wraps(view)
+        def wrapper(search_query_id, **kwargs):
+            key = self.key(search_query_id)
+            version = self.version(search_query_id)
+            if version is None:
+                self.misses += 1
+                return make_response(view(search_query_id, **kwargs))
+            entry = self.lookup(key)
+            if entry is not None and entry[0] == version:
+                if time.time() - entry[3] < self.ttl:
+                    self.hits += 1
+                else:
+                    self.stale += 1
+                    self._revalidate(key, version, view, search_query_id, kwargs)
+                return current_app.response_class(entry[2], status=entry[1], mimetype='application/json')
+            self.misses += 1
+            return self._render(key, version, view, search_query_id, kwargs)
+
+        return wrapper
+
+    def _render(self, key, version, view, search_query_id, kwargs):
+        response = make_response(view(search_query_id, **kwargs))
+        if response.status_code == 200:
+            self.store(key, version, response.status_code, response.get_data(as_text=True))
+        return response
+
+    def _revalidate(self, key, version, view, search_query_id, kwargs):
+        """Пересчет устаревшей записи в фоновом потоке, не больше одного пересчета ключа в процессе."""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        app = current_app._get_current_object()
+        path = request.path
+
+        def refresh():
+            try:
+                with app.test_request_context(path):
+                    self._render(key, version, view, search_query_id, kwargs)
+            except Exception as e:
+                logging.error(f"Background refresh of {key} failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name='api-cache-refresh', daemon=True).start()
+
+    def summary(self):
+        return f"Кэш API: попаданий {self.hits}, устаревших {self.stale}, промахов {self.misses}"
@@ -0,0 +1,93 @@
+import os
+import logging
+from dotenv import load_dotenv
+from database.database import Session
+from database.outbox import enqueue_email
+from database.data_versions import bump_data_versions, queries_of_vacancies
+from database.aggregates import refresh_aggregates
+from database.verification import VERIFY_BATCH_SIZE, due_verifications, record_verification
+from crawler.engine import CrawlEngine, HH_API_URL
+from crawler.governor import RequestGovernor, HH_RATE_LIMIT_MIN
+from crawler.http_cache import HttpCache
+from crawler.rate_limiter import TokenBucket
+
+# Разбор очереди проверки вакансий, пропавших из выдачи (таблица vacancy_verifications).
+# Запускается отдельно от job_analytics.py, например по cron после сбора:
+#     python verify_vacancies.py
+
+log_file_path = 'logs/verify_vacancies.log'
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                    handlers=[logging.FileHandler(log_file_path), logging.StreamHandler()])
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+os.chdir(current_dir)
+
+load_dotenv()
+
+# Проверка статусов — фоновая задача: ее квота запросов меньше, чем у сбора новых вакансий
+VERIFY_RATE_LIMIT = float(os.getenv('VERIFY_RATE_LIMIT', '1'))  # Запросов в секунду
+VERIFY_RATE_BURST = int(os.getenv('VERIFY_RATE_BURST', '2'))
+VERIFY_MAX_PER_RUN = int(os.getenv('VERIFY_MAX_PER_RUN', '2000'))  # Проверок за один запуск
+
+
+def drain_queue(session, engine, batch_size=VERIFY_BATCH_SIZE, limit=VERIFY_MAX_PER_RUN):
+    """Проверка вакансий, срок проверки которых наступил, пакетами по batch_size, не больше limit за запуск.
+
+    Каждый пакет проверяется параллельно и записывается одной транзакцией. В search_query_ids
+    отчета — запросы, вакансии которых переведены в архив: их сводки нужно пересчитать.
+    """
+    report = {'checked': 0, 'archived': [], 'active': [], 'gone': [], 'failed': [], 'search_query_ids': set()}
+    while report['checked'] < limit:
+        vacancies = due_verifications(session, min(batch_size, limit - report['checked']))
+        if not vacancies:
+            break
+        vacancy_details, not_found, failed = engine.check_vacancies([vacancy.external_id for vacancy in vacancies])
+        archived, active, gone = record_verification(session, vacancies, vacancy_details, not_found, failed)
+        archived_ids = [vacancy.id for vacancy in vacancies if vacancy.external_id in archived]
+        search_query_ids = queries_of_vacancies(session, archived_ids)
+        bump_data_versions(session, search_query_ids)
+        session.commit()
+        report['search_query_ids'].update(search_query_ids)
+        report['checked'] += len(vacancies)
+        report['archived'].extend(archived)
+        report['active'].extend(active)
+        report['gone'].extend(gone)
+        report['failed'].extend(failed)
+        logging.info(f"Verified {len(vacancies)} vacancies: {len(archived)} archived, {len(active)} active, "
+                     f"{len(not_found)} not found ({len(gone)} gone), {len(failed)} failed")
+    return report
+
+
+def verification_engine():
+    """Движок запросов к HH с квотой проверок VERIFY_RATE_LIMIT."""
+    # Скорость не растет выше квоты: иначе адаптивный регулятор разгонит фоновую задачу до скорости сбора
+    governor = RequestGovernor(TokenBucket(VERIFY_RATE_LIMIT, VERIFY_RATE_BURST),
+                               min_rate=min(HH_RATE_LIMIT_MIN, VERIFY_RATE_LIMIT), max_rate=VERIFY_RATE_LIMIT)
+    return CrawlEngine(HH_API_URL, governor=governor, concurrency=VERIFY_RATE_BURST, cache=HttpCache())
+
+
+def main():
+    engine = verification_engine()
+    with Session() as session:
+        report = drain_queue(session, engine)
+        # Сводки запросов с архивированными вакансиями устарели
+        refresh_aggregates(session, report['search_query_ids'])
+
+        summary = (
+            f"Проверено вакансий: {report['checked']}\n"
+            f"Переведено в архив: {len(report['archived'])}\n"
+            f"Активны: {len(report['active'])}\n"
+            f"Удалены с HH (404): {len(report['gone'])}\n"
+            f"Не удалось проверить: {len(report['failed'])}\n"
+            f"{engine.stats.summary()}\n"
+        )
+        logging.info(summary)
+        if report['gone']:
+            summary += f"ID удаленных вакансий: {', '.join(map(str, report['gone']))}\n"
+        if report['archived'] or report['gone']:
+            enqueue_email(session, "Отчет о проверке вакансий", summary, os.getenv('ADMIN_EMAIL'))
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()